@@ -9,6 +9,7 @@ from typing import Optional
 from fastapi import HTTPException, Header
 from config import config
 from database import db, USERS_FILE
+from metrics import AUTH_VERIFICATIONS
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +20,7 @@ def validate_telegram_data(init_data: str) -> Optional[dict]:
         parsed = parse_qs(init_data)
         received_hash = parsed.get("hash", [""])[0]
         if not received_hash:
+            AUTH_VERIFICATIONS.inc("telegram", "missing_hash")
             return None
         
         data_check_arr = []
@@ -31,13 +33,16 @@ def validate_telegram_data(init_data: str) -> Optional[dict]:
         calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
         
         if calculated_hash != received_hash:
+            AUTH_VERIFICATIONS.inc("telegram", "invalid")
             return None
         
+        AUTH_VERIFICATIONS.inc("telegram", "ok")
         user_data = parsed.get("user", [""])[0]
         if user_data:
             return json.loads(unquote(user_data))
         return None
     except Exception as e:
+        AUTH_VERIFICATIONS.inc("telegram", "error")
         logger.error(f"Telegram data validation error: {e}")
         return None
 
@@ -76,9 +81,11 @@ async def get_current_user(
                 username, password = parts
                 user = db.find_one(USERS_FILE, "username", username)
                 if user and user.get("password") == password and user["status"] == "active":
+                    AUTH_VERIFICATIONS.inc("browser", "ok")
                     return user
         except Exception as e:
             logger.error(f"Browser token error: {e}")
+        AUTH_VERIFICATIONS.inc("browser", "invalid")
         raise HTTPException(status_code=401, detail="Invalid browser token")
     
     # Telegram WebApp auth
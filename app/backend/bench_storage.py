@@ -0,0 +1,286 @@
+"""Storage micro-benchmarks on synthetic, deterministic DATA_DIRs.
+
+Usage (from app/backend):
+    python bench_storage.py --sizes 5x5,10x10,20x20
+    python bench_storage.py --compare bench_results/old.json bench_results/new.json
+    python bench_storage.py --sizes 20x20 --memory    # bytes per record, dict vs records.py
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from database import db, USERS_FILE, SESSIONS_FILE, LOCATIONS_FILE, REPORTS_FILE, SETTINGS_FILE
+import records
+import serialization
+import services
+
+OFFICE = (41.311081, 69.240562)
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+
+def generate_data_dir(path: Path, users: int, days: int, minutes_per_day: int = 480, seed: int = 42) -> Dict:
+    """Write a realistic DATA_DIR: `users` employees, `days` past days of per-minute pings, plus today."""
+    rng = random.Random(seed)
+    path.mkdir(parents=True, exist_ok=True)
+
+    def uid() -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    user_rows, session_rows, location_rows, report_rows = [], [], [], []
+
+    for n in range(users):
+        telegram_id = 100000 + n
+        user_rows.append({
+            "telegram_id": telegram_id,
+            "username": f"user{n}",
+            "first_name": f"Xodim {n}",
+            "last_name": "",
+            "status": "active",
+            "password": f"{rng.randint(0, 99999):05d}",
+            "auth_type": "telegram",
+            "created_at": (today - timedelta(days=days + 1)).isoformat(),
+            "updated_at": (today - timedelta(days=days + 1)).isoformat()
+        })
+
+        for d in range(days, -1, -1):
+            day = today - timedelta(days=d)
+            start = day + timedelta(hours=9, minutes=rng.randint(-15, 30))
+            # Today's session is left open with a single ping
+            pings = minutes_per_day if d else 1
+            session_id = uid()
+            office_minutes = 0
+            for m in range(pings):
+                inside = rng.random() < 0.85
+                office_minutes += inside
+                offset = 0.0002 if inside else 0.01
+                location_rows.append({
+                    "id": uid(),
+                    "user_id": telegram_id,
+                    "session_id": session_id,
+                    "latitude": OFFICE[0] + rng.uniform(-offset, offset),
+                    "longitude": OFFICE[1] + rng.uniform(-offset, offset),
+                    "is_inside_office": inside,
+                    "timestamp": (start + timedelta(minutes=m)).isoformat()
+                })
+            late = max(0, int((start - (day + timedelta(hours=9))).total_seconds() // 60))
+            session_rows.append({
+                "id": session_id,
+                "user_id": telegram_id,
+                "date": day.strftime("%Y-%m-%d"),
+                "start_time": start.strftime("%H:%M"),
+                "end_time": (start + timedelta(minutes=pings)).strftime("%H:%M") if d else None,
+                "status": "offline" if d else "online",
+                "total_online_minutes": pings,
+                "total_office_minutes": office_minutes,
+                "late_arrival_minutes": late,
+                "early_leave_minutes": 0,
+                "created_at": start.isoformat()
+            })
+            if d and rng.random() < 0.9:
+                report_rows.append({
+                    "id": uid(),
+                    "user_id": telegram_id,
+                    "date": day.strftime("%Y-%m-%d"),
+                    "content": " ".join(rng.choice(("vazifa", "hisobot", "mijoz", "loyiha", "uchrashuv"))
+                                        for _ in range(rng.randint(10, 60))),
+                    "submitted_at": (start + timedelta(hours=8)).isoformat()
+                })
+
+    settings = {
+        # Always "work hours" so record_location is measured at any time of day
+        "work_start": "00:00",
+        "work_end": "23:59",
+        "lunch_start": "13:00",
+        "lunch_end": "14:00",
+        "geofence": {"center_lat": OFFICE[0], "center_lng": OFFICE[1], "radius_meters": 100}
+    }
+    for filename, rows in (
+        (USERS_FILE, user_rows), (SESSIONS_FILE, session_rows),
+        (LOCATIONS_FILE, location_rows), (REPORTS_FILE, report_rows), (SETTINGS_FILE, settings)
+    ):
+        with open(path / filename, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+    return {
+        "users": len(user_rows),
+        "sessions": len(session_rows),
+        "locations": len(location_rows),
+        "reports": len(report_rows)
+    }
+
+
+def measure(fn: Callable[[], object], repeats: int) -> Dict:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "repeats": repeats,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3)
+    }
+
+
+def _traced_bytes(build: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        kept = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del kept
+    return current
+
+
+def measure_memory(workdir: Path) -> Dict:
+    """Retained bytes per record when a collection is held as dicts vs slotted records."""
+    result = {}
+    for filename, cls in (
+        (USERS_FILE, records.User), (SESSIONS_FILE, records.Session),
+        (LOCATIONS_FILE, records.Location), (REPORTS_FILE, records.Report)
+    ):
+        raw = (workdir / filename).read_bytes()
+        count = len(serialization.decode(raw)) or 1
+        dict_bytes = _traced_bytes(lambda: serialization.decode(raw))
+        record_bytes = _traced_bytes(lambda: records.from_dicts(cls, serialization.decode(raw)))
+        result[filename] = {
+            "records": count,
+            "dict_bytes_per_record": round(dict_bytes / count, 1),
+            "record_bytes_per_record": round(record_bytes / count, 1),
+            "ratio": round(record_bytes / dict_bytes, 3) if dict_bytes else None
+        }
+    return result
+
+
+def run_size(users: int, days: int, minutes_per_day: int, repeats: int, memory: bool = False) -> Dict:
+    workdir = Path(tempfile.mkdtemp(prefix="bench-data-"))
+    try:
+        counts = generate_data_dir(workdir, users, days, minutes_per_day)
+        db.data_dir = workdir
+
+        user_id = 100000 + users - 1
+        today = datetime.now().strftime("%Y-%m-%d")
+        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        session = services.get_today_session(user_id)
+        past_session_id = db.find_many(SESSIONS_FILE, {"user_id": user_id})[0]["id"]
+
+        ops = {
+            "read_users": lambda: db.read(USERS_FILE),
+            "read_sessions": lambda: db.read(SESSIONS_FILE),
+            "read_locations": lambda: db.read(LOCATIONS_FILE),
+            "append_location": lambda: db.append(LOCATIONS_FILE, {
+                "id": str(uuid.uuid4()), "user_id": user_id, "session_id": session["id"],
+                "latitude": OFFICE[0], "longitude": OFFICE[1], "is_inside_office": True,
+                "timestamp": datetime.now().isoformat()
+            }),
+            "update_session": lambda: db.update(SESSIONS_FILE, "id", session["id"], {"status": "online"}),
+            "find_one_user": lambda: db.find_one(USERS_FILE, "telegram_id", user_id),
+            "find_many_session_locations": lambda: db.find_many(LOCATIONS_FILE, {"session_id": past_session_id}),
+            "record_location": lambda: services.record_location(user_id, session["id"], *OFFICE),
+            "get_user_statistics": lambda: services.get_user_statistics(user_id, start_date, today),
+            "get_chart_data": lambda: services.get_chart_data(user_id, start_date, today)
+        }
+        results = {name: measure(fn, repeats) for name, fn in ops.items()}
+        file_sizes = {p.name: p.stat().st_size for p in sorted(workdir.glob("*.json"))}
+        result = {"counts": counts, "file_bytes": file_sizes, "ops": results}
+        if memory:
+            result["memory"] = measure_memory(workdir)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{'size':<10} {'op':<30} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for size, result in new["results"].items():
+        before = old["results"].get(size)
+        if not before:
+            continue
+        for op, stats in result["ops"].items():
+            if op not in before["ops"]:
+                continue
+            a, b = before["ops"][op]["median_ms"], stats["median_ms"]
+            ratio = b / a if a else float("inf")
+            print(f"{size:<10} {op:<30} {a:>10.3f} {b:>10.3f} {ratio:>6.2f}x")
+
+
+def parse_sizes(value: str) -> List[tuple]:
+    return [tuple(int(x) for x in size.split("x")) for size in value.split(",") if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JsonDB / services micro-benchmarks")
+    parser.add_argument("--sizes", default="5x5,10x10,20x20", help="USERSxDAYS list, comma separated")
+    parser.add_argument("--minutes-per-day", type=int, default=480, help="Location pings per user per day")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--memory", action="store_true", help="Also measure memory per record (dict vs records.py)")
+    parser.add_argument("--output", help="Result JSON path (default: bench_results/storage-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": datetime.now().isoformat(),
+            "minutes_per_day": args.minutes_per_day,
+            "repeats": args.repeats
+        },
+        "results": {}
+    }
+    for users, days in parse_sizes(args.sizes):
+        label = f"{users}x{days}"
+        print(f"Running {label} ...", flush=True)
+        result = run_size(users, days, args.minutes_per_day, args.repeats, args.memory)
+        report["results"][label] = result
+        for op, stats in result["ops"].items():
+            print(f"  {op:<30} median {stats['median_ms']:>10.3f} ms  p95 {stats['p95_ms']:>10.3f} ms")
+        for filename, mem in result.get("memory", {}).items():
+            print(f"  {filename:<30} dict {mem['dict_bytes_per_record']:>8.1f} B  "
+                  f"record {mem['record_bytes_per_record']:>8.1f} B  ({mem['records']} records)")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"storage-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
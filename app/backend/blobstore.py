@@ -0,0 +1,98 @@
+"""Content-addressed blob store for report bodies.
+
+Report metadata stays in reports.json; the body is stored once per distinct
+text as DATA_DIR/blobs/<aa>/<sha256>, and the report keeps `content_hash` and
+`content_length`. Blobs never change, so they are cached without validation
+and written with an atomic rename only if missing, which is safe for several
+workers sharing DATA_DIR.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+from database import db
+from metrics import cache_hit, cache_miss
+
+BLOBS_DIR = "blobs"
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class BlobStore:
+    def __init__(self, root: Path, max_cached: int = 1024):
+        self.root = Path(root)
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def _remember(self, digest: str, content: str) -> None:
+        with self._lock:
+            self._cache[digest] = content
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def put(self, content: str) -> str:
+        """Store `content` (if not already stored) and return its hash."""
+        digest = content_hash(content)
+        path = self._path(digest)
+        try:
+            # Fresh mtime, so collect() can't delete an orphan that is about to be referenced again
+            os.utime(path)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+            temp_path.write_bytes(content.encode("utf-8"))
+            temp_path.replace(path)
+        self._remember(digest, content)
+        return digest
+
+    def get(self, digest: Optional[str]) -> Optional[str]:
+        if not digest:
+            return None
+        with self._lock:
+            content = self._cache.get(digest)
+            if content is not None:
+                self._cache.move_to_end(digest)
+        if content is not None:
+            cache_hit("report_blob")
+            return content
+        cache_miss("report_blob")
+        try:
+            content = self._path(digest).read_bytes().decode("utf-8")
+        except FileNotFoundError:
+            return None
+        self._remember(digest, content)
+        return content
+
+    def collect(self, referenced: Iterable[str], min_age_seconds: float = 3600) -> int:
+        """Delete blobs no report points to; recent ones are kept for in-flight writes."""
+        referenced = set(referenced)
+        cutoff = time.time() - min_age_seconds
+        removed = 0
+        for path in self.root.glob("*/*"):
+            stale_tmp = path.suffix == ".tmp"
+            if (stale_tmp or path.name not in referenced) and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                with self._lock:
+                    self._cache.pop(path.name, None)
+                removed += 1
+        return removed
+
+
+blobs = BlobStore(db.data_dir / BLOBS_DIR)
+
+
+def report_content(report) -> Optional[str]:
+    """Body of a report; reports from before the blob store carry it inline."""
+    if "content_hash" in report:
+        return blobs.get(report["content_hash"])
+    return report.get("content")
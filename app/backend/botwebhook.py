@@ -0,0 +1,253 @@
+"""Telegram bot in webhook mode, served by this app.
+
+With BOT_WEBHOOK_ENABLED=true the bot (../../bot, or BOT_DIR) is loaded into
+the API process instead of running `bot/main.py` with polling. Telegram posts
+updates to POST /telegram/webhook; the route checks the secret token, puts the
+update on the bot's update queue and returns at once, the bot's own update
+processor runs the handlers.
+
+The bot's storage calls go to this process's `db` (through `SharedDB`), so the
+bot and the API share one set of file locks, caches and indexes.
+
+BOT_WEBHOOK_SECRET is required. If Telegram can't be reached at startup the
+API starts anyway: the route answers 503 (Telegram redelivers) while the bot
+keeps retrying in the background. With BOT_WEBHOOK_OFFLINE=true Bot API calls
+are answered locally by `OfflineRequest` and logged, nothing is sent.
+
+Recorded updates can be replayed against a running server:
+    python botwebhook.py updates.json --url http://localhost:8000 --secret ...
+"""
+import argparse
+import asyncio
+import hmac
+import importlib
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from config import config
+from database import db
+
+# Only needed in webhook mode (pip install -r ../../bot/requirements.txt)
+try:
+    from telegram import Update
+    from telegram.error import TelegramError
+    from telegram.request import BaseRequest
+except ImportError:
+    Update = TelegramError = None
+    BaseRequest = object
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Background retries while Telegram is unreachable: 10 s doubling up to 5 min
+RETRY_SECONDS = 10
+MAX_RETRY_SECONDS = 300
+
+
+class SharedDB:
+    """The bot's async storage interface on top of the backend's `db`."""
+
+    def __init__(self, db):
+        self.db = db
+        self.data_dir = db.data_dir
+
+    async def read(self, filename: str) -> List[Dict]:
+        return await asyncio.to_thread(self.db.read, filename)
+
+    async def write(self, filename: str, data: List[Dict]) -> bool:
+        return await asyncio.to_thread(self.db.write, filename, data)
+
+    async def append(self, filename: str, item: Dict) -> bool:
+        return await asyncio.to_thread(self.db.append, filename, item)
+
+    async def find_one(self, filename: str, key: str, value: Any) -> Optional[Dict]:
+        return await asyncio.to_thread(self.db.find_one, filename, key, value)
+
+    async def update(self, filename: str, key: str, value: Any, updates: Dict) -> bool:
+        return await asyncio.to_thread(self.db.update, filename, key, value, updates)
+
+    async def update_many(self, filename: str, changes: List[Dict]) -> Optional[List[Optional[Dict]]]:
+        return await asyncio.to_thread(self.db.update_many, filename, changes)
+
+    async def find_many(self, filename: str, filters: Dict) -> List[Dict]:
+        return await asyncio.to_thread(self.db.find_many, filename, filters)
+
+    async def count(self, filename: str, filters: Optional[Dict] = None) -> int:
+        if filters is None:
+            return len(await self.read(filename))
+        return len(await self.find_many(filename, filters))
+
+
+class OfflineRequest(BaseRequest):
+    """Bot API transport that answers locally and records the calls instead of sending them."""
+
+    def __init__(self):
+        self.calls: List[Tuple[str, Dict]] = []
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    def _result(self, method: str, params: Dict) -> Any:
+        if method == "getMe":
+            bot_id = config.BOT_TOKEN.split(":", 1)[0]
+            return {"id": int(bot_id) if bot_id.isdigit() else 1, "is_bot": True,
+                    "first_name": "Offline", "username": "offline_bot"}
+        if (method.startswith("send") or method.startswith("edit")) and "chat_id" in params:
+            self._message_id += 1
+            return {"message_id": params.get("message_id", self._message_id), "date": int(time.time()),
+                    "chat": {"id": params["chat_id"], "type": "private"}, "text": params.get("text", "")}
+        return True
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls.append((api_method, params))
+        if api_method != "getMe":
+            logger.info(f"Offline bot: {api_method} {params}")
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+
+def load_bot(bot_dir: Path, request=None):
+    """Import the bot's main module and return its Application.
+
+    The bot uses flat imports (`from config import config`, `from database
+    import db`) whose names clash with this app's modules, so they are imported
+    with bot_dir first on sys.path and this app's modules moved out of
+    sys.modules meanwhile; the bot's modules stay referenced by each other only.
+    """
+    names = {path.stem for path in bot_dir.glob("*.py")}
+    saved = {name: sys.modules.pop(name) for name in names if name in sys.modules}
+    sys.path.insert(0, str(bot_dir))
+    try:
+        bot_database = importlib.import_module("database")
+        bot_database.db = SharedDB(db)
+        bot_database.users = bot_database.UserCache(bot_database.db, max_entries=bot_database.config.USER_CACHE_SIZE)
+        bot_main = importlib.import_module("main")
+        return bot_main.build_application(request)
+    finally:
+        sys.path.remove(str(bot_dir))
+        for name in names:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+
+
+class BotWebhook:
+    def __init__(self):
+        # Loaded at startup; `application` is set once it is initialized and running
+        self.loaded = None
+        self.application = None
+        self.request: Optional[OfflineRequest] = None
+        self._retry_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.application is not None
+
+    async def start(self) -> None:
+        if not config.BOT_WEBHOOK_SECRET:
+            raise RuntimeError("BOT_WEBHOOK_SECRET is required when BOT_WEBHOOK_ENABLED=true")
+        if Update is None:
+            raise RuntimeError("Webhook mode needs python-telegram-bot: pip install -r ../../bot/requirements.txt")
+        bot_dir = Path(config.BOT_DIR) if config.BOT_DIR else Path(__file__).resolve().parents[2] / "bot"
+        self.request = OfflineRequest() if config.BOT_WEBHOOK_OFFLINE else None
+        self.loaded = load_bot(bot_dir, self.request)
+        if not await self._start_application():
+            self._retry_task = asyncio.create_task(self._retry())
+
+    async def _start_application(self) -> bool:
+        application = self.loaded
+        try:
+            # Same order as run_polling: initialize, post_init, start
+            await application.initialize()
+        except TelegramError as e:
+            logger.error(f"Bot webhook: Telegram not reachable ({e}), retrying in the background")
+            return False
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        if config.BOT_WEBHOOK_URL and not config.BOT_WEBHOOK_OFFLINE:
+            url = config.BOT_WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+            try:
+                await application.bot.set_webhook(url, secret_token=config.BOT_WEBHOOK_SECRET,
+                                                  allowed_updates=Update.ALL_TYPES)
+                logger.info(f"Bot webhook set to {url}")
+            except TelegramError as e:
+                logger.error(f"Bot webhook: setWebhook failed ({e}); updates arrive only if it was set before")
+        self.application = application
+        return True
+
+    async def _retry(self) -> None:
+        delay = RETRY_SECONDS
+        while True:
+            await asyncio.sleep(delay)
+            if await self._start_application():
+                return
+            delay = min(delay * 2, MAX_RETRY_SECONDS)
+
+    async def stop(self) -> None:
+        if self._retry_task is not None:
+            self._retry_task.cancel()
+            try:
+                await self._retry_task
+            except asyncio.CancelledError:
+                pass
+            self._retry_task = None
+        application, self.application, self.loaded = self.application, None, None
+        if application is None:
+            return
+        await application.stop()
+        await application.shutdown()
+
+    def check_secret(self, token: Optional[str]) -> bool:
+        secret = config.BOT_WEBHOOK_SECRET
+        return bool(secret) and hmac.compare_digest((token or "").encode(), secret.encode())
+
+    async def enqueue(self, data: Dict) -> None:
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+
+
+bot_webhook = BotWebhook()
+
+
+def _load_updates(path: Path) -> List[Dict]:
+    """A JSON list of updates, a getUpdates response, or one update per line."""
+    text = path.read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        return data["result"] if "result" in data else [data]
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post recorded Telegram updates to the webhook route")
+    parser.add_argument("file", help="Updates as JSON (list, getUpdates response) or JSON lines")
+    parser.add_argument("--url", default=f"http://localhost:{config.API_PORT}")
+    parser.add_argument("--secret", default=config.BOT_WEBHOOK_SECRET)
+    args = parser.parse_args()
+
+    headers = {SECRET_HEADER: args.secret} if args.secret else {}
+    with httpx.Client(base_url=args.url) as client:
+        for update in _load_updates(Path(args.file)):
+            response = client.post(WEBHOOK_PATH, json=update, headers=headers)
+            print(f"{update.get('update_id')}: {response.status_code}")
+
+
+if __name__ == "__main__":
+    main()
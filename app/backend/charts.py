@@ -0,0 +1,128 @@
+"""Chart bucketing: day/week/month buckets over a date range, with a result cache.
+
+Dates are handled as ordinals. For each (start, end, granularity) the bucket
+labels and a day-offset -> bucket index table are built once and reused, so
+aggregating sessions is one table lookup per session (numpy bincount when
+numpy is installed).
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+from metrics import cache_hit, cache_miss
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+AUTO = "auto"
+GRANULARITIES = (DAY, WEEK, MONTH, AUTO)
+
+# Longest range still shown per day / per week when granularity is auto
+AUTO_DAY_MAX_DAYS = 62
+AUTO_WEEK_MAX_DAYS = 366
+
+
+def resolve_granularity(granularity: str, days: int) -> str:
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    if granularity != AUTO:
+        return granularity
+    if days <= AUTO_DAY_MAX_DAYS:
+        return DAY
+    if days <= AUTO_WEEK_MAX_DAYS:
+        return WEEK
+    return MONTH
+
+
+@lru_cache(maxsize=256)
+def bucket_table(start_ord: int, end_ord: int, granularity: str) -> Tuple[Tuple[str, ...], Tuple[int, ...]]:
+    """Labels per bucket, and the bucket index of every day in the range."""
+    labels: List[str] = []
+    index: List[int] = []
+    last_key = None
+    for ordinal in range(start_ord, end_ord + 1):
+        day = date.fromordinal(ordinal)
+        if granularity == DAY:
+            key = label = day.isoformat()
+        elif granularity == WEEK:
+            year, week, _ = day.isocalendar()
+            key = (year, week)
+            label = f"{year}-W{week:02d}"
+        else:
+            key = (day.year, day.month)
+            label = f"{day.year}-{day.month:02d}"
+        if key != last_key:
+            labels.append(label)
+            last_key = key
+        index.append(len(labels) - 1)
+    return tuple(labels), tuple(index)
+
+
+def bucket_sums(index: Sequence[int], buckets: int, offsets: List[int], values: List[int]) -> List[int]:
+    """Sum `values` into buckets, where offsets are day offsets from the range start."""
+    if numpy is not None and offsets:
+        idx = numpy.asarray(index, dtype=numpy.intp)[numpy.asarray(offsets, dtype=numpy.intp)]
+        sums = numpy.bincount(idx, weights=numpy.asarray(values, dtype=numpy.float64), minlength=buckets)
+        return [int(round(v)) for v in sums.tolist()]
+    sums = [0] * buckets
+    for offset, value in zip(offsets, values):
+        sums[index[offset]] += value
+    return sums
+
+
+class ChartCache:
+    """LRU of chart results, each stamped with the data version it was built from."""
+
+    def __init__(self, name: str, max_entries: int = 512):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, version: Hashable, build: Callable[[], Dict]) -> Dict:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                cache_hit(self.name)
+                return entry[1]
+        cache_miss(self.name)
+        result = build()
+        with self._lock:
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def export_state(self, version: Hashable) -> List[Tuple[Hashable, Dict]]:
+        """Entries built from `version` of the data, oldest first."""
+        with self._lock:
+            return [(key, result) for key, (v, result) in self._entries.items() if v == version]
+
+    def load_state(self, entries: List[Tuple[Hashable, Dict]], version: Hashable) -> None:
+        with self._lock:
+            for key, result in entries:
+                self._entries[key] = (version, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+chart_cache = ChartCache("chart")
+
+
+def date_ordinal(value: str) -> Optional[int]:
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return None
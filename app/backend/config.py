@@ -15,11 +15,53 @@ class Config:
     API_PORT: int = field(default_factory=lambda: int(os.getenv("API_PORT", "8000")))
     DATA_DIR: str = field(default_factory=lambda: os.getenv("DATA_DIR", "data"))
     FRONTEND_URL: str = field(default_factory=lambda: os.getenv("FRONTEND_URL", "*"))
+    SCHEDULER_ENABLED: bool = field(default_factory=lambda: os.getenv("SCHEDULER_ENABLED", "true").lower() == "true")
+    AUTO_CLOSE_GRACE_MINUTES: int = field(default_factory=lambda: int(os.getenv("AUTO_CLOSE_GRACE_MINUTES", "30")))
+    # How often to look for sessions past their shift end (+ grace), and when to compact ("HH:MM")
+    AUTO_CLOSE_CHECK_MINUTES: int = field(default_factory=lambda: int(os.getenv("AUTO_CLOSE_CHECK_MINUTES", "10")))
+    COMPACT_STORAGE_AT: str = field(default_factory=lambda: os.getenv("COMPACT_STORAGE_AT", "03:00"))
+    STORAGE_FORMAT: str = field(default_factory=lambda: os.getenv("STORAGE_FORMAT", "json-compact"))
+    STORAGE_MSGPACK_FILES: List[str] = field(default_factory=list)
+    METRICS_TOKEN: str = field(default_factory=lambda: os.getenv("METRICS_TOKEN", ""))
+    # Without METRICS_TOKEN /metrics answers only localhost, unless this is set
+    METRICS_PUBLIC: bool = field(default_factory=lambda: os.getenv("METRICS_PUBLIC", "false").lower() == "true")
+    PROFILING_ENABLED: bool = field(default_factory=lambda: os.getenv("PROFILING_ENABLED", "false").lower() == "true")
+    PROFILING_SAMPLE_RATE: float = field(default_factory=lambda: float(os.getenv("PROFILING_SAMPLE_RATE", "0")))
+    PROFILING_BUFFER_SIZE: int = field(default_factory=lambda: int(os.getenv("PROFILING_BUFFER_SIZE", "50")))
+    PROFILING_TOP_N: int = field(default_factory=lambda: int(os.getenv("PROFILING_TOP_N", "40")))
+    SLOW_LOCK_MS: float = field(default_factory=lambda: float(os.getenv("SLOW_LOCK_MS", "0")))
+    # Unix socket of storage_server.py; empty = this process reads/writes DATA_DIR itself
+    STORAGE_SOCKET: str = field(default_factory=lambda: os.getenv("STORAGE_SOCKET", ""))
+    STORAGE_POOL_SIZE: int = field(default_factory=lambda: int(os.getenv("STORAGE_POOL_SIZE", "8")))
+    STORAGE_FLUSH_MS: float = field(default_factory=lambda: float(os.getenv("STORAGE_FLUSH_MS", "5")))
+    # Location ping interval bounds (seconds) for should-track
+    TRACKING_MIN_INTERVAL: int = field(default_factory=lambda: int(os.getenv("TRACKING_MIN_INTERVAL", "30")))
+    TRACKING_BASE_INTERVAL: int = field(default_factory=lambda: int(os.getenv("TRACKING_BASE_INTERVAL", "60")))
+    TRACKING_MAX_INTERVAL: int = field(default_factory=lambda: int(os.getenv("TRACKING_MAX_INTERVAL", "600")))
+    # Per-user write budgets "N/SECONDS" and the global in-flight write cap
+    RATE_LIMIT_LOCATION: str = field(default_factory=lambda: os.getenv("RATE_LIMIT_LOCATION", "10/60"))
+    RATE_LIMIT_SESSION: str = field(default_factory=lambda: os.getenv("RATE_LIMIT_SESSION", "10/60"))
+    RATE_LIMIT_REPORT: str = field(default_factory=lambda: os.getenv("RATE_LIMIT_REPORT", "5/60"))
+    WRITE_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("WRITE_CONCURRENCY", "16")))
+    SNAPSHOT_INTERVAL_MINUTES: float = field(default_factory=lambda: float(os.getenv("SNAPSHOT_INTERVAL_MINUTES", "10")))
+    # Serve the bot from this app via webhook instead of running bot/main.py with polling
+    BOT_WEBHOOK_ENABLED: bool = field(default_factory=lambda: os.getenv("BOT_WEBHOOK_ENABLED", "false").lower() == "true")
+    # Public base URL registered with Telegram; empty = don't call setWebhook (local testing)
+    BOT_WEBHOOK_URL: str = field(default_factory=lambda: os.getenv("BOT_WEBHOOK_URL", ""))
+    # Required in webhook mode; Telegram sends it in X-Telegram-Bot-Api-Secret-Token
+    BOT_WEBHOOK_SECRET: str = field(default_factory=lambda: os.getenv("BOT_WEBHOOK_SECRET", ""))
+    # Answer Bot API calls locally instead of contacting Telegram (replaying recorded updates)
+    BOT_WEBHOOK_OFFLINE: bool = field(default_factory=lambda: os.getenv("BOT_WEBHOOK_OFFLINE", "false").lower() == "true")
+    BOT_DIR: str = field(default_factory=lambda: os.getenv("BOT_DIR", ""))
+    LOCATION_RETENTION_DAYS: int = field(default_factory=lambda: int(os.getenv("LOCATION_RETENTION_DAYS", "0")))
     
     def __post_init__(self):
         admin_ids_str = os.getenv("ADMIN_IDS", "")
         if admin_ids_str:
             self.ADMIN_IDS = [int(x.strip()) for x in admin_ids_str.split(",") if x.strip()]
+        msgpack_files = os.getenv("STORAGE_MSGPACK_FILES", "")
+        if msgpack_files:
+            self.STORAGE_MSGPACK_FILES = [x.strip() for x in msgpack_files.split(",") if x.strip()]
     
     def is_admin(self, user_id: int) -> bool:
         if user_id is None:
@@ -1,81 +1,149 @@
 """JSON Database for backend."""
-import json
+import os
 import threading
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
 from config import config
+from metrics import DB_BYTES, DB_OP_LATENCY, Gauge, registry, register_file_sizes
+from lockstats import InstrumentedLock
+from storage_client import RemoteDB, Transaction, file_stamp, retry_conflicts
+import lockstats
+import serialization
+
+
+def apply_changes(data: List[Dict], changes: List[Dict]) -> List[Optional[Dict]]:
+    """Apply update_many changes to `data` in place.
+    
+    Each change is {"key", "value", "set", "set_missing", "where"}: the first
+    item whose `key` equals `value` (and whose fields match `where`, if given)
+    gets `set`, and `set_missing` fields only where the item has no truthy
+    value yet. Returns the changed items (None if not found or not matching).
+    """
+    indexes: Dict[str, Dict[Any, Dict]] = {}
+    results: List[Optional[Dict]] = []
+    for change in changes:
+        key = change["key"]
+        index = indexes.get(key)
+        if index is None:
+            index = indexes[key] = {}
+            for item in data:
+                index.setdefault(item.get(key), item)
+        item = index.get(change["value"])
+        where = change.get("where")
+        if item is not None and where and any(item.get(k) != v for k, v in where.items()):
+            # Changed since the caller looked at it: leave it alone
+            item = None
+        if item is not None:
+            item.update(change.get("set") or {})
+            for field_name, value in (change.get("set_missing") or {}).items():
+                if not item.get(field_name):
+                    item[field_name] = value
+        results.append(item)
+    return results
 
 
 class JsonDB:
     """Thread-safe JSON database."""
     
-    _locks: Dict[str, threading.Lock] = {}
+    _locks: Dict[str, InstrumentedLock] = lockstats.registry
     _global_lock = threading.Lock()
     
     def __init__(self):
         self.data_dir = Path(config.DATA_DIR)
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.formats = serialization.FormatPolicy.from_config(config.STORAGE_FORMAT, config.STORAGE_MSGPACK_FILES)
+        self._generations: Dict[str, int] = {}
     
-    def _get_lock(self, filename: str) -> threading.Lock:
+    def _get_lock(self, filename: str) -> InstrumentedLock:
         with self._global_lock:
             if filename not in self._locks:
-                self._locks[filename] = threading.Lock()
+                self._locks[filename] = InstrumentedLock(filename)
             return self._locks[filename]
     
     def _filepath(self, filename: str) -> Path:
         return self.data_dir / filename
     
-    def read(self, filename: str) -> List[Dict]:
+    def _load(self, filename: str, default):
+        with self._get_lock(filename):
+            return self._load_unlocked(filename, default)
+    
+    def _load_unlocked(self, filename: str, default):
         filepath = self._filepath(filename)
-        lock = self._get_lock(filename)
-        with lock:
+        with DB_OP_LATENCY.time("read", filename):
             if not filepath.exists():
-                return []
+                return default
             try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                with open(filepath, "rb") as f:
+                    raw = f.read()
+                DB_BYTES.inc("read", filename, amount=len(raw))
+                return serialization.decode(raw)
             except:
-                return []
+                return default
     
-    def write(self, filename: str, data: List[Dict]) -> bool:
+    def _dump(self, filename: str, data) -> bool:
+        with self._get_lock(filename):
+            return self._dump_unlocked(filename, data)
+    
+    def _dump_unlocked(self, filename: str, data) -> bool:
         filepath = self._filepath(filename)
-        lock = self._get_lock(filename)
-        with lock:
+        with DB_OP_LATENCY.time("write", filename):
             try:
-                with open(filepath, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                raw = serialization.encode(data, self.formats.format_for(filename))
+                # Atomic replace: other processes never see a half-written file
+                temp_path = filepath.with_name(f"{filepath.name}.{os.getpid()}.tmp")
+                with open(temp_path, "wb") as f:
+                    f.write(raw)
+                temp_path.replace(filepath)
+                self._generations[filename] = self._generations.get(filename, 0) + 1
+                DB_BYTES.inc("write", filename, amount=len(raw))
                 return True
             except:
                 return False
     
+    @contextmanager
+    def transaction(self, filenames: Iterable[str]) -> Iterator[Transaction]:
+        """Hold the locks of `filenames`, load each file at most once, write each changed file once.
+        
+        Locks are taken in sorted order, so overlapping transactions can't
+        deadlock. Inside the block use only `tx` for these files (the locks are
+        not reentrant); an exception discards every change.
+        """
+        names = sorted(set(filenames))
+        locks = [self._get_lock(name) for name in names]
+        for lock in locks:
+            lock.acquire()
+        try:
+            tx = Transaction(names, lambda name: self._load_unlocked(name, []))
+            tx.before = {name: self.version(name) for name in names}
+            yield tx
+            tx.ok = all(self._dump_unlocked(name, tx.read(name)) for name in tx.dirty)
+            tx.after = {name: self.version(name) for name in names}
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+    
+    def version(self, filename: str) -> Tuple:
+        """Changes whenever the file is written, by this process or another one."""
+        return (self._generations.get(filename, 0),) + file_stamp(self._filepath(filename))
+    
+    def read(self, filename: str) -> List[Dict]:
+        return self._load(filename, [])
+    
+    def write(self, filename: str, data: List[Dict]) -> bool:
+        return self._dump(filename, data)
+    
     def read_single(self, filename: str) -> Optional[Dict]:
-        filepath = self._filepath(filename)
-        lock = self._get_lock(filename)
-        with lock:
-            if not filepath.exists():
-                return None
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                return None
+        return self._load(filename, None)
     
     def write_single(self, filename: str, data: Dict) -> bool:
-        filepath = self._filepath(filename)
-        lock = self._get_lock(filename)
-        with lock:
-            try:
-                with open(filepath, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                return True
-            except:
-                return False
+        return self._dump(filename, data)
     
     def append(self, filename: str, item: Dict) -> bool:
-        data = self.read(filename)
-        data.append(item)
-        return self.write(filename, data)
+        with DB_OP_LATENCY.time("append", filename), self.transaction([filename]) as tx:
+            tx.append(filename, item)
+        return tx.ok
     
     def find_one(self, filename: str, key: str, value: Any) -> Optional[Dict]:
         data = self.read(filename)
@@ -85,19 +153,30 @@ class JsonDB:
         return None
     
     def update(self, filename: str, key: str, value: Any, updates: Dict) -> bool:
-        data = self.read(filename)
-        for item in data:
-            if item.get(key) == value:
-                item.update(updates)
-                return self.write(filename, data)
-        return False
+        with DB_OP_LATENCY.time("update", filename), self.transaction([filename]) as tx:
+            if not tx.update(filename, key, value, updates):
+                return False
+        return tx.ok
+    
+    def update_many(self, filename: str, changes: List[Dict]) -> Optional[List[Optional[Dict]]]:
+        """Several updates with one read and one write (see apply_changes); None if the write failed."""
+        with DB_OP_LATENCY.time("update_many", filename), self.transaction([filename]) as tx:
+            data = tx.read(filename)
+            results = apply_changes(data, changes)
+            if not any(item is not None for item in results):
+                return results
+            tx.write(filename, data)
+        return results if tx.ok else None
     
     def find_many(self, filename: str, filters: Dict) -> List[Dict]:
         data = self.read(filename)
         return [item for item in data if all(item.get(k) == v for k, v in filters.items())]
 
 
-db = JsonDB()
+db = RemoteDB(config.STORAGE_SOCKET, config.STORAGE_POOL_SIZE) if config.STORAGE_SOCKET else JsonDB()
+register_file_sizes(lambda: db.data_dir)
+registry.register(Gauge("jsondb_lock_queue_depth", "Threads waiting for a JsonDB file lock", ("file",),
+                        callback=lockstats.queue_depths))
 
 # File names
 USERS_FILE = "users.json"
@@ -105,6 +184,8 @@ SESSIONS_FILE = "sessions.json"
 LOCATIONS_FILE = "locations.json"
 REPORTS_FILE = "reports.json"
 SETTINGS_FILE = "settings.json"
+ROLLUPS_FILE = "rollups.json"
+SCHEDULER_FILE = "scheduler.json"
 
 
 def get_default_settings() -> Dict:
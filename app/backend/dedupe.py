@@ -0,0 +1,128 @@
+"""Duplicate detection for client event ids (retried location posts).
+
+Recent ids and their results live in a bounded per-user LRU, so a retry gets
+the original response without touching storage. Older ids fall back to a
+rotating Bloom filter: a "no" is definite and skips any lookup, a "maybe" is
+confirmed against storage by the caller.
+"""
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+from metrics import Counter, registry
+
+DEDUPE_EVENTS = registry.register(Counter(
+    "location_dedupe_total", "Location events by dedupe outcome", ("result",)))
+
+MAX_EVENT_ID_LENGTH = 64
+LOCK_STRIPES = 256
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, hashes: int = 7, bits_per_item: int = 10):
+        self.size = max(64, capacity * bits_per_item)
+        self.hashes = hashes
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        # Double hashing: k positions from two 64-bit hashes
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RotatingBloomFilter:
+    """Two generations; when the current one is full the older one is dropped."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.current = BloomFilter(capacity)
+        self.previous: Optional[BloomFilter] = None
+
+    def add(self, key: str) -> None:
+        if self.current.count >= self.capacity:
+            self.previous, self.current = self.current, BloomFilter(self.capacity)
+        self.current.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.current or (self.previous is not None and key in self.previous)
+
+
+class EventDeduplicator:
+    def __init__(self, per_user: int = 64, max_users: int = 10000, bloom_capacity: int = 200000):
+        self.per_user = per_user
+        self.max_users = max_users
+        self._recent: "OrderedDict[Hashable, OrderedDict[str, Dict]]" = OrderedDict()
+        self._bloom = RotatingBloomFilter(bloom_capacity)
+        self._lock = threading.Lock()
+        # Striped, so no lock is ever dropped while a request holds or waits on it
+        self._user_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # False while recent history is still being replayed after a restart;
+        # a Bloom "no" is not trusted until then
+        self.complete = True
+
+    def user_lock(self, user_id: Hashable) -> threading.Lock:
+        """Serializes one user's events so concurrent retries can't both get through."""
+        return self._user_locks[hash(user_id) % LOCK_STRIPES]
+
+    def _key(self, user_id: Hashable, event_id: str) -> str:
+        return f"{user_id}:{event_id}"
+
+    def lookup(self, user_id: Hashable, event_id: str, confirm: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """The original result if this event was already processed, else None."""
+        with self._lock:
+            events = self._recent.get(user_id)
+            if events is not None and event_id in events:
+                events.move_to_end(event_id)
+                DEDUPE_EVENTS.inc("duplicate_recent")
+                return events[event_id]
+            in_bloom = self._key(user_id, event_id) in self._bloom
+        if not in_bloom and self.complete:
+            DEDUPE_EVENTS.inc("new")
+            return None
+        result = confirm()
+        if result is None:
+            DEDUPE_EVENTS.inc("bloom_false_positive" if in_bloom else "new")
+            return None
+        DEDUPE_EVENTS.inc("duplicate_storage")
+        self.remember(user_id, event_id, result)
+        return result
+
+    def export_state(self) -> Dict:
+        with self._lock:
+            # Copies: the snapshot is pickled outside the lock
+            return {"recent": OrderedDict((u, OrderedDict(e)) for u, e in self._recent.items()),
+                    "bloom": copy.deepcopy(self._bloom)}
+
+    def load_state(self, state: Dict) -> None:
+        with self._lock:
+            self._recent = state["recent"]
+            self._bloom = state["bloom"]
+
+    def remember(self, user_id: Hashable, event_id: str, result: Dict) -> None:
+        with self._lock:
+            events = self._recent.get(user_id)
+            if events is None:
+                events = self._recent[user_id] = OrderedDict()
+            self._recent.move_to_end(user_id)
+            events[event_id] = result
+            events.move_to_end(event_id)
+            while len(events) > self.per_user:
+                events.popitem(last=False)
+            while len(self._recent) > self.max_users:
+                self._recent.popitem(last=False)
+            self._bloom.add(self._key(user_id, event_id))
+
+
+locations = EventDeduplicator()
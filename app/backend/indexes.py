@@ -0,0 +1,154 @@
+"""In-memory indexes over data files, kept in step with writes made through services."""
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional
+from database import db, SESSIONS_FILE
+from storage_client import Transaction
+from metrics import cache_hit, cache_miss
+from records import Session
+
+
+class SessionIndex:
+    """Sessions per user, sorted by date.
+
+    Sessions are held as slotted `records.Session` (a fraction of a dict's
+    memory) and handed out as dicts. Changes made in `transaction` are applied to the index directly.
+    Any other change to the file (bot, another worker, a manual edit) changes
+    `db.version` and the index is rebuilt on next use.
+    """
+
+    def __init__(self, filename: str = SESSIONS_FILE):
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._version: Optional[Hashable] = None
+        self._users: Dict[Hashable, List[Session]] = {}
+        self._dates: Dict[Hashable, List[str]] = {}
+        self._by_id: Dict[str, Session] = {}
+
+    def _rebuild(self, version: Hashable) -> None:
+        users: Dict[Hashable, List[Session]] = {}
+        dates: Dict[Hashable, List[str]] = {}
+        by_id: Dict[str, Session] = {}
+        grouped: Dict[Hashable, List] = {}
+        for item in db.read(self.filename):
+            session = Session.from_dict(item)
+            grouped.setdefault(item.get("user_id"), []).append((item.get("date") or "", session))
+            by_id[item.get("id")] = session
+        for user_id, entries in grouped.items():
+            # Stable sort keeps file order for sessions on the same date
+            entries.sort(key=lambda entry: entry[0])
+            dates[user_id] = [date for date, _ in entries]
+            users[user_id] = [session for _, session in entries]
+        self._users = users
+        self._dates = dates
+        self._by_id = by_id
+        self._version = version
+
+    def _ensure(self) -> None:
+        version = db.version(self.filename)
+        if version != self._version:
+            cache_miss("session_index")
+            self._rebuild(version)
+        else:
+            cache_hit("session_index")
+
+    def export_state(self) -> Optional[Dict]:
+        """Copy of the index contents if in step with the file, for snapshots (pickled outside the lock)."""
+        with self._lock:
+            if self._version is None or self._version != db.version(self.filename):
+                return None
+            # One copy per record, shared by both maps like the originals
+            copies: Dict[int, Session] = {}
+
+            def copy_of(session: Session) -> Session:
+                copied = copies.get(id(session))
+                if copied is None:
+                    copied = copies[id(session)] = session.copy()
+                return copied
+
+            return {
+                "users": {user_id: [copy_of(s) for s in sessions] for user_id, sessions in self._users.items()},
+                "by_id": {session_id: copy_of(s) for session_id, s in self._by_id.items()}
+            }
+    
+    def load_state(self, state: Dict) -> None:
+        """Adopt a snapshot taken while the file had its current contents."""
+        with self._lock:
+            self._users = state["users"]
+            self._by_id = state["by_id"]
+            self._dates = {user_id: [s.get("date") or "" for s in sessions] for user_id, sessions in self._users.items()}
+            self._version = db.version(self.filename)
+    
+    def warm(self) -> int:
+        with self._lock:
+            self._ensure()
+            return len(self._by_id)
+
+    def range(self, user_id: Hashable, start_date: str, end_date: str) -> List[Dict]:
+        """Copies of the user's sessions with start_date <= date <= end_date, oldest first."""
+        with self._lock:
+            self._ensure()
+            dates = self._dates.get(user_id)
+            if not dates:
+                return []
+            lo = bisect_left(dates, start_date)
+            hi = bisect_right(dates, end_date, lo)
+            return [s.to_dict() for s in self._users[user_id][lo:hi]]
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure()
+            session = self._by_id.get(session_id)
+            return session.to_dict() if session else None
+
+    def latest(self, user_id: Hashable) -> Optional[Dict]:
+        """Copy of the user's most recent session."""
+        with self._lock:
+            self._ensure()
+            sessions = self._users.get(user_id)
+            return sessions[-1].to_dict() if sessions else None
+
+    def _mirror(self, op: Dict) -> bool:
+        """Apply a committed append/update to the index; False if it can't be mirrored."""
+        if op["op"] == "append":
+            entry = Session.from_dict(op["item"])
+            user_id = entry.get("user_id")
+            date = entry.get("date") or ""
+            dates = self._dates.setdefault(user_id, [])
+            sessions = self._users.setdefault(user_id, [])
+            position = bisect_right(dates, date)
+            dates.insert(position, date)
+            sessions.insert(position, entry)
+            self._by_id[entry.get("id")] = entry
+            return True
+        if op["op"] == "update" and op["key"] == "id":
+            entry = self._by_id.get(op["value"])
+            updates = op["updates"]
+            if entry is None or ("date" in updates and updates["date"] != entry.get("date")):
+                return False
+            entry.update(updates)
+            return True
+        return False
+
+    @contextmanager
+    def transaction(self, filenames: Iterable[str]) -> Iterator[Transaction]:
+        """db.transaction whose changes to the sessions file are mirrored in the index.
+
+        Inside the block read sessions through `tx`, not the index: the index
+        may need to reload the file, whose lock the transaction holds.
+        """
+        with self._lock:
+            with db.transaction(filenames) as tx:
+                yield tx
+            if self.filename not in tx.dirty:
+                return
+            ops = [op for op in tx.ops if op["file"] == self.filename]
+            if tx.ok and tx.before[self.filename] == self._version and all(self._mirror(op) for op in ops):
+                self._version = tx.after[self.filename]
+            else:
+                # Someone else wrote in between (or the change can't be mirrored); rebuild on next use
+                self._version = None
+
+
+sessions_index = SessionIndex()
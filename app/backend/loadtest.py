@@ -0,0 +1,226 @@
+"""End-to-end API load test over in-process ASGI transport.
+
+Simulated employees sign real Telegram initData with a test bot token, start a
+session, ping their location every simulated minute and fetch stats, while
+admins poll /statistics/all. Nothing leaves the process.
+
+Usage (from app/backend):
+    python loadtest.py --users 10,50,100 --minutes 30
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import urlencode
+
+TEST_BOT_TOKEN = "123456:LOADTEST"
+ADMIN_BASE_ID = 900000
+EMPLOYEE_BASE_ID = 100000
+OFFICE = (41.311081, 69.240562)
+
+
+def sign_init_data(user: Dict, bot_token: str = TEST_BOT_TOKEN) -> str:
+    """Build Telegram WebApp initData signed the way Telegram does."""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"loadtest-{user['id']}",
+        "user": json.dumps(user, separators=(",", ":"), ensure_ascii=False)
+    }
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def prepare_data_dir(path: Path, employees: int, admins: int) -> None:
+    now = datetime.now().isoformat()
+    users = [
+        {
+            "telegram_id": base + n,
+            "username": f"{prefix}{n}",
+            "first_name": f"{prefix.title()} {n}",
+            "last_name": "",
+            "status": "active",
+            "password": "00000",
+            "auth_type": "telegram",
+            "created_at": now,
+            "updated_at": now
+        }
+        for prefix, base, count in (("admin", ADMIN_BASE_ID, admins), ("xodim", EMPLOYEE_BASE_ID, employees))
+        for n in range(count)
+    ]
+    settings = {
+        "work_start": "00:00",
+        "work_end": "23:59",
+        "lunch_start": "13:00",
+        "lunch_end": "14:00",
+        "geofence": {"center_lat": OFFICE[0], "center_lng": OFFICE[1], "radius_meters": 100}
+    }
+    with open(path / "users.json", "w", encoding="utf-8") as f:
+        json.dump(users, f, ensure_ascii=False, indent=2)
+    with open(path / "settings.json", "w", encoding="utf-8") as f:
+        json.dump(settings, f, ensure_ascii=False, indent=2)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def call(self, client, method: str, route: str, path: str = None, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, path or route, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        key = f"{method} {route}"
+        self.samples.setdefault(key, []).append(elapsed)
+        if response.status_code >= 400:
+            self.errors[key] = self.errors.get(key, 0) + 1
+        return response
+
+    def report(self, wall_seconds: float) -> Dict:
+        result = {}
+        for key, samples in sorted(self.samples.items()):
+            samples.sort()
+            pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))], 3)
+            result[key] = {
+                "count": len(samples),
+                "errors": self.errors.get(key, 0),
+                "p50_ms": pick(0.50),
+                "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99),
+                "max_ms": round(samples[-1], 3),
+                "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0
+            }
+        return result
+
+
+async def employee(client, recorder: Recorder, n: int, minutes: int, stats_every: int, tick: asyncio.Condition, clock):
+    rng = random.Random(n)
+    headers = {"X-Telegram-Init-Data": sign_init_data({"id": EMPLOYEE_BASE_ID + n, "first_name": f"Xodim {n}", "username": f"xodim{n}"})}
+    today = datetime.now().strftime("%Y-%m-%d")
+    week_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+
+    await recorder.call(client, "POST", "/sessions/start", headers=headers)
+    for minute in range(minutes):
+        async with tick:
+            await tick.wait_for(lambda: clock["minute"] >= minute)
+        offset = 0.0002 if rng.random() < 0.85 else 0.01
+        await recorder.call(client, "POST", "/locations/record", headers=headers, json={
+            "latitude": OFFICE[0] + rng.uniform(-offset, offset),
+            "longitude": OFFICE[1] + rng.uniform(-offset, offset)
+        })
+        if minute % stats_every == stats_every - 1:
+            await recorder.call(client, "GET", "/sessions/today", headers=headers)
+            await recorder.call(client, "POST", "/statistics/me", headers=headers,
+                                json={"start_date": week_ago, "end_date": today})
+            await recorder.call(client, "POST", "/statistics/chart/me", headers=headers,
+                                json={"start_date": week_ago, "end_date": today})
+
+
+async def admin(client, recorder: Recorder, n: int, minutes: int, poll_every: int, tick: asyncio.Condition, clock):
+    headers = {"X-Telegram-Init-Data": sign_init_data({"id": ADMIN_BASE_ID + n, "first_name": f"Admin {n}", "username": f"admin{n}"})}
+    today = datetime.now().strftime("%Y-%m-%d")
+    month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+    for minute in range(0, minutes, poll_every):
+        async with tick:
+            await tick.wait_for(lambda: clock["minute"] >= minute)
+        await recorder.call(client, "POST", "/statistics/all", headers=headers,
+                            json={"start_date": month_ago, "end_date": today})
+
+
+async def run_scenario(app, employees: int, admins: int, minutes: int, stats_every: int, poll_every: int,
+                       minute_seconds: float) -> Dict:
+    import httpx
+
+    recorder = Recorder()
+    tick = asyncio.Condition()
+    clock = {"minute": 0}
+
+    async def advance():
+        for minute in range(1, minutes + 1):
+            await asyncio.sleep(minute_seconds)
+            async with tick:
+                clock["minute"] = minute
+                tick.notify_all()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            advance(),
+            *(employee(client, recorder, n, minutes, stats_every, tick, clock) for n in range(employees)),
+            *(admin(client, recorder, n, minutes, poll_every, tick, clock) for n in range(admins))
+        )
+        wall = time.perf_counter() - started
+
+    routes = recorder.report(wall)
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "employees": employees,
+        "admins": admins,
+        "minutes": minutes,
+        "wall_seconds": round(wall, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / wall, 2) if wall else 0,
+        "routes": routes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process API load test")
+    parser.add_argument("--users", default="10,50", help="Employee counts, comma separated")
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--minutes", type=int, default=15, help="Simulated minutes per scenario")
+    parser.add_argument("--stats-every", type=int, default=5, help="Employees fetch stats every N minutes")
+    parser.add_argument("--poll-every", type=int, default=2, help="Admins poll /statistics/all every N minutes")
+    parser.add_argument("--minute-seconds", type=float, default=0.0, help="Wall seconds per simulated minute")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="loadtest-data-"))
+    # Must be set before the app's config is imported
+    os.environ["BOT_TOKEN"] = TEST_BOT_TOKEN
+    os.environ["DATA_DIR"] = str(data_dir)
+    os.environ["ADMIN_IDS"] = ",".join(str(ADMIN_BASE_ID + n) for n in range(args.admins))
+    os.environ["SCHEDULER_ENABLED"] = "false"
+    # Simulated minutes run faster than real ones; keep admission control out of the way unless asked
+    for name in ("RATE_LIMIT_LOCATION", "RATE_LIMIT_SESSION", "RATE_LIMIT_REPORT", "WRITE_CONCURRENCY"):
+        os.environ.setdefault(name, "0")
+
+    from main import app
+    from database import db
+
+    scenarios = []
+    for employees in (int(x) for x in args.users.split(",") if x):
+        scenario_dir = data_dir / f"users-{employees}"
+        scenario_dir.mkdir()
+        prepare_data_dir(scenario_dir, employees, args.admins)
+        db.data_dir = scenario_dir
+
+        print(f"Scenario: {employees} employees, {args.admins} admins, {args.minutes} minutes", flush=True)
+        result = asyncio.run(run_scenario(
+            app, employees, args.admins, args.minutes, args.stats_every, args.poll_every, args.minute_seconds
+        ))
+        scenarios.append(result)
+        print(f"  {result['total_requests']} requests in {result['wall_seconds']}s ({result['throughput_rps']} req/s)")
+        print(f"  {'route':<32} {'count':>6} {'err':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>8}")
+        for route, r in result["routes"].items():
+            print(f"  {route:<32} {r['count']:>6} {r['errors']:>5} {r['p50_ms']:>9.2f} "
+                  f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_rps']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"created_at": datetime.now().isoformat(), "scenarios": scenarios}, f, indent=2)
+        print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
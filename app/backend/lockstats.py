@@ -0,0 +1,142 @@
+"""Per-file lock contention and hold-time instrumentation."""
+import logging
+import sys
+import threading
+import time
+from typing import Dict, Optional
+from config import config
+from metrics import DB_LOCK_WAIT, DB_LOCK_HOLD
+
+logger = logging.getLogger(__name__)
+
+# Frames from these files are skipped when looking for the caller
+_INTERNAL_FILES = ("lockstats.py", "database.py", "contextlib.py", "indexes.py", "search.py")
+
+
+def _caller_frame():
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename.endswith(_INTERNAL_FILES):
+        frame = frame.f_back
+    return frame
+
+
+def call_site(frame) -> str:
+    if frame is None:
+        return "unknown"
+    code = frame.f_code
+    return f"{code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno}:{code.co_name}"
+
+
+class LockStats:
+    __slots__ = (
+        "acquisitions", "contended", "total_wait", "max_wait", "total_hold", "max_hold",
+        "waiting", "max_waiting", "holder", "last_holder", "longest_holder", "slow_waits", "queue_lock"
+    )
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_hold = 0.0
+        self.max_hold = 0.0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.holder: Optional[str] = None
+        self.last_holder: Optional[str] = None
+        self.longest_holder: Optional[str] = None
+        self.slow_waits = 0
+        # Guards contended/waiting/max_waiting, which change while the file lock is not held
+        self.queue_lock = threading.Lock()
+
+    def as_dict(self) -> Dict:
+        n = self.acquisitions or 1
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": round(self.total_wait / n * 1000, 3),
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "total_wait_ms": round(self.total_wait * 1000, 3),
+            "avg_hold_ms": round(self.total_hold / n * 1000, 3),
+            "max_hold_ms": round(self.max_hold * 1000, 3),
+            "total_hold_ms": round(self.total_hold * 1000, 3),
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "holder": self.holder,
+            "longest_holder": self.longest_holder,
+            "slow_waits": self.slow_waits
+        }
+
+
+class InstrumentedLock:
+    """threading.Lock that records wait/hold times, queue depth and the longest holder."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = LockStats()
+        self._lock = threading.Lock()
+        self._acquired_at = 0.0
+
+    def acquire(self):
+        stats = self.stats
+        # Resolved now: at release the caller's frame points at a later line
+        site = call_site(_caller_frame())
+        started = time.perf_counter()
+        if not self._lock.acquire(blocking=False):
+            with stats.queue_lock:
+                stats.contended += 1
+                stats.waiting += 1
+                stats.max_waiting = max(stats.max_waiting, stats.waiting)
+            try:
+                self._lock.acquire()
+            finally:
+                with stats.queue_lock:
+                    stats.waiting -= 1
+        now = time.perf_counter()
+        wait = now - started
+
+        # The rest is only touched by the holder of the file lock
+        self._acquired_at = now
+        stats.acquisitions += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        DB_LOCK_WAIT.observe(wait, self.name)
+
+        if config.SLOW_LOCK_MS and wait * 1000 >= config.SLOW_LOCK_MS:
+            stats.slow_waits += 1
+            logger.warning(
+                f"Slow lock {self.name}: waited {wait * 1000:.1f} ms at {site} "
+                f"(queue depth {stats.waiting}, after {stats.last_holder})"
+            )
+        stats.holder = site
+
+    def release(self):
+        stats = self.stats
+        hold = time.perf_counter() - self._acquired_at
+        stats.total_hold += hold
+        if hold > stats.max_hold:
+            stats.max_hold = hold
+            stats.longest_holder = stats.holder
+        stats.last_holder, stats.holder = stats.holder, None
+        self._lock.release()
+        DB_LOCK_HOLD.observe(hold, self.name)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+registry: Dict[str, InstrumentedLock] = {}
+
+
+def snapshot() -> Dict[str, Dict]:
+    """Stats per file, most waited-on first."""
+    items = sorted(registry.items(), key=lambda kv: kv[1].stats.total_wait, reverse=True)
+    return {name: lock.stats.as_dict() for name, lock in items}
+
+
+def queue_depths() -> Dict:
+    return {(name,): lock.stats.waiting for name, lock in registry.items()}
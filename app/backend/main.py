@@ -1,19 +1,57 @@
 """FastAPI Backend for Attendance System."""
-import random
-import string
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Literal, Optional, List
 from datetime import datetime
 
 from config import config
 from auth import get_current_user, get_current_user_optional
-from database import db, get_settings, save_settings, USERS_FILE, REPORTS_FILE, LOCATIONS_FILE
+from botwebhook import bot_webhook, WEBHOOK_PATH
+from database import db, get_settings, save_settings, USERS_FILE, LOCATIONS_FILE, ROLLUPS_FILE
+from scheduler import scheduler
+from snapshot import snapshots
+import dedupe
+import lockstats
+import metrics
+import profiling
+import ratelimit
 import services
+import snapshot
+import workcalendar
 
-app = FastAPI(title="Davomat Tizimi API", version="1.0.0")
+logger = logging.getLogger(__name__)
 
+MAX_BULK_USERS = 1000
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if config.BOT_WEBHOOK_ENABLED:
+        # First, before background threads start: loading the bot swaps sys.modules briefly
+        await bot_webhook.start()
+    await asyncio.to_thread(snapshot.warm_start)
+    if config.SCHEDULER_ENABLED:
+        scheduler.start()
+    snapshots.start()
+    logger.info(f"Startup finished in {(time.perf_counter() - started) * 1000:.1f} ms")
+    yield
+    await snapshots.stop()
+    await scheduler.stop()
+    await bot_webhook.stop()
+
+
+app = FastAPI(title="Davomat Tizimi API", version="1.0.0", lifespan=lifespan)
+
+if config.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,6 +65,8 @@ app.add_middleware(
 class LocationRequest(BaseModel):
     latitude: float
     longitude: float
+    # Client-generated id, same on retries of one send
+    event_id: Optional[str] = None
 
 
 class ReportRequest(BaseModel):
@@ -39,18 +79,33 @@ class DateRangeRequest(BaseModel):
     end_date: str
 
 
+class ChartRequest(DateRangeRequest):
+    # day, week, month or auto (by range length)
+    granularity: Literal["day", "week", "month", "auto"] = "day"
+
+
 class SettingsRequest(BaseModel):
     work_start: Optional[str] = None
     work_end: Optional[str] = None
     lunch_start: Optional[str] = None
     lunch_end: Optional[str] = None
     geofence: Optional[dict] = None
+    # Per-weekday overrides ("mon".."sun", null = day off), "YYYY-MM-DD" holidays, shifts by user id
+    days: Optional[Dict[str, Optional[dict]]] = None
+    holidays: Optional[List[str]] = None
+    shifts: Optional[Dict[str, dict]] = None
 
 
 class UserStatusRequest(BaseModel):
     status: str
 
 
+class BulkUserStatusRequest(BaseModel):
+    status: str
+    telegram_ids: List[int] = []
+    usernames: List[str] = []
+
+
 class BrowserRegisterRequest(BaseModel):
     username: str
 
@@ -71,6 +126,37 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def get_metrics(request: Request, authorization: str = Header(None)):
+    """Prometheus text exposition."""
+    if not config.METRICS_TOKEN:
+        if not config.METRICS_PUBLIC and not metrics.is_local(request.client.host if request.client else None):
+            raise HTTPException(403, "Metrics are served to localhost only; set METRICS_TOKEN")
+    elif not metrics.check_token(authorization, config.METRICS_TOKEN):
+        raise HTTPException(401, "Invalid metrics token")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+    """Telegram updates in webhook mode; handled in the background by the bot."""
+    if bot_webhook.loaded is None:
+        raise HTTPException(404, "Bot webhook is not enabled")
+    if not bot_webhook.check_secret(x_telegram_bot_api_secret_token):
+        raise HTTPException(403, "Invalid secret token")
+    if not bot_webhook.running:
+        # Telegram retries non-2xx deliveries
+        raise HTTPException(503, "Bot is not ready", headers={"Retry-After": "10"})
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Invalid update")
+    if not isinstance(data, dict):
+        raise HTTPException(400, "Invalid update")
+    await bot_webhook.enqueue(data)
+    return {"ok": True}
+
+
 # Browser Auth Routes
 @app.post("/auth/register")
 async def browser_register(req: BrowserRegisterRequest):
@@ -187,23 +273,14 @@ async def update_user_status(telegram_id: int, req: UserStatusRequest, user=Depe
     if req.status not in ["active", "blocked", "pending"]:
         raise HTTPException(400, "Invalid status")
     
-    target_user = db.find_one(USERS_FILE, "telegram_id", telegram_id)
-    if not target_user:
-        raise HTTPException(404, "User not found")
-    
-    updates = {"status": req.status}
-    
-    # Agar tasdiqlansa va parol yo'q bo'lsa - parol generatsiya qilish
-    if req.status == "active" and not target_user.get("password"):
-        password = ''.join(random.choices(string.digits, k=5))
-        updates["password"] = password
-    
-    success = db.update(USERS_FILE, "telegram_id", telegram_id, updates)
-    if not success:
+    # Agar tasdiqlansa va parol yo'q bo'lsa - parol generatsiya qilinadi
+    results = services.set_user_statuses([("telegram_id", telegram_id)], req.status)
+    if results is None:
         raise HTTPException(500, "Update failed")
+    updated_user = results[0]
+    if not updated_user:
+        raise HTTPException(404, "User not found")
     
-    # Yangilangan foydalanuvchini qaytarish
-    updated_user = db.find_one(USERS_FILE, "telegram_id", telegram_id)
     return {
         "message": "Updated", 
         "status": req.status,
@@ -220,22 +297,13 @@ async def update_user_status_by_username(username: str, req: UserStatusRequest,
     if req.status not in ["active", "blocked", "pending"]:
         raise HTTPException(400, "Invalid status")
     
-    target_user = db.find_one(USERS_FILE, "username", username.lower())
-    if not target_user:
-        raise HTTPException(404, "User not found")
-    
-    updates = {"status": req.status}
-    
-    # Agar tasdiqlansa va parol yo'q bo'lsa - parol generatsiya qilish
-    if req.status == "active" and not target_user.get("password"):
-        password = ''.join(random.choices(string.digits, k=5))
-        updates["password"] = password
-    
-    success = db.update(USERS_FILE, "username", username.lower(), updates)
-    if not success:
+    results = services.set_user_statuses([("username", username.lower())], req.status)
+    if results is None:
         raise HTTPException(500, "Update failed")
+    updated_user = results[0]
+    if not updated_user:
+        raise HTTPException(404, "User not found")
     
-    updated_user = db.find_one(USERS_FILE, "username", username.lower())
     return {
         "message": "Updated", 
         "status": req.status,
@@ -244,9 +312,43 @@ async def update_user_status_by_username(username: str, req: UserStatusRequest,
     }
 
 
+@app.post("/users/status:bulk")
+async def update_user_status_bulk(req: BulkUserStatusRequest, user=Depends(get_current_user)):
+    """Bir nechta foydalanuvchi statusini bitta yozish bilan o'zgartirish."""
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    if req.status not in ["active", "blocked", "pending"]:
+        raise HTTPException(400, "Invalid status")
+    targets = [("telegram_id", telegram_id) for telegram_id in req.telegram_ids]
+    targets += [("username", username.strip().lower().replace("@", "")) for username in req.usernames]
+    if not targets:
+        raise HTTPException(400, "telegram_ids yoki usernames kerak")
+    if len(targets) > MAX_BULK_USERS:
+        raise HTTPException(400, f"Bir so'rovda ko'pi bilan {MAX_BULK_USERS} ta foydalanuvchi")
+    
+    results = services.set_user_statuses(targets, req.status)
+    if results is None:
+        raise HTTPException(500, "Update failed")
+    
+    updated, not_found = [], []
+    for (key, value), updated_user in zip(targets, results):
+        if updated_user is None:
+            not_found.append({key: value})
+            continue
+        updated.append({
+            "telegram_id": updated_user.get("telegram_id"),
+            "username": updated_user.get("username"),
+            "status": req.status,
+            "password": updated_user.get("password") if req.status == "active" else None
+        })
+    return {"message": "Updated", "status": req.status, "updated": updated, "not_found": not_found}
+
+
 # Session Routes
+# Write routes are plain `def`: FastAPI runs them in its threadpool, so blocking file I/O
+# doesn't stall the event loop and WRITE_CONCURRENCY caps how many run at once
 @app.post("/sessions/start")
-async def start_session(user=Depends(get_current_user)):
+def start_session(user=Depends(ratelimit.write_limit("session"))):
     user_id = user.get("telegram_id") or user.get("username")
     session = services.start_session(user_id)
     if not session:
@@ -255,7 +357,7 @@ async def start_session(user=Depends(get_current_user)):
 
 
 @app.post("/sessions/end")
-async def end_session(user=Depends(get_current_user)):
+def end_session(user=Depends(ratelimit.write_limit("session"))):
     user_id = user.get("telegram_id") or user.get("username")
     session = services.end_session(user_id)
     if not session:
@@ -278,36 +380,66 @@ async def get_session_history(req: DateRangeRequest, user=Depends(get_current_us
 
 @app.get("/sessions/should-track")
 async def should_track(user=Depends(get_current_user)):
-    return {"should_track": services.is_work_hours()}
+    user_id = user.get("telegram_id") or user.get("username")
+    return services.get_tracking_advice(user_id)
 
 
 # Location Routes
 @app.post("/locations/record")
-async def record_location(req: LocationRequest, user=Depends(get_current_user)):
+def record_location(req: LocationRequest, user=Depends(ratelimit.write_limit("location"))):
     user_id = user.get("telegram_id") or user.get("username")
+    if not req.event_id:
+        return _record_location(user_id, req)
+    if len(req.event_id) > dedupe.MAX_EVENT_ID_LENGTH:
+        raise HTTPException(400, "event_id juda uzun")
+    
+    with dedupe.locations.user_lock(user_id):
+        original = dedupe.locations.lookup(
+            user_id, req.event_id, lambda: services.find_location_event(user_id, req.event_id)
+        )
+        if original is not None:
+            return original
+        result = _record_location(user_id, req)
+        if result.get("id"):
+            dedupe.locations.remember(user_id, req.event_id, result)
+        return result
+
+
+def _record_location(user_id, req: LocationRequest) -> dict:
     session = services.get_today_session(user_id)
     if not session:
         raise HTTPException(400, "Avval sessiyani boshlang")
     
-    location = services.record_location(user_id, session["id"], req.latitude, req.longitude)
+    location = services.record_location(user_id, session["id"], req.latitude, req.longitude, req.event_id)
     if not location:
         return {"recorded": False, "message": "Ish vaqti tashqarida"}
     return location
 
 
 @app.get("/locations/session/{session_id}")
-async def get_session_locations(session_id: str, user=Depends(get_current_user)):
-    return db.find_many(LOCATIONS_FILE, {"session_id": session_id})
+async def get_session_locations(
+    session_id: str,
+    simplify: Optional[float] = None,
+    encoding: Literal["coordinates", "polyline"] = "coordinates",
+    user=Depends(get_current_user)
+):
+    """Raw points, or with `simplify` (meters) a simplified track."""
+    if simplify is None:
+        return db.find_many(LOCATIONS_FILE, {"session_id": session_id})
+    if simplify < 0:
+        raise HTTPException(400, "simplify manfiy bo'lishi mumkin emas")
+    return services.get_session_track(session_id, simplify, encoding == "polyline")
 
 
 @app.get("/locations/should-track")
 async def should_track_location(user=Depends(get_current_user)):
-    return {"should_track": services.is_work_hours()}
+    user_id = user.get("telegram_id") or user.get("username")
+    return services.get_tracking_advice(user_id)
 
 
 # Report Routes
 @app.post("/reports/submit")
-async def submit_report(req: ReportRequest, user=Depends(get_current_user)):
+def submit_report(req: ReportRequest, user=Depends(ratelimit.write_limit("report"))):
     if not req.content.strip():
         raise HTTPException(400, "Hisobot bo'sh bo'lishi mumkin emas")
     user_id = user.get("telegram_id") or user.get("username")
@@ -315,23 +447,23 @@ async def submit_report(req: ReportRequest, user=Depends(get_current_user)):
 
 
 @app.get("/reports/today")
-async def get_today_report(user=Depends(get_current_user)):
+async def get_today_report(include_content: bool = True, user=Depends(get_current_user)):
     today = datetime.now().strftime("%Y-%m-%d")
     user_id = user.get("telegram_id") or user.get("username")
-    report = services.get_user_report(user_id, today)
+    report = services.get_user_report(user_id, today, include_content)
     return {"report": report, "submitted": report is not None}
 
 
 @app.get("/reports/date/{date}")
-async def get_report_by_date(date: str, user=Depends(get_current_user)):
+async def get_report_by_date(date: str, include_content: bool = True, user=Depends(get_current_user)):
     user_id = user.get("telegram_id") or user.get("username")
-    return {"report": services.get_user_report(user_id, date)}
+    return {"report": services.get_user_report(user_id, date, include_content)}
 
 
 @app.get("/reports/history")
-async def get_report_history(user=Depends(get_current_user)):
+async def get_report_history(include_content: bool = False, user=Depends(get_current_user)):
     user_id = user.get("telegram_id") or user.get("username")
-    return db.find_many(REPORTS_FILE, {"user_id": user_id})
+    return services.list_reports({"user_id": user_id}, include_content)
 
 
 @app.get("/reports/status")
@@ -342,11 +474,29 @@ async def get_report_status(user=Depends(get_current_user)):
     return {"submitted": report is not None}
 
 
+@app.get("/reports/search")
+async def search_reports(
+    q: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[int] = None,
+    page: int = 1,
+    page_size: int = 20,
+    user=Depends(get_current_user)
+):
+    """Ranked full-text search over reports (admin)."""
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    if page < 1 or not 1 <= page_size <= 100:
+        raise HTTPException(400, "page >= 1, 1 <= page_size <= 100")
+    return services.search_reports(q, start_date, end_date, user_id, page, page_size)
+
+
 @app.get("/reports/all/{date}")
-async def get_all_reports_by_date(date: str, user=Depends(get_current_user)):
+async def get_all_reports_by_date(date: str, include_content: bool = False, user=Depends(get_current_user)):
     if not config.is_admin(user.get("telegram_id")):
         raise HTTPException(403, "Admin only")
-    return db.find_many(REPORTS_FILE, {"date": date})
+    return services.list_reports({"date": date}, include_content)
 
 
 # Statistics Routes
@@ -375,16 +525,74 @@ async def get_all_statistics(req: DateRangeRequest, user=Depends(get_current_use
 
 
 @app.post("/statistics/chart/me")
-async def get_my_chart(req: DateRangeRequest, user=Depends(get_current_user)):
+async def get_my_chart(req: ChartRequest, user=Depends(get_current_user)):
     user_id = user.get("telegram_id") or user.get("username")
-    return services.get_chart_data(user_id, req.start_date, req.end_date)
+    try:
+        return services.get_chart_data(user_id, req.start_date, req.end_date, req.granularity)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
 
 @app.post("/statistics/chart/user/{user_id}")
-async def get_user_chart(user_id: int, req: DateRangeRequest, user=Depends(get_current_user)):
+async def get_user_chart(user_id: int, req: ChartRequest, user=Depends(get_current_user)):
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    try:
+        return services.get_chart_data(user_id, req.start_date, req.end_date, req.granularity)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@app.get("/statistics/rollups")
+async def get_daily_rollups(user=Depends(get_current_user)):
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    return db.read(ROLLUPS_FILE)
+
+
+# Scheduler Routes
+@app.get("/scheduler/jobs")
+async def get_scheduler_jobs(user=Depends(get_current_user)):
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    return scheduler.stats()
+
+
+@app.get("/locks")
+async def get_lock_stats(user=Depends(get_current_user)):
+    """Per-file JsonDB lock wait/hold statistics."""
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    return lockstats.snapshot()
+
+
+# Profiling Routes
+@app.get("/profiles")
+async def get_profiles(user=Depends(get_current_user)):
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    return profiling.list_profiles()
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, user=Depends(get_current_user)):
+    if not config.is_admin(user.get("telegram_id")):
+        raise HTTPException(403, "Admin only")
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(404, "Profile not found")
+    return profile
+
+
+@app.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(profile_id: str, user=Depends(get_current_user)):
+    """Collapsed stacks for flamegraph.pl / speedscope."""
     if not config.is_admin(user.get("telegram_id")):
         raise HTTPException(403, "Admin only")
-    return services.get_chart_data(user_id, req.start_date, req.end_date)
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(404, "Profile not found")
+    return profile["collapsed"]
 
 
 # Settings Routes
@@ -409,6 +617,16 @@ async def update_settings(req: SettingsRequest, user=Depends(get_current_user)):
         current["lunch_end"] = req.lunch_end
     if req.geofence:
         current["geofence"] = req.geofence
+    if req.days is not None:
+        current["days"] = req.days
+    if req.holidays is not None:
+        current["holidays"] = sorted(set(req.holidays))
+    if req.shifts is not None:
+        current["shifts"] = req.shifts
+    try:
+        workcalendar.validate(current)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     
     save_settings(current)
     return current
@@ -0,0 +1,262 @@
+"""Prometheus metrics in the text exposition format.
+
+Small in-process registry (no prometheus_client dependency). Every update is a
+dict lookup plus a short uncontended lock, cheap enough for the hot path.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 8192, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def items(self) -> List[Tuple[Tuple, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(self.items())]
+
+
+class Gauge(Metric):
+    """Gauge set explicitly, or computed at scrape time by `callback`."""
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Callable[[], Dict[Tuple, float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, *labelvalues) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def samples(self):
+        values = self._callback() if self._callback else dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labelvalues) -> "_Timer":
+        return _Timer(self, labelvalues)
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        lines = []
+        for key, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+HTTP_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+
+DB_OP_LATENCY = registry.register(Histogram(
+    "jsondb_operation_duration_seconds", "JsonDB operation latency", ("op", "file")))
+DB_BYTES = registry.register(Counter(
+    "jsondb_bytes_total", "Bytes read/written by JsonDB", ("op", "file")))
+DB_LOCK_WAIT = registry.register(Histogram(
+    "jsondb_lock_wait_seconds", "Time spent waiting for a JsonDB file lock", ("file",)))
+DB_LOCK_HOLD = registry.register(Histogram(
+    "jsondb_lock_hold_seconds", "Time a JsonDB file lock was held", ("file",)))
+
+AUTH_VERIFICATIONS = registry.register(Counter(
+    "auth_verifications_total", "Authentication attempts by method and result", ("method", "result")))
+
+CACHE_REQUESTS = registry.register(Counter(
+    "cache_requests_total", "Cache lookups by cache and result", ("cache", "result")))
+
+
+def _cache_hit_ratios() -> Dict[Tuple, float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), value in CACHE_REQUESTS.items():
+        entry = totals.setdefault(cache, [0, 0])
+        entry[0 if result == "hit" else 1] += value
+    return {(cache,): hits / (hits + misses) for cache, (hits, misses) in totals.items() if hits + misses}
+
+
+registry.register(Gauge("cache_hit_ratio", "Cache hit ratio since start", ("cache",), callback=_cache_hit_ratios))
+
+
+def cache_hit(cache: str) -> None:
+    CACHE_REQUESTS.inc(cache, "hit")
+
+
+def cache_miss(cache: str) -> None:
+    CACHE_REQUESTS.inc(cache, "miss")
+
+
+def register_file_sizes(data_dir_getter: Callable[[], object]) -> None:
+    """Expose the current size of every file in DATA_DIR, read at scrape time."""
+    def sizes() -> Dict[Tuple, float]:
+        result = {}
+        for path in data_dir_getter().iterdir():
+            if path.is_file():
+                result[(path.name,)] = path.stat().st_size
+        return result
+    registry.register(Gauge("jsondb_file_size_bytes", "Current size of files in DATA_DIR", ("file",), callback=sizes))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and status counts."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Route template keeps label cardinality bounded
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - started, scope["method"], path)
+            HTTP_REQUESTS.inc(scope["method"], path, str(status["code"]))
+
+
+def render() -> str:
+    return registry.render()
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def is_local(host: Optional[str]) -> bool:
+    return host in LOCAL_HOSTS
+
+
+def check_token(authorization: Optional[str], token: str) -> bool:
+    if not token:
+        return True
+    if authorization is None:
+        return False
+    return hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
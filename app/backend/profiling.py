@@ -0,0 +1,162 @@
+"""On-demand request profiling.
+
+The middleware is only installed when PROFILING_ENABLED is set, so there is no
+cost at all when it is off. When on, a request is profiled if an admin sends
+`X-Profile: 1` or it falls into the PROFILING_SAMPLE_RATE sample. Results
+(pstats text and collapsed stacks for flamegraphs) go to a bounded ring buffer.
+Work from other requests interleaved on the event loop shows up in the same
+profile, so profile under light traffic when the numbers matter.
+"""
+import cProfile
+import io
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+from config import config
+from auth import validate_telegram_data
+from database import db, USERS_FILE
+
+PROFILE_HEADER = b"x-profile"
+SAMPLE_INTERVAL = 0.001
+
+profiles: deque = deque(maxlen=config.PROFILING_BUFFER_SIZE)
+# One profiled request at a time: cProfile and the sampler are per-process tools
+_busy = threading.Lock()
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self, top_n: int) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(top_n))
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _is_admin_request(scope) -> bool:
+    init_data = _header(scope, b"x-telegram-init-data")
+    if init_data:
+        user_data = validate_telegram_data(init_data)
+        return bool(user_data) and config.is_admin(user_data.get("id"))
+
+    token = _header(scope, b"x-browser-token")
+    if token and token.count(":") == 1:
+        username, password = token.split(":")
+        user = db.find_one(USERS_FILE, "username", username)
+        return bool(user) and user.get("password") == password and config.is_admin(user.get("telegram_id"))
+    return False
+
+
+def _pstats_text(profiler: cProfile.Profile, top_n: int) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(top_n)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _trigger(self, scope) -> Optional[str]:
+        if _header(scope, PROFILE_HEADER) == "1" and _is_admin_request(scope):
+            return "header"
+        if config.PROFILING_SAMPLE_RATE and random.random() < config.PROFILING_SAMPLE_RATE:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        if trigger is None or not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        # Handlers are async and run on the event loop thread, so that's the one to sample
+        sampler = StackSampler(threading.get_ident())
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            sampler.start()
+            profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            sampler.stop()
+            duration = (time.perf_counter() - started) * 1000
+            _busy.release()
+            profiles.append({
+                "id": uuid.uuid4().hex[:12],
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status["code"],
+                "trigger": trigger,
+                "duration_ms": round(duration, 2),
+                "samples": sum(sampler.stacks.values()),
+                "created_at": datetime.now().isoformat(),
+                "pstats": _pstats_text(profiler, config.PROFILING_TOP_N),
+                "collapsed": sampler.collapsed(config.PROFILING_TOP_N)
+            })
+
+
+def list_profiles() -> List[Dict]:
+    """Newest first, without the heavy text fields."""
+    return [
+        {k: v for k, v in p.items() if k not in ("pstats", "collapsed")}
+        for p in reversed(profiles)
+    ]
+
+
+def get_profile(profile_id: str) -> Optional[Dict]:
+    for p in profiles:
+        if p["id"] == profile_id:
+            return p
+    return None
@@ -0,0 +1,107 @@
+"""Admission control for write endpoints.
+
+Each user gets a token bucket per write kind (location, session, report);
+over-limit requests get 429 with Retry-After before any storage write. A
+global cap on in-flight writes sheds load with 503 when storage falls behind.
+
+Limits are "N/SECONDS" strings, e.g. RATE_LIMIT_LOCATION=10/60 allows bursts
+of 10 and refills 10 tokens per minute. Empty or 0 disables a limit.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Depends, HTTPException
+from auth import get_current_user
+from config import config
+from metrics import Counter, registry
+
+WRITES_REJECTED = registry.register(Counter(
+    "write_requests_rejected_total", "Write requests rejected by admission control", ("kind", "reason")))
+
+
+def parse_limit(value: str) -> Optional[Tuple[float, float]]:
+    """"N/SECONDS" -> (capacity, tokens per second); None if disabled."""
+    if not value or value.strip() in ("0", "off"):
+        return None
+    count, _, seconds = value.partition("/")
+    capacity, period = float(count), float(seconds or 1)
+    if capacity <= 0 or period <= 0:
+        return None
+    return capacity, capacity / period
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> Optional[float]:
+        """Consume a token; None if allowed, else seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Optional[Tuple[float, float]]], max_buckets: int = 20000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self._buckets: "OrderedDict[Tuple[str, Hashable], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, kind: str, user_id: Hashable) -> Optional[float]:
+        limit = self.limits.get(kind)
+        if limit is None:
+            return None
+        key = (kind, user_id)
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(limit[0], limit[1], now)
+            self._buckets.move_to_end(key)
+            # Least recently used buckets are dropped first; idle ones are full anyway
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return bucket.take(now)
+
+
+limiter = RateLimiter({
+    "location": parse_limit(config.RATE_LIMIT_LOCATION),
+    "session": parse_limit(config.RATE_LIMIT_SESSION),
+    "report": parse_limit(config.RATE_LIMIT_REPORT)
+})
+write_slots = threading.BoundedSemaphore(config.WRITE_CONCURRENCY) if config.WRITE_CONCURRENCY > 0 else None
+
+
+def write_limit(kind: str):
+    """Dependency used instead of get_current_user on write routes."""
+    async def dependency(user=Depends(get_current_user)):
+        user_id = user.get("telegram_id") or user.get("username")
+        retry_after = limiter.check(kind, user_id)
+        if retry_after is not None:
+            WRITES_REJECTED.inc(kind, "rate_limit")
+            raise HTTPException(429, "Juda ko'p so'rov, keyinroq urinib ko'ring",
+                                headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+        if write_slots is None:
+            yield user
+            return
+        if not write_slots.acquire(blocking=False):
+            WRITES_REJECTED.inc(kind, "overload")
+            raise HTTPException(503, "Server band, keyinroq urinib ko'ring", headers={"Retry-After": "1"})
+        try:
+            yield user
+        finally:
+            write_slots.release()
+    return dependency
@@ -0,0 +1,212 @@
+"""Slotted, typed records for collections kept in memory (the session index).
+
+A plain dict per location/session costs several hundred bytes plus a fresh
+uuid string and ISO timestamp string each. These records keep the same data
+in `__slots__`, with timestamps/dates/times as ints and ids interned.
+
+`from_dict`/`to_dict` round-trip the current dict shapes exactly: keys that
+are missing stay missing, unknown keys are kept in `extra`, and values that
+would not convert back to the same string are kept as they are.
+"""
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __reduce__(self):
+        # Unpickles (snapshots) as the module's singleton, so `is MISSING` keeps working
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+# Converters: (to internal, to dict value)
+def _ts_in(value: str) -> int:
+    return (datetime.fromisoformat(value) - _EPOCH) // _MICROSECOND
+
+
+def _ts_out(value: int) -> str:
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+def _date_in(value: str) -> int:
+    return date.fromisoformat(value).toordinal()
+
+
+def _date_out(value: int) -> str:
+    return date.fromordinal(value).isoformat()
+
+
+def _hhmm_in(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _hhmm_out(value: int) -> str:
+    return f"{value // 60:02d}:{value % 60:02d}"
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _plain(value):
+    return value
+
+
+# kind -> (to internal, to dict value, must round-trip check)
+_KINDS: Dict[str, Tuple[Callable, Callable, bool]] = {
+    "id": (_intern, _plain, False),
+    "value": (_plain, _plain, False),
+    "ts": (_ts_in, _ts_out, True),
+    "date": (_date_in, _date_out, True),
+    "hhmm": (_hhmm_in, _hhmm_out, True),
+}
+
+
+class Record:
+    """Base class; subclasses declare FIELDS as (name, kind) pairs."""
+
+    FIELDS: Tuple[Tuple[str, str], ...] = ()
+    __slots__ = ("extra",)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._names = tuple(name for name, _ in cls.FIELDS)
+        cls._names_set = frozenset(cls._names)
+        cls._codecs = tuple((name,) + _KINDS[kind] for name, kind in cls.FIELDS)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Record":
+        record = cls.__new__(cls)
+        extra = None
+        for name, to_internal, to_value, check in cls._codecs:
+            if name not in data:
+                setattr(record, name, MISSING)
+                continue
+            value = data[name]
+            if value is None:
+                setattr(record, name, None)
+                continue
+            try:
+                converted = to_internal(value)
+                if check and to_value(converted) != value:
+                    raise ValueError(value)
+            except (TypeError, ValueError, AttributeError):
+                # Keep anything we can't represent losslessly as-is
+                extra = extra or {}
+                extra[name] = value
+                setattr(record, name, MISSING)
+                continue
+            setattr(record, name, converted)
+        unknown = data.keys() - cls._names_set
+        if unknown:
+            extra = extra or {}
+            # Original key order, so to_dict() puts them back the same way
+            for key, value in data.items():
+                if key in unknown:
+                    extra[key] = value
+        record.extra = extra
+        return record
+
+    def to_dict(self) -> Dict:
+        result = {}
+        extra = self.extra
+        for name, _, to_value, _ in self._codecs:
+            value = getattr(self, name)
+            if value is MISSING:
+                if extra is not None and name in extra:
+                    result[name] = extra[name]
+                continue
+            result[name] = None if value is None else to_value(value)
+        if extra is not None:
+            for key, value in extra.items():
+                if key not in result:
+                    result[key] = value
+        return result
+
+    def update(self, values: Dict) -> None:
+        """dict.update-style change, converting values as from_dict does."""
+        changed = type(self).from_dict({**self.to_dict(), **values})
+        for name in self._names:
+            setattr(self, name, getattr(changed, name))
+        self.extra = changed.extra
+
+    def copy(self) -> "Record":
+        """Shallow copy; update() replaces values instead of changing them, so this is independent."""
+        record = type(self).__new__(type(self))
+        for name in self._names:
+            setattr(record, name, getattr(self, name))
+        record.extra = self.extra
+        return record
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """dict.get-style access returning the public (dict) value."""
+        if name in self._names:
+            value = getattr(self, name)
+            if value is not MISSING:
+                kind_out = self._codecs[self._names.index(name)][2]
+                return None if value is None else kind_out(value)
+        if self.extra is not None:
+            return self.extra.get(name, default)
+        return default
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class User(Record):
+    FIELDS = (
+        ("telegram_id", "id"), ("username", "id"), ("first_name", "value"), ("last_name", "value"),
+        ("status", "id"), ("password", "value"), ("auth_type", "id"),
+        ("created_at", "ts"), ("updated_at", "ts"),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+
+
+class Session(Record):
+    FIELDS = (
+        ("id", "id"), ("user_id", "id"), ("date", "date"), ("start_time", "hhmm"), ("end_time", "hhmm"),
+        ("status", "id"), ("total_online_minutes", "value"), ("total_office_minutes", "value"),
+        ("late_arrival_minutes", "value"), ("early_leave_minutes", "value"), ("created_at", "ts"),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+
+
+class Location(Record):
+    FIELDS = (
+        ("id", "value"), ("user_id", "id"), ("session_id", "id"), ("latitude", "value"),
+        ("longitude", "value"), ("is_inside_office", "value"), ("timestamp", "ts"),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+
+
+class Report(Record):
+    FIELDS = (
+        ("id", "value"), ("user_id", "id"), ("date", "date"), ("content_hash", "value"), ("content_length", "value"),
+        ("submitted_at", "ts"),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+
+
+def from_dicts(cls, items: Iterable[Dict]) -> List[Record]:
+    from_dict = cls.from_dict
+    return [from_dict(item) for item in items]
+
+
+def to_dicts(records: Iterable[Record]) -> List[Dict]:
+    return [record.to_dict() for record in records]
+
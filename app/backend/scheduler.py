@@ -0,0 +1,213 @@
+"""Background job scheduler started from the FastAPI lifespan."""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from config import config
+from database import db, REPORTS_FILE, SCHEDULER_FILE
+from blobstore import blobs
+import services
+
+try:
+    import fcntl
+except ImportError:  # Windows: lock file is not enforced between workers
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 30
+LOCK_FILE = ".scheduler.lock"
+
+
+class Every:
+    """Fixed interval, aligned to the epoch so every worker computes the same slots."""
+
+    def __init__(self, minutes: int):
+        self.seconds = minutes * 60
+
+    def last_slot(self, now: datetime) -> datetime:
+        ts = int(now.timestamp())
+        return datetime.fromtimestamp(ts - ts % self.seconds)
+
+
+class Daily:
+    """Once a day at a fixed time ("HH:MM")."""
+
+    def __init__(self, at: str):
+        self.at = datetime.strptime(at, "%H:%M").time()
+
+    def last_slot(self, now: datetime) -> datetime:
+        slot = datetime.combine(now.date(), self.at)
+        if slot > now:
+            slot -= timedelta(days=1)
+        return slot
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], object]
+    schedule: object
+    last_slot: Optional[str] = None
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0
+    last_started_at: Optional[str] = None
+    last_duration_ms: float = 0.0
+    total_duration_ms: float = 0.0
+    max_duration_ms: float = 0.0
+    last_result: object = None
+    last_error: Optional[str] = None
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "last_slot": self.last_slot,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": round(self.last_duration_ms, 2),
+            "avg_duration_ms": round(self.total_duration_ms / self.runs, 2) if self.runs else 0,
+            "max_duration_ms": round(self.max_duration_ms, 2),
+            "last_result": self.last_result,
+            "last_error": self.last_error
+        }
+
+
+class FileLock:
+    """Non-blocking exclusive lock on a file in DATA_DIR, shared by all workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self) -> bool:
+        self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            os.close(self._fd)
+            self._fd = None
+            return False
+
+    def release(self):
+        if self._fd is not None:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: List[Job] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_job(self, name: str, func: Callable[[], object], schedule) -> Job:
+        job = Job(name=name, func=func, schedule=schedule)
+        self.jobs.append(job)
+        return job
+
+    def _run_due(self) -> None:
+        """Run every due job once per slot. Called in a worker thread."""
+        now = datetime.now()
+        due = [(job, job.schedule.last_slot(now).isoformat()) for job in self.jobs]
+        due = [(job, slot) for job, slot in due if job.last_slot is None or slot > job.last_slot]
+        if not due:
+            return
+
+        lock = FileLock(db.data_dir / LOCK_FILE)
+        if not lock.acquire():
+            # Another worker is running jobs right now
+            return
+        try:
+            # The state file is the source of truth across workers
+            state = db.read_single(SCHEDULER_FILE) or {}
+            for job, slot in due:
+                if state.get(job.name, "") >= slot:
+                    job.last_slot = state[job.name]
+                    job.skipped += 1
+                    continue
+                self._execute(job)
+                job.last_slot = state[job.name] = slot
+                db.write_single(SCHEDULER_FILE, state)
+        finally:
+            lock.release()
+
+    def _execute(self, job: Job) -> None:
+        job.last_started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        try:
+            job.last_result = job.func()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            logger.exception(f"Job {job.name} failed")
+        duration = (time.perf_counter() - started) * 1000
+        job.runs += 1
+        job.last_duration_ms = duration
+        job.total_duration_ms += duration
+        job.max_duration_ms = max(job.max_duration_ms, duration)
+        logger.info(f"Job {job.name} finished in {duration:.1f} ms: {job.last_result}")
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self._run_due)
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            await asyncio.sleep(TICK_SECONDS)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"Scheduler started with {len(self.jobs)} jobs")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> List[Dict]:
+        return [job.stats() for job in self.jobs]
+
+
+def compact_storage() -> Dict:
+    """Prune old raw locations, leftover temp files and unreferenced report blobs."""
+    removed_tmp = 0
+    cutoff = time.time() - 3600
+    for path in db.data_dir.glob("*.tmp"):
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed_tmp += 1
+    migrated_reports = services.migrate_report_bodies()
+    referenced = [r["content_hash"] for r in db.read(REPORTS_FILE) if r.get("content_hash")]
+    return {
+        "pruned_locations": services.prune_locations(config.LOCATION_RETENTION_DAYS),
+        "removed_tmp_files": removed_tmp,
+        "migrated_reports": migrated_reports,
+        "removed_blobs": blobs.collect(referenced)
+    }
+
+
+scheduler = Scheduler()
+# Shifts end at different times per weekday and per user, so sessions are checked periodically
+scheduler.add_job(
+    "close_stale_sessions",
+    lambda: services.close_stale_sessions(grace_minutes=config.AUTO_CLOSE_GRACE_MINUTES),
+    Every(config.AUTO_CLOSE_CHECK_MINUTES)
+)
+scheduler.add_job("build_rollups", lambda: len(services.build_daily_rollups()), Every(60))
+scheduler.add_job("compact_storage", compact_storage, Daily(config.COMPACT_STORAGE_AT))
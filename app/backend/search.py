@@ -0,0 +1,239 @@
+"""Full-text search over daily reports.
+
+Inverted index (term -> {report id: term frequency}) with BM25 ranking.
+Uzbek Cyrillic is transliterated to Latin and apostrophe variants (o', oʻ,
+g', gʻ) are folded away, so "ўқиш", "o'qish" and "oqish" match each other.
+A light suffix stripper folds common plural/case endings.
+
+The index is updated in place by `submit_report` (through `transaction`) and
+persisted to DATA_DIR/.search-index, stamped with reports.json's mtime/size,
+after a rebuild and otherwise by `flush` (with each snapshot and at shutdown),
+not on every submit. At startup it is rebuilt only if reports.json changed
+since it was saved.
+"""
+import logging
+import math
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional
+from database import db, REPORTS_FILE
+from storage_client import Transaction, file_stamp
+from blobstore import report_content
+import serialization
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = ".search-index"
+FORMAT_VERSION = 1
+PREVIEW_LENGTH = 200
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "ғ": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j", "з": "z",
+    "и": "i", "й": "y", "к": "k", "қ": "q", "л": "l", "м": "m", "н": "n", "о": "o", "ў": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "x", "ҳ": "h", "ц": "ts", "ч": "ch", "ш": "sh",
+    "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+_APOSTROPHES = "'`ʻʼ‘’"
+_TRANSLATE = str.maketrans({**_CYRILLIC, **{ch: "" for ch in _APOSTROPHES}})
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Longest first; only stripped when at least MIN_STEM letters remain
+_SUFFIXES = ("lardan", "larning", "larni", "larga", "larda", "ning", "lari", "lar", "dan", "ni", "ga", "da")
+MIN_STEM = 3
+
+
+def _stem(token: str) -> str:
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in _TOKEN.findall(text.lower().translate(_TRANSLATE))]
+
+
+def _term_counts(text: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for token in tokenize(text):
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+class ReportIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # report id -> {"user_id", "date", "length", "terms", "preview"}
+        self.docs: Dict[str, Dict] = {}
+        self.total_length = 0
+        # Changed in memory since last saved
+        self._dirty = False
+
+    def _path(self):
+        return db.data_dir / INDEX_FILE
+
+    def _add(self, report: Dict) -> None:
+        content = report_content(report) or ""
+        counts = _term_counts(content)
+        doc_id = report["id"]
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        length = sum(counts.values())
+        self.docs[doc_id] = {
+            "user_id": report.get("user_id"),
+            "date": report.get("date"),
+            "length": length,
+            "terms": list(counts),
+            "preview": content[:PREVIEW_LENGTH]
+        }
+        self.total_length += length
+
+    def _remove(self, doc_id: str) -> None:
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= doc["length"]
+
+    def _rebuild(self, reports: Iterable[Dict]) -> None:
+        self.postings, self.docs, self.total_length = {}, {}, 0
+        for report in reports:
+            if report.get("id"):
+                self._add(report)
+
+    def _save(self, stamp) -> None:
+        state = {
+            "format": FORMAT_VERSION,
+            "stamp": list(stamp),
+            "postings": self.postings,
+            "docs": self.docs,
+            "total_length": self.total_length
+        }
+        fmt = serialization.MSGPACK if serialization.msgpack_available() else serialization.JSON_COMPACT
+        path = self._path()
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temp_path.write_bytes(serialization.encode(state, fmt))
+        temp_path.replace(path)
+
+    def _load_saved(self) -> bool:
+        try:
+            state = serialization.decode(self._path().read_bytes())
+        except (OSError, serialization.DecodeError):
+            return False
+        if state.get("format") != FORMAT_VERSION or tuple(state.get("stamp", ())) != file_stamp(db.data_dir / REPORTS_FILE):
+            return False
+        self.postings = state["postings"]
+        self.docs = state["docs"]
+        self.total_length = state["total_length"]
+        self._version = db.version(REPORTS_FILE)
+        return True
+
+    def _persist(self, stamp) -> None:
+        """`stamp`: reports.json's file stamp, taken no later than the state being saved."""
+        try:
+            self._save(stamp)
+            self._dirty = False
+        except OSError as e:
+            logger.error(f"Could not persist search index: {e}")
+
+    def _ensure(self) -> None:
+        stamp = file_stamp(db.data_dir / REPORTS_FILE)
+        version = db.version(REPORTS_FILE)
+        if version == self._version:
+            return
+        if self._version is None and self._load_saved():
+            return
+        self._rebuild(db.read(REPORTS_FILE))
+        self._version = version
+        self._persist(stamp)
+        logger.info(f"Report search index rebuilt: {len(self.docs)} reports, {len(self.postings)} terms")
+
+    def warm(self) -> int:
+        with self._lock:
+            self._ensure()
+            return len(self.docs)
+
+    @contextmanager
+    def transaction(self) -> Iterator[Transaction]:
+        """db.transaction on reports.json; reports it appends or updates are re-indexed."""
+        with self._lock:
+            with db.transaction([REPORTS_FILE]) as tx:
+                yield tx
+            if REPORTS_FILE not in tx.dirty:
+                return
+            if not (tx.ok and self._version is not None and tx.before[REPORTS_FILE] == self._version):
+                # Not loaded yet, or changed elsewhere: rebuild on next search
+                self._version = None
+                return
+            for op in tx.ops:
+                if op["op"] == "write":
+                    self._rebuild(tx.read(REPORTS_FILE))
+                    continue
+                report = op["item"] if op["op"] == "append" else tx.find_one(REPORTS_FILE, op["key"], op["value"])
+                if report is not None:
+                    self._remove(report["id"])
+                    self._add(report)
+            self._version = tx.after[REPORTS_FILE]
+            self._dirty = True
+
+    def flush(self) -> bool:
+        """Save the index if it changed since last saved and is current; True if saved."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            # Stamp first: if the file changes after it, the version check below fails
+            stamp = file_stamp(db.data_dir / REPORTS_FILE)
+            if db.version(REPORTS_FILE) != self._version:
+                # Behind reports.json: rebuilt and saved on next use
+                self._dirty = False
+                return False
+            self._persist(stamp)
+            return True
+
+    def search(self, query: str, start_date: str = None, end_date: str = None,
+               user_id: Optional[Hashable] = None, offset: int = 0, limit: int = 20) -> Dict:
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            self._ensure()
+            n = len(self.docs)
+            avg_length = self.total_length / n if n else 0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    doc = self.docs[doc_id]
+                    if start_date and doc["date"] < start_date:
+                        continue
+                    if end_date and doc["date"] > end_date:
+                        continue
+                    if user_id is not None and doc["user_id"] != user_id:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / avg_length) if avg_length else BM25_K1
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            # Best score first, newer reports first on ties
+            ranked = sorted(scores.items(), key=lambda item: (item[1], self.docs[item[0]]["date"] or ""), reverse=True)
+            page = ranked[offset:offset + limit]
+            results = [{
+                "id": doc_id,
+                "user_id": self.docs[doc_id]["user_id"],
+                "date": self.docs[doc_id]["date"],
+                "score": round(score, 4),
+                "preview": self.docs[doc_id]["preview"]
+            } for doc_id, score in page]
+        return {"query": query, "terms": terms, "total": len(ranked), "offset": offset, "limit": limit, "results": results}
+
+
+report_index = ReportIndex()
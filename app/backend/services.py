@@ -1,36 +1,41 @@
 """Business logic services."""
 import math
+import random
+import string
 import uuid
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from database import db, get_settings, SESSIONS_FILE, LOCATIONS_FILE, REPORTS_FILE, USERS_FILE
+from datetime import date, datetime, time, timedelta
+from typing import Any, List, Dict, Optional, Tuple
+import charts
+import tracking
+import trajectory
+from indexes import sessions_index
+from search import report_index
+from blobstore import blobs, report_content
+from workcalendar import calendars
+from database import db, get_settings, retry_conflicts, SESSIONS_FILE, LOCATIONS_FILE, REPORTS_FILE, USERS_FILE, ROLLUPS_FILE
 
 
-def is_work_hours() -> bool:
-    """Check if current time is within work hours."""
-    settings = get_settings()
-    now = datetime.now().strftime("%H:%M")
-    return settings["work_start"] <= now <= settings["work_end"]
+def is_work_hours(user_id: Any = None, now: datetime = None) -> bool:
+    """Check if `now` is within the user's shift (lunch included)."""
+    return calendars.get(user_id).on_shift(now or datetime.now())
 
 
-def calculate_late_minutes(start_time: str) -> int:
-    """Calculate late arrival minutes."""
-    settings = get_settings()
-    work_start = datetime.strptime(settings["work_start"], "%H:%M")
-    actual_start = datetime.strptime(start_time, "%H:%M")
-    if actual_start > work_start:
-        return int((actual_start - work_start).total_seconds() / 60)
-    return 0
+def shift_day(user_id: Any = None, now: datetime = None) -> str:
+    """Date (YYYY-MM-DD) of the user's shift at `now`; overnight shifts keep their start date."""
+    return calendars.get(user_id).shift_day(now or datetime.now()).strftime("%Y-%m-%d")
 
 
-def calculate_early_leave(end_time: str) -> int:
-    """Calculate early leave minutes."""
-    settings = get_settings()
-    work_end = datetime.strptime(settings["work_end"], "%H:%M")
-    actual_end = datetime.strptime(end_time, "%H:%M")
-    if actual_end < work_end:
-        return int((work_end - actual_end).total_seconds() / 60)
-    return 0
+def calculate_late_minutes(started: datetime, user_id: Any = None) -> int:
+    """Working minutes (lunch excluded) between the shift start and `started`."""
+    calendar = calendars.get(user_id)
+    return calendar.late_minutes(calendar.shift_day(started), started)
+
+
+def calculate_early_leave(ended: datetime, user_id: Any = None, day: str = None) -> int:
+    """Working minutes between `ended` and the end of the shift that started on `day`."""
+    calendar = calendars.get(user_id)
+    day = date.fromisoformat(day) if day else calendar.shift_day(ended)
+    return calendar.early_leave_minutes(day, ended)
 
 
 def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
@@ -51,66 +56,126 @@ def is_inside_geofence(lat: float, lng: float) -> bool:
     return distance <= geofence.get("radius_meters", 100)
 
 
-# Session functions
-def get_today_session(user_id: int) -> Optional[Dict]:
-    today = datetime.now().strftime("%Y-%m-%d")
-    sessions = db.find_many(SESSIONS_FILE, {"user_id": user_id, "date": today})
-    return sessions[0] if sessions else None
+# User functions
+def generate_password() -> str:
+    return ''.join(random.choices(string.digits, k=5))
 
 
-def start_session(user_id: int) -> Optional[Dict]:
-    if not is_work_hours():
-        return None
-    
-    existing = get_today_session(user_id)
-    if existing:
-        if existing["status"] != "online":
-            db.update(SESSIONS_FILE, "id", existing["id"], {"status": "online"})
-            existing["status"] = "online"
-        return existing
+def set_user_statuses(targets: List[Tuple[str, Any]], status: str) -> Optional[List[Optional[Dict]]]:
+    """Set `status` for (key, value) targets in one read-modify-write of users.json.
     
-    current_time = datetime.now().strftime("%H:%M")
-    session = {
-        "id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "date": datetime.now().strftime("%Y-%m-%d"),
-        "start_time": current_time,
-        "end_time": None,
-        "status": "online",
-        "total_online_minutes": 0,
-        "total_office_minutes": 0,
-        "late_arrival_minutes": calculate_late_minutes(current_time),
-        "early_leave_minutes": 0,
-        "created_at": datetime.now().isoformat()
-    }
-    db.append(SESSIONS_FILE, session)
-    return session
+    Users becoming active without a password get a generated one. Returns the
+    updated users in target order (None where not found), or None if the write failed.
+    """
+    now = datetime.now().isoformat()
+    changes = []
+    for key, value in targets:
+        change = {"key": key, "value": value, "set": {"status": status, "updated_at": now}}
+        if status == "active":
+            change["set_missing"] = {"password": generate_password()}
+        changes.append(change)
+    return db.update_many(USERS_FILE, changes)
+
+
+# Session functions
+def get_today_session(user_id: int, now: datetime = None) -> Optional[Dict]:
+    today = shift_day(user_id, now)
+    session = sessions_index.latest(user_id)
+    return session if session and session["date"] == today else None
 
 
-def end_session(user_id: int) -> Optional[Dict]:
-    session = get_today_session(user_id)
-    if not session:
+def _today_session(tx, user_id: int, today: str) -> Optional[Dict]:
+    """The user's latest session for `today`, read through a transaction."""
+    return next((s for s in reversed(tx.read(SESSIONS_FILE)) if s.get("user_id") == user_id and s.get("date") == today), None)
+
+
+@retry_conflicts
+def start_session(user_id: int, now: datetime = None) -> Optional[Dict]:
+    now = now or datetime.now()
+    if not is_work_hours(user_id, now):
         return None
     
-    current_time = datetime.now().strftime("%H:%M")
+    today = shift_day(user_id, now)
+    with sessions_index.transaction([SESSIONS_FILE]) as tx:
+        existing = _today_session(tx, user_id, today)
+        if existing:
+            if existing["status"] != "online":
+                tx.update(SESSIONS_FILE, "id", existing["id"], {"status": "online"})
+            return dict(existing)
+        
+        current_time = now.strftime("%H:%M")
+        session = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "date": today,
+            "start_time": current_time,
+            "end_time": None,
+            "status": "online",
+            "total_online_minutes": 0,
+            "total_office_minutes": 0,
+            "late_arrival_minutes": calculate_late_minutes(now, user_id),
+            "early_leave_minutes": 0,
+            "created_at": now.isoformat()
+        }
+        tx.append(SESSIONS_FILE, session)
+    return dict(session)
+
+
+@retry_conflicts
+def end_session(user_id: int, now: datetime = None) -> Optional[Dict]:
+    now = now or datetime.now()
+    today = shift_day(user_id, now)
+    with sessions_index.transaction([LOCATIONS_FILE, SESSIONS_FILE]) as tx:
+        session = _today_session(tx, user_id, today)
+        if not session:
+            return None
+        close_session(tx, session, now)
+    return dict(session)
+
+
+def close_session(tx, session: Dict, ended: datetime, auto_closed: bool = False) -> Dict:
+    """Close `session` (an item of `tx`, which must include locations) within the transaction."""
+    # Time since the latest point counts up to `ended`, no further
+    online_minutes, office_minutes = tracking.session_minutes(
+        tx.find_many(LOCATIONS_FILE, {"session_id": session["id"]}), ended)
     updates = {
         "status": "offline",
-        "end_time": current_time,
-        "early_leave_minutes": calculate_early_leave(current_time)
+        "total_online_minutes": online_minutes,
+        "total_office_minutes": office_minutes,
+        "end_time": ended.strftime("%H:%M"),
+        "early_leave_minutes": calculate_early_leave(ended, session.get("user_id"), session["date"])
     }
-    db.update(SESSIONS_FILE, "id", session["id"], updates)
-    session.update(updates)
+    if auto_closed:
+        updates["auto_closed"] = True
+    tx.update(SESSIONS_FILE, "id", session["id"], updates)
     return session
 
 
+@retry_conflicts
+def close_stale_sessions(now: datetime = None, grace_minutes: int = 0) -> int:
+    """Close sessions still online `grace_minutes` after the end of their own shift, at the shift end."""
+    now = now or datetime.now()
+    grace = timedelta(minutes=grace_minutes)
+    closed = 0
+    with sessions_index.transaction([LOCATIONS_FILE, SESSIONS_FILE]) as tx:
+        for session in tx.find_many(SESSIONS_FILE, {"status": "online"}):
+            day = date.fromisoformat(session["date"])
+            bounds = calendars.get(session.get("user_id")).boundaries(day)
+            # Sessions on days off close at the end of the day
+            ended = bounds["work_end"] if bounds else datetime.combine(day, time(23, 59))
+            if now > ended + grace:
+                close_session(tx, session, ended, auto_closed=True)
+                closed += 1
+    return closed
+
+
 def get_sessions_by_range(user_id: int, start_date: str, end_date: str) -> List[Dict]:
-    all_sessions = db.find_many(SESSIONS_FILE, {"user_id": user_id})
-    return [s for s in all_sessions if start_date <= s["date"] <= end_date]
+    return sessions_index.range(user_id, start_date, end_date)
 
 
 # Location functions
-def record_location(user_id: int, session_id: str, lat: float, lng: float) -> Optional[Dict]:
-    if not is_work_hours():
+def record_location(user_id: int, session_id: str, lat: float, lng: float, event_id: str = None) -> Optional[Dict]:
+    if not is_work_hours(user_id):
         return None
     
     location = {
@@ -122,48 +187,189 @@ def record_location(user_id: int, session_id: str, lat: float, lng: float) -> Op
         "is_inside_office": is_inside_geofence(lat, lng),
         "timestamp": datetime.now().isoformat()
     }
-    db.append(LOCATIONS_FILE, location)
+    if event_id:
+        location["event_id"] = event_id
+    location["interval_seconds"] = get_tracking_advice(user_id, session_id, pending=location)["interval_seconds"]
+    _store_location(location)
+    # Only points that made it to storage steer later advice
+    tracking.recent_points.add(user_id, location)
+    return location
+
+
+@retry_conflicts
+def _store_location(location: Dict) -> None:
+    """Append `location` and update its session's times."""
+    with sessions_index.transaction([LOCATIONS_FILE, SESSIONS_FILE]) as tx:
+        tx.append(LOCATIONS_FILE, location)
+        locations = tx.find_many(LOCATIONS_FILE, {"session_id": location["session_id"]})
+        online_minutes, office_minutes = tracking.session_minutes(locations, datetime.now())
+        tx.update(SESSIONS_FILE, "id", location["session_id"], {
+            "total_online_minutes": online_minutes,
+            "total_office_minutes": office_minutes
+        })
+
+
+def get_tracking_advice(user_id: int, session_id: str = None, now: datetime = None, pending: Dict = None) -> Dict:
+    """Whether to track now and how many seconds until the next ping; `pending` is a point
+    being recorded, counted as the latest one."""
+    now = now or datetime.now()
+    calendar = calendars.get(user_id)
+    if not calendar.on_shift(now):
+        return {"should_track": False, "interval_seconds": tracking.next_work_start(now, calendar.next_shift_start(now)),
+                "reason": "outside_work_hours"}
     
-    # Update session times
-    locations = db.find_many(LOCATIONS_FILE, {"session_id": session_id})
-    online_minutes = len(locations)
-    office_minutes = sum(1 for loc in locations if loc["is_inside_office"])
-    db.update(SESSIONS_FILE, "id", session_id, {
-        "total_online_minutes": online_minutes,
-        "total_office_minutes": office_minutes
-    })
+    settings = get_settings()
+    if session_id is None:
+        session = get_today_session(user_id, now)
+        session_id = session["id"] if session else None
+    points = tracking.recent_points.get(user_id, session_id) if session_id else []
+    if pending is not None:
+        points = (points + [pending])[-tracking.recent_points.size:]
     
-    return location
+    inside = edge_distance = moved = None
+    stationary_seconds = 0.0
+    if points:
+        latest = points[-1]
+        lat, lng = latest["latitude"], latest["longitude"]
+        geofence = settings.get("geofence", {})
+        center_distance = haversine_distance(lat, lng, geofence.get("center_lat", 0), geofence.get("center_lng", 0))
+        edge_distance = abs(center_distance - geofence.get("radius_meters", 100))
+        inside = latest.get("is_inside_office")
+        if len(points) > 1:
+            previous = points[-2]
+            moved = haversine_distance(lat, lng, previous["latitude"], previous["longitude"])
+        # How long the user has been within a few meters of the latest point
+        since = latest["timestamp"]
+        for point in reversed(points[:-1]):
+            if haversine_distance(lat, lng, point["latitude"], point["longitude"]) > tracking.STATIONARY_METERS:
+                break
+            since = point["timestamp"]
+        stationary_seconds = (now - datetime.fromisoformat(since)).total_seconds()
+    
+    interval, reason = tracking.recommend_interval(now, calendar.boundaries(calendar.shift_day(now)), inside, edge_distance, stationary_seconds, moved)
+    return {"should_track": True, "interval_seconds": interval, "reason": reason}
+
+
+def find_location_event(user_id: int, event_id: str) -> Optional[Dict]:
+    """Location already stored for this client event id, if any."""
+    found = db.find_many(LOCATIONS_FILE, {"user_id": user_id, "event_id": event_id})
+    return found[0] if found else None
+
+
+_track_cache = charts.ChartCache("session_track", max_entries=256)
+
+
+def get_session_track(session_id: str, tolerance_m: float, polyline: bool = False) -> Dict:
+    """Simplified track of a session; cached once the session is closed."""
+    session = sessions_index.get(session_id)
+    build = lambda: _build_session_track(session_id, tolerance_m, polyline)
+    if not session or session.get("status") != "offline":
+        return build()
+    # Reopening and closing again changes these, so a stale track is never served
+    version = (session.get("end_time"), session.get("total_online_minutes"))
+    return _track_cache.get_or_build((session_id, tolerance_m, polyline), version, build)
+
+
+def _build_session_track(session_id: str, tolerance_m: float, polyline: bool) -> Dict:
+    locations = sorted(db.find_many(LOCATIONS_FILE, {"session_id": session_id}), key=lambda loc: loc["timestamp"])
+    coords = [(loc["latitude"], loc["longitude"]) for loc in locations]
+    kept = [coords[i] for i in trajectory.simplify(coords, tolerance_m)]
+    result = {
+        "session_id": session_id,
+        "tolerance_m": tolerance_m,
+        "total_points": len(coords),
+        "points": len(kept),
+        "start": locations[0]["timestamp"] if locations else None,
+        "end": locations[-1]["timestamp"] if locations else None
+    }
+    if polyline:
+        result["polyline"] = trajectory.encode_polyline(kept)
+    else:
+        result["coordinates"] = [[lat, lng] for lat, lng in kept]
+    return result
+
+
+@retry_conflicts
+def prune_locations(retention_days: int, now: datetime = None) -> int:
+    """Drop raw location points older than `retention_days`; session totals are kept."""
+    if retention_days <= 0:
+        return 0
+    cutoff = ((now or datetime.now()) - timedelta(days=retention_days)).isoformat()
+    with db.transaction([LOCATIONS_FILE]) as tx:
+        locations = tx.read(LOCATIONS_FILE)
+        kept = [loc for loc in locations if loc["timestamp"] >= cutoff]
+        if len(kept) != len(locations):
+            tx.write(LOCATIONS_FILE, kept)
+    return len(locations) - len(kept)
 
 
 # Report functions
+def report_view(report: Dict, include_content: bool = False) -> Dict:
+    """Report metadata, plus the body (loaded from the blob store) if asked for."""
+    view = {k: v for k, v in report.items() if k != "content"}
+    if "content_hash" not in report:
+        # Written before the blob store; moved by migrate_report_bodies
+        view["content_length"] = len(report.get("content") or "")
+    if include_content:
+        view["content"] = report_content(report)
+    return view
+
+
+@retry_conflicts
 def submit_report(user_id: int, content: str, date: str = None) -> Dict:
     if not date:
         date = datetime.now().strftime("%Y-%m-%d")
     
-    existing = db.find_many(REPORTS_FILE, {"user_id": user_id, "date": date})
-    if existing:
-        db.update(REPORTS_FILE, "id", existing[0]["id"], {
-            "content": content,
-            "submitted_at": datetime.now().isoformat()
-        })
-        existing[0]["content"] = content
-        return existing[0]
-    
-    report = {
-        "id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "date": date,
-        "content": content,
-        "submitted_at": datetime.now().isoformat()
-    }
-    db.append(REPORTS_FILE, report)
-    return report
+    body = {"content_hash": blobs.put(content), "content_length": len(content)}
+    with report_index.transaction() as tx:
+        existing = tx.find_many(REPORTS_FILE, {"user_id": user_id, "date": date})
+        if existing:
+            tx.update(REPORTS_FILE, "id", existing[0]["id"], {**body, "submitted_at": datetime.now().isoformat()})
+            report = report_view(existing[0])
+        else:
+            report = {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "date": date,
+                **body,
+                "submitted_at": datetime.now().isoformat()
+            }
+            tx.append(REPORTS_FILE, report)
+            report = dict(report)
+    return {**report, "content": content}
 
 
-def get_user_report(user_id: int, date: str) -> Optional[Dict]:
+def search_reports(query: str, start_date: str = None, end_date: str = None, user_id: int = None,
+                   page: int = 1, page_size: int = 20) -> Dict:
+    return report_index.search(query, start_date, end_date, user_id, (page - 1) * page_size, page_size)
+
+
+def get_user_report(user_id: int, date: str, include_content: bool = False) -> Optional[Dict]:
     reports = db.find_many(REPORTS_FILE, {"user_id": user_id, "date": date})
-    return reports[0] if reports else None
+    return report_view(reports[0], include_content) if reports else None
+
+
+def list_reports(filters: Dict, include_content: bool = False) -> List[Dict]:
+    return [report_view(r, include_content) for r in db.find_many(REPORTS_FILE, filters)]
+
+
+@retry_conflicts
+def migrate_report_bodies() -> int:
+    """Move inline report bodies (written before the blob store) into blobs."""
+    with report_index.transaction() as tx:
+        reports = tx.read(REPORTS_FILE)
+        migrated = 0
+        for report in reports:
+            if "content" in report:
+                content = report.pop("content") or ""
+                # An overwrite since then already points at the newer body
+                if "content_hash" not in report:
+                    report["content_hash"] = blobs.put(content)
+                    report["content_length"] = len(content)
+                migrated += 1
+        if migrated:
+            tx.write(REPORTS_FILE, reports)
+    return migrated
 
 
 # Statistics functions
@@ -175,6 +381,16 @@ def get_user_statistics(user_id: int, start_date: str, end_date: str) -> Dict:
     total_late = sum(s.get("late_arrival_minutes", 0) for s in sessions)
     total_early = sum(s.get("early_leave_minutes", 0) for s in sessions)
     
+    # Scheduled days and minutes (lunch and holidays excluded) in the range
+    calendar = calendars.get(user_id)
+    start_ord, end_ord = charts.date_ordinal(start_date), charts.date_ordinal(end_date)
+    work_days = expected_minutes = 0
+    if start_ord is not None and end_ord is not None:
+        first, last = date.fromordinal(start_ord), date.fromordinal(end_ord)
+        work_days = calendar.work_days(first, last)
+        expected_minutes = calendar.working_minutes(
+            datetime.combine(first, time()), datetime.combine(last + timedelta(days=1), time()))
+    
     return {
         "user_id": user_id,
         "start_date": start_date,
@@ -184,42 +400,73 @@ def get_user_statistics(user_id: int, start_date: str, end_date: str) -> Dict:
         "total_office_minutes": total_office,
         "total_late_minutes": total_late,
         "total_early_leave_minutes": total_early,
+        "work_days": work_days,
+        "expected_work_minutes": expected_minutes,
         "average_online_minutes": total_online / len(sessions) if sessions else 0,
         "attendance_rate": (total_office / total_online * 100) if total_online > 0 else 0
     }
 
 
-def get_chart_data(user_id: int, start_date: str, end_date: str) -> Dict:
-    sessions = get_sessions_by_range(user_id, start_date, end_date)
-    session_by_date = {s["date"]: s for s in sessions}
-    
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    
-    labels, online_data, office_data, late_data = [], [], [], []
+def build_daily_rollups() -> List[Dict]:
+    """Aggregate all sessions into one summary row per date."""
+    rollups: Dict[str, Dict] = {}
+    for s in db.read(SESSIONS_FILE):
+        day = rollups.setdefault(s["date"], {
+            "date": s["date"],
+            "users": 0,
+            "late_users": 0,
+            "total_online_minutes": 0,
+            "total_office_minutes": 0,
+            "total_late_minutes": 0,
+            "total_early_leave_minutes": 0
+        })
+        day["users"] += 1
+        day["late_users"] += 1 if s.get("late_arrival_minutes", 0) > 0 else 0
+        day["total_online_minutes"] += s.get("total_online_minutes", 0)
+        day["total_office_minutes"] += s.get("total_office_minutes", 0)
+        day["total_late_minutes"] += s.get("late_arrival_minutes", 0)
+        day["total_early_leave_minutes"] += s.get("early_leave_minutes", 0)
+    result = sorted(rollups.values(), key=lambda r: r["date"])
+    db.write(ROLLUPS_FILE, result)
+    return result
+
+
+def get_chart_data(user_id: int, start_date: str, end_date: str, granularity: str = charts.DAY) -> Dict:
+    """Chart series for a date range, summed per day, week or month."""
+    start_ord = charts.date_ordinal(start_date)
+    end_ord = charts.date_ordinal(end_date)
+    if start_ord is None or end_ord is None:
+        raise ValueError("Dates must be YYYY-MM-DD")
+    granularity = charts.resolve_granularity(granularity, end_ord - start_ord + 1)
+    key = (user_id, start_ord, end_ord, granularity)
+    # Version is taken before reading, so a concurrent write can only cause a miss later
+    version = db.version(SESSIONS_FILE)
+    return charts.chart_cache.get_or_build(
+        key, version, lambda: _build_chart_data(user_id, start_date, end_date, start_ord, end_ord, granularity)
+    )
+
+
+def _build_chart_data(user_id: int, start_date: str, end_date: str,
+                      start_ord: int, end_ord: int, granularity: str) -> Dict:
+    labels, index = charts.bucket_table(start_ord, end_ord, granularity) if start_ord <= end_ord else ((), ())
     
-    current = start
-    while current <= end:
-        date_str = current.strftime("%Y-%m-%d")
-        labels.append(date_str)
-        
-        session = session_by_date.get(date_str)
-        if session:
-            online_data.append(session.get("total_online_minutes", 0))
-            office_data.append(session.get("total_office_minutes", 0))
-            late_data.append(session.get("late_arrival_minutes", 0))
-        else:
-            online_data.append(0)
-            office_data.append(0)
-            late_data.append(0)
-        
-        current += timedelta(days=1)
+    offsets, online, office, late = [], [], [], []
+    for session in get_sessions_by_range(user_id, start_date, end_date):
+        ordinal = charts.date_ordinal(session.get("date"))
+        if ordinal is None or not start_ord <= ordinal <= end_ord:
+            continue
+        offsets.append(ordinal - start_ord)
+        online.append(session.get("total_online_minutes", 0))
+        office.append(session.get("total_office_minutes", 0))
+        late.append(session.get("late_arrival_minutes", 0))
     
+    buckets = len(labels)
     return {
-        "labels": labels,
+        "labels": list(labels),
+        "granularity": granularity,
         "datasets": [
-            {"label": "Onlayn vaqt (daqiqa)", "data": online_data, "borderColor": "#4CAF50"},
-            {"label": "Ofisda vaqt (daqiqa)", "data": office_data, "borderColor": "#2196F3"},
-            {"label": "Kechikish (daqiqa)", "data": late_data, "borderColor": "#F44336"}
+            {"label": "Onlayn vaqt (daqiqa)", "data": charts.bucket_sums(index, buckets, offsets, online), "borderColor": "#4CAF50"},
+            {"label": "Ofisda vaqt (daqiqa)", "data": charts.bucket_sums(index, buckets, offsets, office), "borderColor": "#2196F3"},
+            {"label": "Kechikish (daqiqa)", "data": charts.bucket_sums(index, buckets, offsets, late), "borderColor": "#F44336"}
         ]
     }
@@ -0,0 +1,194 @@
+"""Warm start: periodic snapshots of in-memory state, restored at startup.
+
+The snapshot (DATA_DIR/.state.snapshot, pickle) holds the session index, chart
+cache, recent location points and dedupe state, stamped with the mtime/size
+of the files they were built from. At startup:
+
+- session index and chart cache are adopted only if sessions.json is unchanged
+  (otherwise they rebuild lazily on first use, as before);
+- recent points and dedupe state are loaded, then locations written after the
+  snapshot are replayed in a background thread, so startup time does not grow
+  with history.
+
+The report search index keeps its own file; it is flushed with each snapshot
+and at shutdown.
+
+Phase timings are logged. SNAPSHOT_INTERVAL_MINUTES=0 disables snapshots.
+"""
+import asyncio
+import logging
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from config import config
+from database import db, SESSIONS_FILE, LOCATIONS_FILE
+from storage_client import file_stamp
+from indexes import sessions_index
+from search import report_index
+import charts
+import dedupe
+import tracking
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = ".state.snapshot"
+FORMAT_VERSION = 2
+
+
+def _path():
+    return db.data_dir / SNAPSHOT_FILE
+
+
+def _stamp(filename: str):
+    return file_stamp(db.data_dir / filename)
+
+
+def save() -> Dict:
+    """Write a snapshot of the current state; returns size and timing."""
+    started = time.perf_counter()
+    report_index.flush()
+    sessions_version = db.version(SESSIONS_FILE)
+    state = {
+        "format": FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "stamps": {SESSIONS_FILE: _stamp(SESSIONS_FILE), LOCATIONS_FILE: _stamp(LOCATIONS_FILE)},
+        "session_index": sessions_index.export_state(),
+        "chart_cache": charts.chart_cache.export_state(sessions_version),
+        "recent_points": tracking.recent_points.export_state(),
+        "dedupe": dedupe.locations.export_state()
+    }
+    raw = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    path = _path()
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temp_path.write_bytes(raw)
+    temp_path.replace(path)
+    return {"bytes": len(raw), "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _load() -> Optional[Dict]:
+    path = _path()
+    if not path.exists():
+        return None
+    try:
+        state = pickle.loads(path.read_bytes())
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+    if not isinstance(state, dict) or state.get("format") != FORMAT_VERSION:
+        logger.info("Ignoring snapshot from another format version")
+        return None
+    return state
+
+
+def replay_locations(since: str) -> int:
+    """Feed locations newer than `since` into recent points and dedupe."""
+    replayed = 0
+    try:
+        locations = [loc for loc in db.read(LOCATIONS_FILE) if loc.get("timestamp", "") >= since]
+        locations.sort(key=lambda loc: loc["timestamp"])
+        for loc in locations:
+            tracking.recent_points.add(loc.get("user_id"), loc)
+            if loc.get("event_id"):
+                dedupe.locations.remember(loc.get("user_id"), loc["event_id"], loc)
+            replayed += 1
+    finally:
+        dedupe.locations.complete = True
+    return replayed
+
+
+def warm_start() -> Dict:
+    """Restore what the snapshot allows; returns phase timings in ms."""
+    phases: Dict[str, float] = {}
+    clock = time.perf_counter()
+
+    def phase(name: str):
+        nonlocal clock
+        now = time.perf_counter()
+        phases[name] = round((now - clock) * 1000, 2)
+        clock = now
+
+    state = _load()
+    phase("load_snapshot")
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    since = today
+    if state:
+        stamps = state["stamps"]
+        if stamps.get(SESSIONS_FILE) == _stamp(SESSIONS_FILE):
+            if state["session_index"] is not None:
+                sessions_index.load_state(state["session_index"])
+            charts.chart_cache.load_state(state["chart_cache"], db.version(SESSIONS_FILE))
+        phase("restore_sessions")
+
+        tracking.recent_points.load_state(state["recent_points"])
+        dedupe.locations.load_state(state["dedupe"])
+        phase("restore_locations")
+        if stamps.get(LOCATIONS_FILE) == _stamp(LOCATIONS_FILE):
+            since = None
+        else:
+            since = max(state["created_at"], today)
+
+    if since is not None:
+        # Until the replay is done, every event id is checked against storage
+        dedupe.locations.complete = False
+
+        def run():
+            started = time.perf_counter()
+            try:
+                count = replay_locations(since)
+                logger.info(f"Warm start: replayed {count} locations since {since} "
+                            f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+            except Exception:
+                logger.exception("Warm start: location replay failed")
+
+        threading.Thread(target=run, name="snapshot-replay", daemon=True).start()
+    phase("start_replay")
+
+    logger.info(
+        f"Warm start ({'snapshot' if state else 'no snapshot'}): "
+        + ", ".join(f"{name} {ms} ms" for name, ms in phases.items())
+    )
+    return phases
+
+
+async def snapshot_loop(interval_minutes: float) -> None:
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        try:
+            result = await asyncio.to_thread(save)
+            logger.info(f"Snapshot saved: {result['bytes']} bytes in {result['ms']} ms")
+        except Exception:
+            logger.exception("Snapshot failed")
+
+
+class SnapshotService:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if config.SNAPSHOT_INTERVAL_MINUTES > 0:
+            self._task = asyncio.create_task(snapshot_loop(config.SNAPSHOT_INTERVAL_MINUTES))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            try:
+                await asyncio.to_thread(report_index.flush)
+            except Exception:
+                logger.exception("Search index flush failed")
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await asyncio.to_thread(save)
+        except Exception:
+            logger.exception("Final snapshot failed")
+
+
+snapshots = SnapshotService()
@@ -0,0 +1,278 @@
+"""Client for the storage daemon (storage_server.py).
+
+Frames are a 4-byte big-endian length followed by a payload in the data file
+codec (MessagePack when available, compact JSON otherwise; the receiver
+auto-detects). Requests are `{"op", "file", ...args}`, replies are
+`{"ok": true, "result": ...}` or `{"ok": false, "error": "..."}`.
+"""
+import functools
+import os
+import queue
+import random
+import socket
+import struct
+import time
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+from config import config
+from metrics import DB_OP_LATENCY
+import serialization
+
+HEADER = struct.Struct(">I")
+MAX_FRAME = 256 * 1024 * 1024
+WIRE_FORMAT = serialization.MSGPACK if serialization.msgpack_available() else serialization.JSON_COMPACT
+
+
+# Runs of a function whose RemoteDB transaction keeps losing to other writers
+TRANSACTION_ATTEMPTS = 5
+
+
+class StorageError(RuntimeError):
+    pass
+
+
+class TransactionConflict(StorageError):
+    """A file the transaction read was changed by another client before the commit."""
+
+    def __init__(self, files: List[str]):
+        super().__init__(f"Changed by another client: {', '.join(files)}")
+        self.files = files
+
+
+def retry_conflicts(func: Callable) -> Callable:
+    """Run `func` again when one of its transactions conflicts (only RemoteDB's can).
+
+    The whole function is re-run, so everything it does before the transaction
+    must be safe to repeat.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, TRANSACTION_ATTEMPTS):
+            try:
+                return func(*args, **kwargs)
+            except TransactionConflict:
+                # Jitter, so the clients that collided don't collide again
+                time.sleep(random.uniform(0, 0.005 * attempt))
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def pack(message: Dict) -> bytes:
+    payload = serialization.encode(message, WIRE_FORMAT)
+    return HEADER.pack(len(payload)) + payload
+
+
+def unpack(payload: bytes) -> Dict:
+    return serialization.decode(payload)
+
+
+class Transaction:
+    """Working copy of a few data files for `db.transaction`.
+
+    Each file is loaded at most once, on first use. Changes are applied to the
+    working copy and recorded in `ops` as storage requests, which is what gets
+    committed (JsonDB: one write per changed file; RemoteDB: one batch) and
+    what indexes replay to stay in step. Lists returned by `read`/`find_*` are
+    live: change them only through `append`/`update`/`write`.
+    """
+
+    def __init__(self, filenames: Iterable[str], load: Callable[[str], Any]):
+        self.filenames = tuple(filenames)
+        self._load = load
+        self._data: Dict[str, Any] = {}
+        self.ops: List[Dict] = []
+        # db.version of each file when the transaction started / after commit
+        self.before: Dict[str, Hashable] = {}
+        self.after: Dict[str, Hashable] = {}
+        self.ok = False
+
+    def _get(self, filename: str) -> Any:
+        if filename not in self.filenames:
+            raise ValueError(f"{filename} is not part of this transaction")
+        if filename not in self._data:
+            data = self._load(filename)
+            self._data[filename] = [] if data is None else data
+        return self._data[filename]
+
+    @property
+    def dirty(self) -> List[str]:
+        return [name for name in self.filenames if any(op["file"] == name for op in self.ops)]
+
+    def read(self, filename: str) -> List[Dict]:
+        return self._get(filename)
+
+    def find_one(self, filename: str, key: str, value: Any) -> Optional[Dict]:
+        return next((item for item in self._get(filename) if item.get(key) == value), None)
+
+    def find_many(self, filename: str, filters: Dict) -> List[Dict]:
+        return [item for item in self._get(filename) if all(item.get(k) == v for k, v in filters.items())]
+
+    def write(self, filename: str, data: List[Dict]) -> bool:
+        self._get(filename)
+        self._data[filename] = data
+        self.ops.append({"op": "write", "file": filename, "data": data})
+        return True
+
+    def append(self, filename: str, item: Dict) -> bool:
+        self._get(filename).append(item)
+        self.ops.append({"op": "append", "file": filename, "item": item})
+        return True
+
+    def update(self, filename: str, key: str, value: Any, updates: Dict) -> bool:
+        item = self.find_one(filename, key, value)
+        if item is None:
+            return False
+        item.update(updates)
+        self.ops.append({"op": "update", "file": filename, "key": key, "value": value, "updates": updates})
+        return True
+
+
+def file_stamp(path: Path) -> Tuple:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Storage server closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class ConnectionPool:
+    """Blocking Unix socket connections, reused across threads."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self._idle: "queue.LifoQueue[socket.socket]" = queue.LifoQueue(maxsize=size)
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _put(self, sock: socket.socket) -> None:
+        try:
+            self._idle.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def request(self, message: Dict) -> Any:
+        frame = pack(message)
+        sock, reused = self._get()
+        try:
+            try:
+                sock.sendall(frame)
+            except OSError:
+                if not reused:
+                    raise
+                # Idle connection went stale (daemon restarted); nothing was sent yet
+                sock.close()
+                sock = self._connect()
+                sock.sendall(frame)
+            (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+            if size > MAX_FRAME:
+                raise StorageError(f"Frame too large: {size}")
+            reply = unpack(_recv_exact(sock, size))
+        except BaseException:
+            sock.close()
+            raise
+        self._put(sock)
+        if not reply.get("ok"):
+            raise StorageError(reply.get("error", "unknown error"))
+        return reply.get("result")
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RemoteDB:
+    """JsonDB interface backed by the storage daemon."""
+
+    def __init__(self, socket_path: str, pool_size: int = 8):
+        self.data_dir = Path(config.DATA_DIR)
+        self.pool = ConnectionPool(socket_path, pool_size)
+
+    def _call(self, op: str, filename: str, **args) -> Any:
+        with DB_OP_LATENCY.time(f"remote_{op}", filename):
+            return self.pool.request({"op": op, "file": filename, **args})
+
+    def version(self, filename: str) -> Tuple:
+        """The daemon replies only after writing, so the file stamp is current."""
+        return file_stamp(self.data_dir / filename)
+
+    @contextmanager
+    def transaction(self, filenames: Iterable[str]) -> Iterator[Transaction]:
+        """Each file is read once; all changes go to the daemon as one batch.
+
+        No lock is held while the block runs. Each file is read with the
+        daemon's generation of it, and the batch carries those generations: if
+        another client changed a file the block read, nothing is applied and
+        TransactionConflict is raised (run the caller again, see
+        `retry_conflicts`). Otherwise the daemon applies the batch atomically
+        and writes each file once, as JsonDB does under its locks.
+        """
+        names = sorted(set(filenames))
+        generations: Dict[str, int] = {}
+
+        def load(name: str) -> List[Dict]:
+            reply = self._call("read_versioned", name)
+            generations[name] = reply["generation"]
+            return reply["data"]
+
+        tx = Transaction(names, load)
+        tx.before = {name: self.version(name) for name in names}
+        yield tx
+        if tx.ops:
+            with DB_OP_LATENCY.time("remote_batch", "+".join(tx.dirty)):
+                result = self.pool.request({"op": "batch", "ops": tx.ops, "expect": generations})
+            if result["conflicts"]:
+                raise TransactionConflict(result["conflicts"])
+            tx.ok = bool(result["committed"])
+        else:
+            tx.ok = True
+        tx.after = {name: self.version(name) for name in names}
+
+    def read(self, filename: str) -> List[Dict]:
+        return self._call("read", filename)
+
+    def write(self, filename: str, data: List[Dict]) -> bool:
+        return self._call("write", filename, data=data)
+
+    def read_single(self, filename: str) -> Optional[Dict]:
+        return self._call("read_single", filename)
+
+    def write_single(self, filename: str, data: Dict) -> bool:
+        return self._call("write", filename, data=data)
+
+    def append(self, filename: str, item: Dict) -> bool:
+        return self._call("append", filename, item=item)
+
+    def find_one(self, filename: str, key: str, value: Any) -> Optional[Dict]:
+        return self._call("find_one", filename, key=key, value=value)
+
+    def update(self, filename: str, key: str, value: Any, updates: Dict) -> bool:
+        return self._call("update", filename, key=key, value=value, updates=updates)
+
+    def update_many(self, filename: str, changes: List[Dict]) -> Optional[List[Optional[Dict]]]:
+        return self._call("update_many", filename, changes=changes)
+
+    def find_many(self, filename: str, filters: Dict) -> List[Dict]:
+        return self._call("find_many", filename, filters=filters)
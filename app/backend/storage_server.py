@@ -0,0 +1,309 @@
+"""Single-writer storage daemon.
+
+Owns DATA_DIR and serves JsonDB operations over a Unix domain socket, so
+several uvicorn workers and the bot can share the data files safely:
+
+    python storage_server.py                 # socket: STORAGE_SOCKET
+    STORAGE_SOCKET=/run/worker-tracker.sock uvicorn main:app --workers 4
+
+Collections are kept in memory once read. Writes are applied in memory and
+group-committed: every change that arrives within STORAGE_FLUSH_MS is written
+with a single file write, and each client gets its reply once its change is
+on disk. Encoding and writing happen in a worker thread on a copy of the
+data, one flush at a time, so the event loop keeps serving requests and files
+are written in commit order. Files changed behind the daemon's back are
+reloaded on next access.
+
+Each file has a generation, bumped on every change. A "batch" (a
+RemoteDB.transaction) carries the generations of the files it read and is
+rejected if any of them moved on.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import config
+from database import JsonDB, apply_changes
+from storage_client import HEADER, MAX_FRAME, pack, unpack
+
+logger = logging.getLogger(__name__)
+
+# Write ops a "batch" (RemoteDB.transaction) may contain
+BATCH_OPS = ("write", "append", "update")
+
+
+def _matches(item: Dict, filters: Dict) -> bool:
+    return all(item.get(k) == v for k, v in filters.items())
+
+
+def _snapshot(data: Any) -> Any:
+    """Copy of a collection that later in-memory changes (append, item.update, put) don't reach."""
+    if isinstance(data, list):
+        return [dict(item) if isinstance(item, dict) else item for item in data]
+    if isinstance(data, dict):
+        return dict(data)
+    return data
+
+
+class Store:
+    """In-memory view of DATA_DIR with group-committed writes."""
+
+    def __init__(self, db: JsonDB, flush_ms: float):
+        self.db = db
+        self.flush_delay = flush_ms / 1000
+        self._data: Dict[str, Any] = {}
+        self._stamps: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._generations: Dict[str, int] = {}
+        self._dirty: Dict[str, List[asyncio.Future]] = {}
+        # Files being written right now: their stamp is in flux, don't reload them
+        self._writing: set = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"requests": 0, "flushes": 0, "writes_batched": 0}
+
+    def _stamp(self, filename: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.db._filepath(filename))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, filename: str) -> Any:
+        if filename not in self._dirty and filename not in self._writing:
+            stamp = self._stamp(filename)
+            if filename not in self._data or stamp != self._stamps.get(filename):
+                self._data[filename] = self.db._load(filename, None)
+                self._stamps[filename] = stamp
+                self.changed(filename)
+        return self._data[filename]
+
+    def changed(self, filename: str) -> None:
+        self._generations[filename] = self._generations.get(filename, 0) + 1
+
+    def generation(self, filename: str) -> int:
+        self.get(filename)
+        return self._generations[filename]
+
+    def get_list(self, filename: str) -> List[Dict]:
+        data = self.get(filename)
+        if data is None:
+            data = self._data[filename] = []
+        return data
+
+    def put(self, filename: str, data: Any) -> None:
+        self._data[filename] = data
+        self.changed(filename)
+
+    def commit(self, filename: str) -> asyncio.Future:
+        """Schedule a write of `filename`; the future resolves once it is on disk."""
+        future = asyncio.get_running_loop().create_future()
+        self._dirty.setdefault(filename, []).append(future)
+        # A running flush picks new changes up when its current round is done
+        if self._flush_handle is None and self._flush_task is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self.flush)
+        return future
+
+    def flush(self) -> None:
+        """Start writing the dirty files (timer callback)."""
+        self._flush_handle = None
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    def _write(self, filename: str, data: Any) -> Tuple[bool, Optional[Tuple[int, int]]]:
+        """Runs in a worker thread."""
+        ok = self.db._dump(filename, data)
+        return ok, self._stamp(filename) if ok else None
+
+    async def _flush(self) -> None:
+        try:
+            while self._dirty:
+                dirty, self._dirty = self._dirty, {}
+                for filename, waiters in dirty.items():
+                    self._writing.add(filename)
+                    try:
+                        ok, stamp = await asyncio.to_thread(self._write, filename, _snapshot(self._data[filename]))
+                    finally:
+                        self._writing.discard(filename)
+                    if ok:
+                        self._stamps[filename] = stamp
+                    elif filename not in self._dirty:
+                        logger.error(f"Write failed for {filename}, reloading from disk on next access")
+                        self._data.pop(filename, None)
+                    else:
+                        logger.error(f"Write failed for {filename}, retrying with the next changes")
+                    self.stats["flushes"] += 1
+                    self.stats["writes_batched"] += len(waiters)
+                    for future in waiters:
+                        if not future.done():
+                            future.set_result(ok)
+        finally:
+            self._flush_task = None
+
+    async def drain(self) -> None:
+        """Write everything still pending (on shutdown)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._dirty or self._flush_task is not None:
+            if self._flush_task is None:
+                self.flush()
+            await self._flush_task
+
+
+class StorageServer:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def apply(self, request: Dict) -> bool:
+        """Apply a write/append/update in memory; False if the update target is missing."""
+        store = self.store
+        op = request["op"]
+        filename = request["file"]
+        if op == "write":
+            store.put(filename, request["data"])
+            return True
+        if op == "append":
+            store.get_list(filename).append(request["item"])
+        else:
+            key, value = request["key"], request["value"]
+            item = next((item for item in store.get_list(filename) if item.get(key) == value), None)
+            if item is None:
+                return False
+            item.update(request["updates"])
+        store.changed(filename)
+        return True
+
+    async def execute(self, request: Dict) -> Any:
+        store = self.store
+        op = request["op"]
+        filename = request.get("file")
+
+        if op == "read":
+            data = store.get(filename)
+            return [] if data is None else data
+        if op == "read_versioned":
+            data = store.get(filename)
+            return {"data": [] if data is None else data, "generation": store.generation(filename)}
+        if op == "read_single":
+            return store.get(filename)
+        if op == "find_one":
+            key, value = request["key"], request["value"]
+            return next((item for item in store.get_list(filename) if item.get(key) == value), None)
+        if op == "find_many":
+            filters = request["filters"]
+            return [item for item in store.get_list(filename) if _matches(item, filters)]
+        if op == "count":
+            filters = request.get("filters")
+            data = store.get_list(filename)
+            return len(data) if filters is None else sum(1 for item in data if _matches(item, filters))
+
+        if op in BATCH_OPS:
+            if not self.apply(request):
+                return False
+        elif op == "batch":
+            # One transaction: checked and applied in one go (no await in between), each file written once
+            unknown = {change["op"] for change in request["ops"]} - set(BATCH_OPS)
+            if unknown:
+                raise ValueError(f"Unknown op in batch: {', '.join(sorted(unknown))}")
+            expect = request.get("expect") or {}
+            conflicts = sorted(name for name, generation in expect.items() if store.generation(name) != generation)
+            if conflicts:
+                return {"committed": False, "conflicts": conflicts}
+            for change in request["ops"]:
+                self.apply(change)
+            files = list(dict.fromkeys(change["file"] for change in request["ops"]))
+            committed = all(await asyncio.gather(*(store.commit(name) for name in files)))
+            return {"committed": committed, "conflicts": []}
+        elif op == "update_many":
+            results = apply_changes(store.get_list(filename), request["changes"])
+            if not any(item is not None for item in results):
+                return results
+            store.changed(filename)
+            # Copies: the stored items may change again before the reply is sent
+            results = [dict(item) if item is not None else None for item in results]
+            return results if await store.commit(filename) else None
+        else:
+            raise ValueError(f"Unknown op: {op}")
+        return await store.commit(filename)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    return
+                (size,) = HEADER.unpack(header)
+                if size > MAX_FRAME:
+                    logger.error(f"Dropping client: frame of {size} bytes")
+                    return
+                request = unpack(await reader.readexactly(size))
+                self.store.stats["requests"] += 1
+                try:
+                    reply = {"ok": True, "result": await self.execute(request)}
+                except Exception as e:
+                    logger.exception(f"Request failed: {request.get('op')} {request.get('file')}")
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                writer.write(pack(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def log_stats(store: Store, interval: float = 60) -> None:
+    last = dict(store.stats)
+    while True:
+        await asyncio.sleep(interval)
+        now = dict(store.stats)
+        if now != last:
+            logger.info(
+                f"requests={now['requests'] - last['requests']} flushes={now['flushes'] - last['flushes']} "
+                f"writes={now['writes_batched'] - last['writes_batched']} in last {interval:.0f}s"
+            )
+        last = now
+
+
+async def serve(socket_path: str, flush_ms: float) -> None:
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    store = Store(JsonDB(), flush_ms)
+    server = StorageServer(store)
+    unix_server = await asyncio.start_unix_server(server.handle, path=socket_path)
+    os.chmod(socket_path, 0o660)
+    logger.info(f"Storage server on {socket_path}, DATA_DIR={store.db.data_dir}, flush {flush_ms} ms")
+    stats_task = asyncio.create_task(log_stats(store))
+    loop = asyncio.get_running_loop()
+    serve_task = asyncio.current_task()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        # Stop cleanly so pending writes are flushed
+        loop.add_signal_handler(sig, serve_task.cancel)
+    try:
+        async with unix_server:
+            await unix_server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        stats_task.cancel()
+        await store.drain()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Single-writer storage daemon for DATA_DIR")
+    parser.add_argument("--socket", default=config.STORAGE_SOCKET or "storage.sock")
+    parser.add_argument("--flush-ms", type=float, default=config.STORAGE_FLUSH_MS)
+    args = parser.parse_args()
+    started = time.monotonic()
+    asyncio.run(serve(args.socket, args.flush_ms))
+    logger.info(f"Stopped after {time.monotonic() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
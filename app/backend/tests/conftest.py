@@ -0,0 +1,37 @@
+"""Test settings, applied before any backend module is imported (config is read at import)."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="davomat-test-")
+os.environ["BOT_TOKEN"] = "123456:LOADTEST"
+os.environ["ADMIN_IDS"] = "42"
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ["SNAPSHOT_INTERVAL_MINUTES"] = "0"
+os.environ["STORAGE_SOCKET"] = ""
+
+
+@pytest.fixture
+def api():
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def active_user():
+    """Add an active user; returns the X-Browser-Token headers to act as them."""
+    from database import db, USERS_FILE
+
+    def add(telegram_id: int):
+        username = f"test{telegram_id}"
+        db.append(USERS_FILE, {"telegram_id": telegram_id, "username": username, "first_name": "Test",
+                               "last_name": "", "status": "active", "password": "12345", "auth_type": "telegram"})
+        return {"X-Browser-Token": f"{username}:12345"}
+    return add
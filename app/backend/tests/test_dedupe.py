@@ -0,0 +1,62 @@
+from dedupe import EventDeduplicator
+from database import db, get_settings, save_settings, LOCATIONS_FILE
+import pytest
+
+
+def test_recent_events_are_answered_from_memory():
+    dedupe = EventDeduplicator(per_user=2)
+    confirmed = []
+
+    def confirm():
+        confirmed.append(True)
+        return None
+
+    assert dedupe.lookup(1, "a", confirm) is None
+    assert not confirmed
+    dedupe.remember(1, "a", {"id": "loc-a"})
+    assert dedupe.lookup(1, "a", confirm) == {"id": "loc-a"}
+    assert dedupe.lookup(2, "a", confirm) is None
+    assert not confirmed
+
+
+def test_evicted_events_are_confirmed_from_storage():
+    dedupe = EventDeduplicator(per_user=1)
+    dedupe.remember(1, "a", {"id": "loc-a"})
+    dedupe.remember(1, "b", {"id": "loc-b"})
+    # "a" left the recent window; the Bloom filter still knows it, storage has the answer
+    assert dedupe.lookup(1, "a", lambda: {"id": "loc-a"}) == {"id": "loc-a"}
+    # Found again from memory this time
+    assert dedupe.lookup(1, "a", lambda: pytest.fail("storage checked twice")) == {"id": "loc-a"}
+
+
+def test_incomplete_state_checks_storage():
+    dedupe = EventDeduplicator()
+    dedupe.complete = False
+    assert dedupe.lookup(1, "x", lambda: {"id": "loc-x"}) == {"id": "loc-x"}
+
+
+def test_state_round_trip():
+    dedupe = EventDeduplicator()
+    dedupe.remember(1, "a", {"id": "loc-a"})
+    restored = EventDeduplicator()
+    restored.load_state(dedupe.export_state())
+    assert restored.lookup(1, "a", lambda: None) == {"id": "loc-a"}
+
+
+@pytest.fixture
+def always_on_shift():
+    settings = get_settings()
+    previous = dict(settings)
+    save_settings({**settings, "shifts": {"8201": {"work_start": "00:00", "work_end": "00:00", "lunch_start": None}}})
+    yield
+    save_settings(previous)
+
+
+def test_retried_location_is_stored_once(api, active_user, always_on_shift):
+    headers = active_user(8201)
+    assert api.post("/sessions/start", headers=headers).status_code == 200
+    body = {"latitude": 41.3111, "longitude": 69.2406, "event_id": "evt-1"}
+    first = api.post("/locations/record", json=body, headers=headers).json()
+    second = api.post("/locations/record", json=body, headers=headers).json()
+    assert first["id"] == second["id"]
+    assert len(db.find_many(LOCATIONS_FILE, {"user_id": 8201, "event_id": "evt-1"})) == 1
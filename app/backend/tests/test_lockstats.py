@@ -0,0 +1,25 @@
+import threading
+import time
+from lockstats import InstrumentedLock
+
+
+def test_queue_depth_returns_to_zero_under_contention():
+    lock = InstrumentedLock("test.json")
+    start = threading.Barrier(16)
+
+    def worker():
+        start.wait()
+        for _ in range(200):
+            with lock:
+                time.sleep(0)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = lock.stats.as_dict()
+    assert stats["acquisitions"] == 16 * 200
+    assert stats["queue_depth"] == 0
+    assert 1 <= stats["max_queue_depth"] <= 16
@@ -0,0 +1,15 @@
+from config import config
+
+
+def test_metrics_need_a_token_or_localhost(api, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_TOKEN", "")
+    # TestClient's client host is "testclient", i.e. not localhost
+    assert api.get("/metrics").status_code == 403
+    monkeypatch.setattr(config, "METRICS_PUBLIC", True)
+    assert api.get("/metrics").status_code == 200
+
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secret")
+    assert api.get("/metrics").status_code == 401
+    response = api.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert "jsondb_lock_queue_depth" in response.text
@@ -0,0 +1,104 @@
+from datetime import date, datetime
+import pytest
+import services
+import tracking
+from database import get_settings, save_settings
+from workcalendar import compile_calendar
+
+USER_ID = 5001
+NIGHT_SHIFT = {"work_start": "22:00", "work_end": "06:00", "lunch_start": "02:00", "lunch_end": "02:30"}
+
+
+@pytest.fixture
+def night_shift():
+    settings = get_settings()
+    previous = dict(settings)
+    save_settings({**settings, "shifts": {str(USER_ID): NIGHT_SHIFT}, "holidays": []})
+    yield
+    save_settings(previous)
+
+
+def test_shift_day_after_midnight():
+    calendar = compile_calendar({"work_start": "09:00", "work_end": "18:00"}, NIGHT_SHIFT)
+    # 2026-10-19 is a Monday
+    assert calendar.shift_day(datetime(2026, 10, 19, 23, 0)) == date(2026, 10, 19)
+    assert calendar.shift_day(datetime(2026, 10, 20, 0, 30)) == date(2026, 10, 19)
+    assert calendar.shift_day(datetime(2026, 10, 20, 6, 0)) == date(2026, 10, 19)
+    # After the shift, until the next one starts, still yesterday's
+    assert calendar.shift_day(datetime(2026, 10, 20, 12, 0)) == date(2026, 10, 19)
+    assert calendar.shift_day(datetime(2026, 10, 20, 22, 0)) == date(2026, 10, 20)
+    # Day shifts keep the calendar date
+    day = compile_calendar({"work_start": "09:00", "work_end": "18:00"})
+    assert day.shift_day(datetime(2026, 10, 20, 7, 0)) == date(2026, 10, 20)
+    assert day.shift_day(datetime(2026, 10, 20, 20, 0)) == date(2026, 10, 20)
+
+
+def test_session_started_after_midnight(night_shift):
+    session = services.start_session(USER_ID, datetime(2026, 10, 20, 0, 30))
+    assert session["date"] == "2026-10-19"
+    assert session["late_arrival_minutes"] == 150
+
+    # Same session after the lunch break and at the end of the shift
+    assert services.start_session(USER_ID, datetime(2026, 10, 20, 3, 0))["id"] == session["id"]
+    assert services.get_today_session(USER_ID, datetime(2026, 10, 20, 3, 0))["id"] == session["id"]
+
+    ended = services.end_session(USER_ID, datetime(2026, 10, 20, 5, 0))
+    assert ended["id"] == session["id"]
+    assert ended["early_leave_minutes"] == 60
+    assert services.get_today_session(USER_ID, datetime(2026, 10, 20, 5, 0))["status"] == "offline"
+
+
+def test_tracking_advice_uses_the_shift(night_shift):
+    advice = services.get_tracking_advice(USER_ID, now=datetime(2026, 10, 20, 5, 59, 30))
+    assert advice["should_track"]
+    assert advice["reason"] == "before_work_end"
+    assert advice["interval_seconds"] == 30
+
+    advice = services.get_tracking_advice(USER_ID, now=datetime(2026, 10, 20, 1, 59, 20))
+    assert advice["reason"] == "before_lunch_start"
+
+    advice = services.get_tracking_advice(USER_ID, now=datetime(2026, 10, 19, 21, 58))
+    assert not advice["should_track"]
+    assert advice["interval_seconds"] == 120
+
+
+def test_stale_night_session_closed_after_its_own_shift_end(night_shift):
+    session = services.start_session(USER_ID + 1, datetime(2026, 10, 21, 23, 0))
+    assert session is None  # no shift of their own: day hours
+    save_settings({**get_settings(), "shifts": {str(USER_ID + 1): NIGHT_SHIFT}})
+    session = services.start_session(USER_ID + 1, datetime(2026, 10, 21, 23, 0))
+    assert session["date"] == "2026-10-21"
+
+    # Past the day shift's end, but the night shift is still running
+    services.close_stale_sessions(datetime(2026, 10, 22, 0, 10), grace_minutes=30)
+    assert services.get_today_session(USER_ID + 1, datetime(2026, 10, 22, 0, 10))["status"] == "online"
+    # Within the grace period after 06:00
+    services.close_stale_sessions(datetime(2026, 10, 22, 6, 20), grace_minutes=30)
+    assert services.get_today_session(USER_ID + 1, datetime(2026, 10, 22, 6, 20))["status"] == "online"
+
+    services.close_stale_sessions(datetime(2026, 10, 22, 6, 31), grace_minutes=30)
+    closed = services.get_today_session(USER_ID + 1, datetime(2026, 10, 22, 6, 31))
+    assert closed["status"] == "offline"
+    assert closed["end_time"] == "06:00"
+    assert closed["auto_closed"]
+
+
+def test_failed_location_write_leaves_recent_points_alone(monkeypatch):
+    settings = get_settings()
+    # Around the clock, so record_location accepts "now"
+    save_settings({**settings, "shifts": {str(USER_ID + 2): {"work_start": "00:00", "work_end": "00:00"}}})
+    try:
+        def failing_store(location):
+            raise RuntimeError("disk full")
+
+        monkeypatch.setattr(services, "_store_location", failing_store)
+        with pytest.raises(RuntimeError):
+            services.record_location(USER_ID + 2, "s-failed", 41.3, 69.2)
+        assert tracking.recent_points.get(USER_ID + 2, "s-failed") == []
+
+        monkeypatch.undo()
+        location = services.record_location(USER_ID + 2, "s-failed", 41.3, 69.2)
+        assert tracking.recent_points.get(USER_ID + 2, "s-failed") == [location]
+        assert location["interval_seconds"] > 0
+    finally:
+        save_settings(settings)
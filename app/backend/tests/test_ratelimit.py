@@ -0,0 +1,71 @@
+import threading
+import ratelimit
+import services
+from ratelimit import RateLimiter, parse_limit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_limit():
+    assert parse_limit("10/60") == (10.0, 10 / 60)
+    assert parse_limit("5") == (5.0, 5.0)
+    assert parse_limit("") is None
+    assert parse_limit("0") is None
+    assert parse_limit("off") is None
+
+
+def test_bucket_refills():
+    clock = FakeClock()
+    limiter = RateLimiter({"report": parse_limit("2/10")}, clock=clock)
+    assert limiter.check("report", 1) is None
+    assert limiter.check("report", 1) is None
+    assert limiter.check("report", 1) == 5.0
+    # Buckets are per user and per kind
+    assert limiter.check("report", 2) is None
+    assert limiter.check("session", 1) is None
+    clock.now += 5
+    assert limiter.check("report", 1) is None
+    assert limiter.check("report", 1) is not None
+
+
+def test_route_returns_429_with_retry_after(api, active_user, monkeypatch):
+    monkeypatch.setitem(ratelimit.limiter.limits, "report", parse_limit("1/60"))
+    headers = active_user(8101)
+    first = api.post("/reports/submit", json={"content": "Birinchi hisobot"}, headers=headers)
+    assert first.status_code == 200
+    second = api.post("/reports/submit", json={"content": "Ikkinchi hisobot"}, headers=headers)
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "60"
+    # Another user has their own bucket
+    assert api.post("/reports/submit", json={"content": "Hisobot"}, headers=active_user(8102)).status_code == 200
+
+
+def test_write_cap_rejects_while_writes_run(api, active_user, monkeypatch):
+    monkeypatch.setattr(ratelimit, "write_slots", threading.BoundedSemaphore(1))
+    entered, release = threading.Event(), threading.Event()
+    start_session = services.start_session
+
+    def slow_start(user_id, now=None):
+        entered.set()
+        release.wait(5)
+        return start_session(user_id, now)
+
+    monkeypatch.setattr(services, "start_session", slow_start)
+    first_headers, second_headers = active_user(8111), active_user(8112)
+    results = []
+    worker = threading.Thread(target=lambda: results.append(api.post("/sessions/start", headers=first_headers)))
+    worker.start()
+    assert entered.wait(5)
+    # The first write holds the only slot while it runs in the threadpool
+    second = api.post("/sessions/start", headers=second_headers)
+    release.set()
+    worker.join(5)
+    assert second.status_code == 503
+    assert second.headers["Retry-After"] == "1"
+    assert results and results[0].status_code != 503
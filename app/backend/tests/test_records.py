@@ -0,0 +1,48 @@
+import pickle
+from indexes import SessionIndex
+from records import MISSING, Session, User
+from database import db
+
+SESSION = {
+    "id": "s-1", "user_id": 11, "date": "2026-10-19", "start_time": "09:05", "end_time": None,
+    "status": "online", "total_online_minutes": 0, "total_office_minutes": 0,
+    "late_arrival_minutes": 5, "early_leave_minutes": 0, "created_at": "2026-10-19T09:05:01.123456",
+}
+
+
+def test_round_trip_keeps_missing_and_unknown_keys():
+    data = {k: v for k, v in SESSION.items() if k != "end_time"}
+    data["auto_closed"] = True
+    data["start_time"] = "9:5"
+    record = Session.from_dict(data)
+    assert record.to_dict() == data
+    assert record.end_time is MISSING
+
+
+def test_update_converts_values():
+    record = Session.from_dict(SESSION)
+    record.update({"end_time": "18:00", "status": "offline", "auto_closed": True})
+    assert record.end_time == 18 * 60
+    assert record.get("end_time") == "18:00"
+    assert record.to_dict() == {**SESSION, "end_time": "18:00", "status": "offline", "auto_closed": True}
+
+
+def test_pickle_keeps_missing_singleton():
+    record = pickle.loads(pickle.dumps(Session.from_dict({"id": "s-2"})))
+    assert record.user_id is MISSING
+    assert record.to_dict() == {"id": "s-2"}
+
+
+def test_session_index_holds_records():
+    db.write("records-sessions.json", [SESSION, {**SESSION, "id": "s-0", "date": "2026-10-18"}])
+    index = SessionIndex("records-sessions.json")
+    assert [s["id"] for s in index.range(11, "2026-10-01", "2026-10-31")] == ["s-0", "s-1"]
+    assert index.latest(11) == SESSION
+    assert all(isinstance(s, Session) for s in index._users[11])
+
+
+def test_unknown_keys_kept_when_a_field_is_missing():
+    data = {"id": "a", "user_id": 1, "date": "2024-01-01", "auto_closed": True}
+    assert Session.from_dict(data).to_dict() == data
+    user = {"telegram_id": 1, "status": "active", "is_admin": True}
+    assert User.from_dict(user).to_dict() == user
@@ -0,0 +1,32 @@
+from database import db, REPORTS_FILE
+from search import ReportIndex, report_index
+import services
+
+
+def test_submit_updates_index_without_rewriting_it():
+    services.submit_report(7001, "Hisobotlarni tayyorladim", "2026-10-01")
+    assert report_index.search("hisobot")["total"] >= 1
+    path = report_index._path()
+    saved = path.stat().st_mtime_ns if path.exists() else None
+
+    services.submit_report(7001, "Omborda inventarizatsiya", "2026-10-02")
+    assert report_index.search("inventarizatsiya")["total"] == 1
+    assert (path.stat().st_mtime_ns if path.exists() else None) == saved
+
+    assert report_index.flush()
+    assert not report_index.flush()
+    restored = ReportIndex()
+    assert restored._load_saved()
+    assert "inventarizatsiya" in restored.postings
+
+
+def test_saved_index_ignored_after_outside_change():
+    services.submit_report(7002, "Mijozlar bilan uchrashuv", "2026-10-03")
+    report_index.search("uchrashuv")
+    report_index.flush()
+    reports = db.read(REPORTS_FILE)
+    db.write(REPORTS_FILE, [r for r in reports if r["user_id"] != 7002])
+
+    restored = ReportIndex()
+    assert not restored._load_saved()
+    assert restored.search("uchrashuv")["total"] == 0
@@ -0,0 +1,20 @@
+from datetime import datetime
+import services
+from indexes import sessions_index
+
+USER_ID = 5101
+
+
+def test_exported_index_state_is_a_copy():
+    # 2026-10-19 10:00 is within the default Monday hours
+    session = services.start_session(USER_ID, datetime(2026, 10, 19, 10, 0))
+    sessions_index.warm()
+    state = sessions_index.export_state()
+    exported = state["by_id"][session["id"]]
+    assert exported is not sessions_index._by_id[session["id"]]
+    # Both maps still share one record per session
+    assert any(s is exported for s in state["users"][USER_ID])
+
+    services.end_session(USER_ID, datetime(2026, 10, 19, 17, 0))
+    assert sessions_index.get(session["id"])["status"] == "offline"
+    assert exported.get("status") == "online"
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import pytest
+from database import JsonDB
+from storage_client import RemoteDB, TransactionConflict, retry_conflicts
+from storage_server import Store
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+FILE = "items.json"
+
+
+@pytest.fixture
+def daemon():
+    data_dir = tempfile.mkdtemp(prefix="davomat-daemon-")
+    socket_path = os.path.join(data_dir, "storage.sock")
+    env = {**os.environ, "DATA_DIR": data_dir}
+    process = subprocess.Popen([sys.executable, "storage_server.py", "--socket", socket_path, "--flush-ms", "1"],
+                               cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        assert process.poll() is None and time.monotonic() < deadline, "storage daemon did not start"
+        time.sleep(0.05)
+    clients = []
+
+    def connect() -> RemoteDB:
+        client = RemoteDB(socket_path, pool_size=2)
+        client.data_dir = Path(data_dir)
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        client.pool.close()
+    process.terminate()
+    process.wait(10)
+
+
+def test_transaction_commits(daemon):
+    db = daemon()
+    with db.transaction([FILE]) as tx:
+        tx.append(FILE, {"id": 1, "n": 0})
+    assert tx.ok
+    with db.transaction([FILE]) as tx:
+        tx.update(FILE, "id", 1, {"n": 1})
+        tx.write(FILE, tx.read(FILE) + [{"id": 2, "n": 0}])
+    assert db.read(FILE) == [{"id": 1, "n": 1}, {"id": 2, "n": 0}]
+
+
+def test_conflicting_transaction_is_rejected(daemon):
+    db, other = daemon(), daemon()
+    db.append(FILE, {"id": 1, "n": 0})
+    with pytest.raises(TransactionConflict) as conflict:
+        with db.transaction([FILE]) as tx:
+            items = tx.read(FILE)
+            other.update(FILE, "id", 1, {"n": 5})
+            tx.write(FILE, [dict(item, n=item["n"] + 1) for item in items])
+    assert conflict.value.files == [FILE]
+    # The other client's change survives instead of being overwritten
+    assert db.read(FILE) == [{"id": 1, "n": 5}]
+
+
+def test_conflict_reruns_the_function(daemon):
+    db, other = daemon(), daemon()
+    db.append(FILE, {"id": 1, "n": 0})
+    runs = []
+
+    @retry_conflicts
+    def increment():
+        with db.transaction([FILE]) as tx:
+            item = tx.find_one(FILE, "id", 1)
+            if not runs:
+                other.update(FILE, "id", 1, {"n": 10})
+            runs.append(item["n"])
+            tx.update(FILE, "id", 1, {"n": item["n"] + 1})
+
+    increment()
+    assert runs == [0, 10]
+    assert db.find_one(FILE, "id", 1)["n"] == 11
+
+
+def test_changes_before_the_first_read_do_not_conflict(daemon):
+    db, other = daemon(), daemon()
+    with db.transaction([FILE]) as tx:
+        other.append(FILE, {"id": 1})
+        tx.append(FILE, {"id": 2})
+    assert tx.ok
+    assert [item["id"] for item in db.read(FILE)] == [1, 2]
+
+
+def test_flush_writes_off_the_event_loop_in_commit_order():
+    db = JsonDB()
+    dump = db._dump
+    written = []
+
+    def slow_dump(filename, data):
+        time.sleep(0.2)
+        written.append([item["n"] for item in data])
+        return dump(filename, data)
+
+    db._dump = slow_dump
+    store = Store(db, flush_ms=1)
+
+    async def scenario():
+        store.put("flush-order.json", [{"n": 1}])
+        first = store.commit("flush-order.json")
+        await asyncio.sleep(0.05)
+        # The first write is in progress: the loop still serves, later changes queue up behind it
+        started = time.monotonic()
+        store.get_list("flush-order.json").append({"n": 2})
+        store.changed("flush-order.json")
+        second = store.commit("flush-order.json")
+        assert time.monotonic() - started < 0.1
+        assert not first.done()
+        assert await first and await second
+
+    asyncio.run(scenario())
+    assert written == [[1], [1, 2]]
+    assert [item["n"] for item in db.read("flush-order.json")] == [1, 2]
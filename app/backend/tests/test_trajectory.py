@@ -0,0 +1,21 @@
+from trajectory import encode_polyline, simplify
+
+
+def test_encode_polyline_reference():
+    # Example from Google's polyline algorithm documentation
+    coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(coords) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_encode_polyline_small_steps():
+    assert encode_polyline([]) == ""
+    assert encode_polyline([(0.0, 0.0), (0.00001, -0.00001)]) == "??A@"
+    assert encode_polyline([(41.31108, 69.24056)], precision=6) == encode_polyline([(41.31108, 69.24056)], 6)
+
+
+def test_simplify_drops_points_on_a_line():
+    line = [(41.3, 69.2 + i * 0.0001) for i in range(10)]
+    assert simplify(line, 1.0) == [0, 9]
+    corner = line + [(41.3 + i * 0.0001, 69.2009) for i in range(1, 5)]
+    assert simplify(corner, 1.0) == [0, 9, 13]
+    assert simplify(corner, 0) == list(range(14))
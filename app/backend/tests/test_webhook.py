@@ -0,0 +1,86 @@
+import time
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("telegram")
+
+from botwebhook import SECRET_HEADER, WEBHOOK_PATH, _load_updates, bot_webhook
+from config import config
+from database import db, USERS_FILE
+from main import app
+
+UPDATES = Path(__file__).parent / "fixtures" / "updates.json"
+SECRET = "test-secret"
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    monkeypatch.setattr(config, "BOT_WEBHOOK_ENABLED", True)
+    monkeypatch.setattr(config, "BOT_WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(config, "BOT_WEBHOOK_OFFLINE", True)
+    monkeypatch.setattr(config, "BOT_WEBHOOK_URL", "")
+    with TestClient(app) as client:
+        yield client
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_recorded_update_runs_start_handler(webhook):
+    update = _load_updates(UPDATES)[0]
+    user_id = update["message"]["from"]["id"]
+
+    assert webhook.post(WEBHOOK_PATH, json=update).status_code == 403
+    assert webhook.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: "wrong"}).status_code == 403
+
+    response = webhook.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: SECRET})
+    assert response.status_code == 200
+
+    assert _wait_for(lambda: db.find_one(USERS_FILE, "telegram_id", user_id) is not None)
+    assert db.find_one(USERS_FILE, "telegram_id", user_id)["status"] == "pending"
+    assert _wait_for(lambda: any(method == "sendMessage" for method, _ in bot_webhook.request.calls))
+
+
+def test_invalid_update_rejected(webhook):
+    response = webhook.post(WEBHOOK_PATH, content=b"not json", headers={SECRET_HEADER: SECRET})
+    assert response.status_code == 400
+
+
+def test_secret_required(monkeypatch):
+    monkeypatch.setattr(config, "BOT_WEBHOOK_ENABLED", True)
+    monkeypatch.setattr(config, "BOT_WEBHOOK_SECRET", "")
+    with pytest.raises(RuntimeError):
+        with TestClient(app):
+            pass
+
+
+def test_route_disabled_without_webhook():
+    with TestClient(app) as client:
+        response = client.post(WEBHOOK_PATH, json={}, headers={SECRET_HEADER: SECRET})
+    assert response.status_code == 404
+
+
+def test_api_serves_while_telegram_unreachable(monkeypatch):
+    from telegram.error import NetworkError
+    import botwebhook
+
+    async def unreachable(self, url, *args, **kwargs):
+        raise NetworkError("connection refused")
+
+    monkeypatch.setattr(config, "BOT_WEBHOOK_ENABLED", True)
+    monkeypatch.setattr(config, "BOT_WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(config, "BOT_WEBHOOK_OFFLINE", True)
+    monkeypatch.setattr(botwebhook.OfflineRequest, "do_request", unreachable)
+    with TestClient(app) as client:
+        update = _load_updates(UPDATES)[0]
+        response = client.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: SECRET})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "10"
+        assert not bot_webhook.running
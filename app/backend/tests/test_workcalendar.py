@@ -0,0 +1,72 @@
+from datetime import date, datetime, timedelta
+import pytest
+from workcalendar import compile_calendar, validate
+
+OFFICE = {
+    "work_start": "09:00", "work_end": "18:00", "lunch_start": "13:00", "lunch_end": "14:00",
+    "days": {"sat": {"work_end": "14:00", "lunch_start": None}, "sun": None},
+}
+NIGHT = {"work_start": "22:00", "work_end": "06:00", "lunch_start": "02:00", "lunch_end": "02:30"}
+# 2026-10-19 is a Monday
+MONDAY = date(2026, 10, 19)
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 10, 19, hour, minute) + timedelta(days=day)
+
+
+def test_working_minutes():
+    calendar = compile_calendar(OFFICE)
+    assert calendar.working_minutes(at(0, 9), at(0, 18)) == 480
+    assert calendar.working_minutes(at(0, 12, 30), at(0, 14, 30)) == 60
+    # Weekdays 8 h, Saturday 5 h without lunch, Sunday off
+    assert calendar.week_working_minutes == 5 * 480 + 300
+    assert calendar.working_minutes(at(0, 0), at(7, 0)) == 2700
+    assert calendar.working_minutes(at(2, 10), at(23, 10)) == 3 * 2700
+    assert calendar.working_minutes(at(0, 18), at(0, 9)) == 0
+
+
+def test_shift_boundaries():
+    calendar = compile_calendar(OFFICE)
+    assert calendar.on_shift(at(0, 18, 0))
+    assert not calendar.on_shift(at(0, 18, 1))
+    assert calendar.on_shift(at(0, 13, 30)) and not calendar.is_working(at(0, 13, 30))
+    assert not calendar.on_shift(at(6, 10))
+    assert calendar.late_minutes(MONDAY, at(0, 14, 30)) == 270
+    assert calendar.early_leave_minutes(MONDAY, at(0, 17)) == 60
+    assert calendar.late_minutes(MONDAY, at(0, 8, 55)) == 0
+
+
+def test_holidays():
+    calendar = compile_calendar({**OFFICE, "holidays": ["2026-10-21"]})
+    assert not calendar.on_shift(at(2, 10))
+    assert calendar.working_minutes(at(0, 0), at(7, 0)) == 2700 - 480
+    assert calendar.work_days(MONDAY, date(2026, 10, 25)) == 5
+    assert calendar.shift_for(date(2026, 10, 21)) is None
+
+
+def test_overnight_shift():
+    calendar = compile_calendar(OFFICE, NIGHT)
+    assert calendar.on_shift(at(1, 1))
+    assert calendar.working_minutes(at(0, 22), at(1, 6)) == 450
+    assert calendar.late_minutes(MONDAY, at(1, 0, 30)) == 150
+    assert calendar.early_leave_minutes(MONDAY, at(1, 5)) == 60
+    # The shift belongs to the day it starts on, holidays included
+    holiday = compile_calendar({**OFFICE, "holidays": ["2026-10-19"]}, NIGHT)
+    assert not holiday.on_shift(at(1, 1))
+    assert holiday.on_shift(at(1, 23))
+    assert holiday.working_minutes(at(0, 20), at(1, 8)) == 0
+
+
+def test_validate_rejects_bad_settings():
+    validate({**OFFICE, "shifts": {"7": NIGHT}})
+    # Back-to-back shifts are fine, overlapping ones are not
+    validate({"work_start": "16:00", "work_end": "00:00"})
+    with pytest.raises(ValueError):
+        validate({"work_start": "20:00", "work_end": "10:00", "days": {"tue": {"work_start": "08:00"}}})
+    with pytest.raises(ValueError):
+        validate({"work_start": "25:00", "work_end": "18:00"})
+    with pytest.raises(ValueError):
+        validate({**OFFICE, "days": {"monday": None}})
+    with pytest.raises(ValueError):
+        validate({**OFFICE, "holidays": ["2026-13-01"]})
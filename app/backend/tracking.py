@@ -0,0 +1,123 @@
+"""Adaptive location ping interval and time-weighted session minutes.
+
+Clients ask `should-track` (or read the `interval_seconds` of a recorded
+location) for when to send the next point. Users sitting still inside the
+geofence get progressively longer intervals, users moving or close to the
+geofence edge get short ones, and no interval runs past the end of the
+user's shift or a lunch boundary.
+
+Because points are no longer one per minute, each point is credited with the
+time until the next point (capped), instead of counting points as minutes.
+"""
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+from config import config
+
+# Legacy points (before adaptive intervals) were sent once a minute
+LEGACY_INTERVAL = 60
+# A point stays valid this much longer than the interval it was sent with
+GAP_GRACE = 1.5
+# Closer than this to the geofence edge counts as "near the boundary"
+BOUNDARY_METERS = 50
+STATIONARY_METERS = 25
+MOVING_METERS = 100
+# Each this-long stretch of standing still doubles the interval
+STATIONARY_STEP_SECONDS = 15 * 60
+RECENT_POINTS = 10
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def recommend_interval(now: datetime, boundaries: Dict[str, Optional[datetime]], inside: Optional[bool],
+                       edge_distance: Optional[float], stationary_seconds: float,
+                       moved_meters: Optional[float]) -> Tuple[int, str]:
+    """Seconds until the next ping and the reason, for a user during their shift.
+
+    `boundaries` are the shift's times (WorkCalendar.boundaries).
+    """
+    low, base, high = config.TRACKING_MIN_INTERVAL, config.TRACKING_BASE_INTERVAL, config.TRACKING_MAX_INTERVAL
+
+    if edge_distance is None:
+        interval, reason = base, "no_recent_point"
+    elif edge_distance <= BOUNDARY_METERS:
+        interval, reason = low, "near_geofence_edge"
+    elif moved_meters is not None and moved_meters >= MOVING_METERS:
+        interval, reason = low, "moving"
+    elif inside and (moved_meters is None or moved_meters <= STATIONARY_METERS):
+        steps = int(stationary_seconds // STATIONARY_STEP_SECONDS)
+        interval, reason = base * (2 ** min(steps, 8)), "stationary_inside"
+    else:
+        interval, reason = base, "default"
+
+    # Land a ping on the next schedule boundary instead of sleeping past it
+    for key in ("lunch_start", "lunch_end", "work_end"):
+        value = boundaries.get(key)
+        if value is None:
+            continue
+        until = (value - now).total_seconds()
+        if 0 < until < interval:
+            interval, reason = until, f"before_{key}"
+    return int(max(low, min(high, interval))), reason
+
+
+def next_work_start(now: datetime, start: Optional[datetime]) -> int:
+    """Seconds until tracking should resume at `start`, capped at the max interval."""
+    if start is None or start <= now:
+        return config.TRACKING_MAX_INTERVAL
+    return int(min((start - now).total_seconds(), config.TRACKING_MAX_INTERVAL))
+
+
+def session_minutes(locations: List[Dict], until: datetime) -> Tuple[int, int]:
+    """(online, office) minutes up to `until`, each point credited until the next one."""
+    points = sorted(locations, key=lambda loc: loc["timestamp"])
+    online = office = 0.0
+    for i, loc in enumerate(points):
+        interval = loc.get("interval_seconds")
+        if interval is None:
+            credit = LEGACY_INTERVAL
+        elif i + 1 < len(points):
+            gap = (_parse_ts(points[i + 1]["timestamp"]) - _parse_ts(loc["timestamp"])).total_seconds()
+            credit = max(0.0, min(gap, interval * GAP_GRACE))
+        else:
+            # Latest point: the user may stay put until the next expected ping, but not past `until`
+            credit = max(0.0, min(interval, (until - _parse_ts(loc["timestamp"])).total_seconds()))
+        online += credit
+        if loc.get("is_inside_office"):
+            office += credit
+    return round(online / 60), round(office / 60)
+
+
+class RecentPoints:
+    """Last few points per user, kept in memory so should-track needs no storage I/O."""
+
+    def __init__(self, size: int = RECENT_POINTS):
+        self.size = size
+        self._points: Dict[Hashable, Deque[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id: Hashable, location: Dict) -> None:
+        with self._lock:
+            points = self._points.get(user_id)
+            if points is None:
+                points = self._points[user_id] = deque(maxlen=self.size)
+            points.append(location)
+
+    def export_state(self) -> Dict[Hashable, List[Dict]]:
+        with self._lock:
+            return {user_id: list(points) for user_id, points in self._points.items()}
+
+    def load_state(self, state: Dict[Hashable, List[Dict]]) -> None:
+        with self._lock:
+            for user_id, points in state.items():
+                self._points[user_id] = deque(points, maxlen=self.size)
+
+    def get(self, user_id: Hashable, session_id: str) -> List[Dict]:
+        with self._lock:
+            return [p for p in self._points.get(user_id, ()) if p.get("session_id") == session_id]
+
+
+recent_points = RecentPoints()
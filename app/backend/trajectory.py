@@ -0,0 +1,100 @@
+"""Track simplification (Douglas-Peucker) and Google polyline encoding.
+
+Points are projected to local meters (equirectangular around the track's mean
+latitude, accurate to well under a meter at office scale). The per-segment
+distance search runs on numpy arrays when numpy is installed, pure Python
+otherwise.
+"""
+import math
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS = 6371000
+
+
+def _project(coords: Sequence[Tuple[float, float]]) -> Tuple[List[float], List[float]]:
+    lat0 = math.radians(sum(lat for lat, _ in coords) / len(coords))
+    kx = math.cos(lat0) * math.pi / 180 * EARTH_RADIUS
+    ky = math.pi / 180 * EARTH_RADIUS
+    return [lng * kx for _, lng in coords], [lat * ky for lat, _ in coords]
+
+
+def _farthest_python(xs, ys, first: int, last: int) -> Tuple[int, float]:
+    ax, ay, bx, by = xs[first], ys[first], xs[last], ys[last]
+    dx, dy = bx - ax, by - ay
+    length = math.hypot(dx, dy)
+    best, best_dist = first, -1.0
+    for i in range(first + 1, last):
+        if length == 0:
+            dist = math.hypot(xs[i] - ax, ys[i] - ay)
+        else:
+            dist = abs(dy * (xs[i] - ax) - dx * (ys[i] - ay)) / length
+        if dist > best_dist:
+            best, best_dist = i, dist
+    return best, best_dist
+
+
+def _farthest_numpy(xs, ys, first: int, last: int) -> Tuple[int, float]:
+    ax, ay, bx, by = xs[first], ys[first], xs[last], ys[last]
+    dx, dy = bx - ax, by - ay
+    px, py = xs[first + 1:last] - ax, ys[first + 1:last] - ay
+    length = math.hypot(dx, dy)
+    if length == 0:
+        dists = numpy.hypot(px, py)
+    else:
+        dists = numpy.abs(dy * px - dx * py) / length
+    i = int(dists.argmax())
+    return first + 1 + i, float(dists[i])
+
+
+def simplify(coords: Sequence[Tuple[float, float]], tolerance_m: float) -> List[int]:
+    """Indexes of the (lat, lng) points kept by Douglas-Peucker at `tolerance_m`."""
+    n = len(coords)
+    if n <= 2 or tolerance_m <= 0:
+        return list(range(n))
+    xs, ys = _project(coords)
+    if numpy is not None:
+        xs, ys = numpy.asarray(xs), numpy.asarray(ys)
+        farthest = _farthest_numpy
+    else:
+        farthest = _farthest_python
+
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    # Iterative, so long tracks can't hit the recursion limit
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, dist = farthest(xs, ys, first, last)
+        if dist > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+def _encode_value(value: int, out: List[str]) -> None:
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(coords: Sequence[Tuple[float, float]], precision: int = 5) -> str:
+    """Google encoded polyline format."""
+    factor = 10 ** precision
+    out: List[str] = []
+    prev_lat = prev_lng = 0
+    for lat, lng in coords:
+        lat_i, lng_i = int(round(lat * factor)), int(round(lng * factor))
+        _encode_value(lat_i - prev_lat, out)
+        _encode_value(lng_i - prev_lng, out)
+        prev_lat, prev_lng = lat_i, lng_i
+    return "".join(out)
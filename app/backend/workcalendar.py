@@ -0,0 +1,282 @@
+"""Work calendar: per-weekday hours, lunch breaks, holidays and per-user shifts.
+
+Settings are compiled into minute-of-week tables (Monday 00:00 = minute 0):
+`shift_bits` (work_start..work_end, lunch included, end minute included as the
+old "HH:MM" comparison did) and `work_bits` (work_start..work_end minus lunch),
+plus prefix sums of `work_bits`. "Is this minute working?" is one lookup and
+"working minutes between t1 and t2" is two prefix-sum lookups per full-week
+span, minus the shifts of holidays in the range.
+
+Settings keys (all but the first four optional):
+
+    "work_start", "work_end", "lunch_start", "lunch_end"   every day's default
+    "days": {"sat": {"work_end": "14:00", "lunch_start": null}, "sun": null}
+    "holidays": ["2026-01-01", ...]
+    "shifts": {"<user id>": {"work_start": "22:00", "work_end": "06:00", "days": {...}}}
+
+A day set to null is a day off. work_end <= work_start is an overnight shift;
+it belongs to the day it starts on (also for holidays). Compiled calendars are
+cached until settings.json changes.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Hashable, List, Optional, Tuple
+from database import db, get_settings, SETTINGS_FILE
+from metrics import cache_hit, cache_miss
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+TIME_KEYS = ("work_start", "work_end", "lunch_start", "lunch_end")
+
+# (start, end, lunch_start, lunch_end) in minutes from the day's midnight; end may pass 1440
+DaySpec = Tuple[int, int, Optional[int], Optional[int]]
+
+
+def parse_minutes(value: str) -> int:
+    try:
+        hours, minutes = value.split(":")
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    return hours * 60 + minutes
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid holiday {value!r}, expected YYYY-MM-DD")
+
+
+def _abs_minute(ts: datetime) -> int:
+    # date.toordinal() is 1 for 0001-01-01, a Monday, so this is 0 mod WEEK at Monday 00:00
+    return (ts.toordinal() - 1) * DAY_MINUTES + ts.hour * 60 + ts.minute
+
+
+def _day_spec(layers: List[Dict], weekday: str) -> Optional[DaySpec]:
+    """Merge global settings and a user's shift for one weekday; None = day off."""
+    values: Dict[str, Optional[str]] = {}
+    off = False
+    for layer in layers:
+        values.update({key: layer[key] for key in TIME_KEYS if key in layer})
+        days = layer.get("days") or {}
+        if weekday in days:
+            day = days[weekday]
+            off = day is None
+            if day is not None:
+                values.update({key: day[key] for key in TIME_KEYS if key in day})
+    if off or not values.get("work_start") or not values.get("work_end"):
+        return None
+    start = parse_minutes(values["work_start"])
+    end = parse_minutes(values["work_end"])
+    if end <= start:
+        end += DAY_MINUTES
+    lunch_start = lunch_end = None
+    if values.get("lunch_start") and values.get("lunch_end"):
+        lunch_start = parse_minutes(values["lunch_start"])
+        lunch_end = parse_minutes(values["lunch_end"])
+        # Lunch after midnight of an overnight shift
+        if lunch_start < start:
+            lunch_start += DAY_MINUTES
+        if lunch_end < lunch_start:
+            lunch_end += DAY_MINUTES
+    return start, end, lunch_start, lunch_end
+
+
+class WorkCalendar:
+    def __init__(self, days: List[Optional[DaySpec]], holidays: List[str]):
+        self.days = days
+        self.holidays = sorted({_parse_date(day).toordinal() for day in holidays})
+        self._holiday_set = set(self.holidays)
+        self.shift_bits = bytearray(WEEK_MINUTES)
+        self.work_bits = bytearray(WEEK_MINUTES)
+        # 1 where the minute belongs to the previous day's (overnight) shift
+        self.carried = bytearray(WEEK_MINUTES)
+        for weekday, spec in enumerate(days):
+            if spec is None:
+                continue
+            start, end, lunch_start, lunch_end = spec
+            base = weekday * DAY_MINUTES
+            for minute in range(start, end):
+                index = (base + minute) % WEEK_MINUTES
+                if self.shift_bits[index]:
+                    raise ValueError(f"Shifts overlap on {WEEKDAYS[index // DAY_MINUTES]}")
+                self.shift_bits[index] = 1
+                self.carried[index] = minute >= DAY_MINUTES
+                if lunch_start is None or not lunch_start <= minute < lunch_end:
+                    self.work_bits[index] = 1
+        # The end minute itself counts as on shift, unless the next shift already starts there
+        for weekday, spec in enumerate(days):
+            if spec is not None:
+                index = (weekday * DAY_MINUTES + spec[1]) % WEEK_MINUTES
+                if not self.shift_bits[index]:
+                    self.shift_bits[index] = 1
+                    self.carried[index] = spec[1] >= DAY_MINUTES
+        self.prefix = [0] * (WEEK_MINUTES + 1)
+        for index, bit in enumerate(self.work_bits):
+            self.prefix[index + 1] = self.prefix[index] + bit
+        self.week_working_minutes = self.prefix[-1]
+        self.week_work_days = sum(spec is not None for spec in days)
+
+    def _owner_ordinal(self, ts: datetime, index: int) -> int:
+        return ts.toordinal() - self.carried[index]
+
+    def on_shift(self, ts: datetime) -> bool:
+        """Within the shift, lunch included."""
+        index = _abs_minute(ts) % WEEK_MINUTES
+        return bool(self.shift_bits[index]) and self._owner_ordinal(ts, index) not in self._holiday_set
+
+    def is_working(self, ts: datetime) -> bool:
+        """Within the shift and not at lunch."""
+        index = _abs_minute(ts) % WEEK_MINUTES
+        return bool(self.work_bits[index]) and self._owner_ordinal(ts, index) not in self._holiday_set
+
+    def _count(self, start: int, end: int) -> int:
+        """Working minutes in [start, end) of absolute minutes, holidays not excluded."""
+        if end <= start:
+            return 0
+        weeks_start, rest_start = divmod(start, WEEK_MINUTES)
+        weeks_end, rest_end = divmod(end, WEEK_MINUTES)
+        return (weeks_end - weeks_start) * self.week_working_minutes + self.prefix[rest_end] - self.prefix[rest_start]
+
+    def working_minutes(self, start: datetime, end: datetime) -> int:
+        """Working minutes between two times (whole minutes, lunch and holidays excluded)."""
+        a, b = _abs_minute(start), _abs_minute(end)
+        total = self._count(a, b)
+        # Holidays whose shift can reach into [start, end): overnight shifts start the day before
+        lo = bisect_left(self.holidays, start.toordinal() - 1)
+        hi = bisect_right(self.holidays, end.toordinal())
+        for ordinal in self.holidays[lo:hi]:
+            spec = self.days[(ordinal - 1) % 7]
+            if spec is None:
+                continue
+            base = (ordinal - 1) * DAY_MINUTES
+            total -= self._count(max(a, base + spec[0]), min(b, base + spec[1]))
+        return total
+
+    def shift_for(self, day: date) -> Optional[Tuple[datetime, datetime]]:
+        """(start, end) of the shift starting on `day`; None on days off and holidays."""
+        spec = self.days[day.weekday()]
+        if spec is None or day.toordinal() in self._holiday_set:
+            return None
+        midnight = datetime.combine(day, time())
+        return midnight + timedelta(minutes=spec[0]), midnight + timedelta(minutes=spec[1])
+
+    def shift_day(self, ts: datetime) -> date:
+        """Day of the shift `ts` belongs to: the day before in the after-midnight part of an
+        overnight shift, and after it ends until that day's own shift starts; else ts's date."""
+        today = ts.date()
+        index = _abs_minute(ts) % WEEK_MINUTES
+        if self.shift_bits[index]:
+            return today - timedelta(days=self.carried[index])
+        previous = self.shift_for(today - timedelta(days=1))
+        if previous and previous[1].date() == today:
+            current = self.shift_for(today)
+            if current is None or ts < current[0]:
+                return previous[0].date()
+        return today
+
+    def boundaries(self, day: date) -> Optional[Dict[str, datetime]]:
+        """work_start, work_end, lunch_start, lunch_end of the shift starting on `day`
+        (lunch None without a break); None on days off and holidays."""
+        shift = self.shift_for(day)
+        if shift is None:
+            return None
+        _, _, lunch_start, lunch_end = self.days[day.weekday()]
+        midnight = datetime.combine(day, time())
+        return {
+            "work_start": shift[0],
+            "work_end": shift[1],
+            "lunch_start": midnight + timedelta(minutes=lunch_start) if lunch_start is not None else None,
+            "lunch_end": midnight + timedelta(minutes=lunch_end) if lunch_end is not None else None
+        }
+
+    def next_shift_start(self, ts: datetime) -> Optional[datetime]:
+        """Start of the first shift after `ts` within a week; None if every day is off."""
+        day = ts.date()
+        for offset in range(8):
+            shift = self.shift_for(day + timedelta(days=offset))
+            if shift and shift[0] > ts:
+                return shift[0]
+        return None
+
+    def late_minutes(self, day: date, started: datetime) -> int:
+        """Working minutes between the shift start and `started`."""
+        shift = self.shift_for(day)
+        if shift is None or started <= shift[0]:
+            return 0
+        return self.working_minutes(shift[0], min(started, shift[1]))
+
+    def early_leave_minutes(self, day: date, ended: datetime) -> int:
+        """Working minutes between `ended` and the shift end."""
+        shift = self.shift_for(day)
+        if shift is None or ended >= shift[1]:
+            return 0
+        return self.working_minutes(max(ended, shift[0]), shift[1])
+
+    def work_days(self, start: date, end: date) -> int:
+        """Days with a shift in [start, end], holidays excluded."""
+        if end < start:
+            return 0
+        first, last = start.toordinal(), end.toordinal()
+        weeks, rest = divmod(last - first + 1, 7)
+        count = weeks * self.week_work_days
+        count += sum(self.days[(first - 1 + weeks * 7 + i) % 7] is not None for i in range(rest))
+        lo, hi = bisect_left(self.holidays, first), bisect_right(self.holidays, last)
+        count -= sum(self.days[(ordinal - 1) % 7] is not None for ordinal in self.holidays[lo:hi])
+        return count
+
+
+def compile_calendar(settings: Dict, shift: Optional[Dict] = None) -> WorkCalendar:
+    """Raises ValueError on malformed times, weekday names or dates."""
+    layers = [settings] + ([shift] if shift else [])
+    for layer in layers:
+        unknown = set(layer.get("days") or {}) - set(WEEKDAYS)
+        if unknown:
+            raise ValueError(f"Unknown weekday(s) {sorted(unknown)}, expected {', '.join(WEEKDAYS)}")
+    return WorkCalendar([_day_spec(layers, weekday) for weekday in WEEKDAYS], settings.get("holidays") or [])
+
+
+def validate(settings: Dict) -> None:
+    """Compile the calendar and every shift once, so bad settings are rejected when saved."""
+    compile_calendar(settings)
+    for shift in (settings.get("shifts") or {}).values():
+        compile_calendar(settings, shift)
+
+
+class CalendarCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._settings: Dict = {}
+        self._default: Optional[WorkCalendar] = None
+        self._users: Dict[str, WorkCalendar] = {}
+
+    def get(self, user_id: Optional[Hashable] = None) -> WorkCalendar:
+        """Calendar of `user_id` (their shift if they have one), else the default."""
+        # Version is taken before reading, so a concurrent change only causes a recompile later
+        version = db.version(SETTINGS_FILE)
+        with self._lock:
+            if version != self._version or self._default is None:
+                cache_miss("work_calendar")
+                self._settings = get_settings()
+                self._default = compile_calendar(self._settings)
+                self._users = {}
+                self._version = version
+            else:
+                cache_hit("work_calendar")
+            shifts = self._settings.get("shifts") or {}
+            key = str(user_id)
+            if user_id is None or key not in shifts:
+                return self._default
+            calendar = self._users.get(key)
+            if calendar is None:
+                calendar = self._users[key] = compile_calendar(self._settings, shifts[key])
+            return calendar
+
+
+calendars = CalendarCache()
@@ -373,6 +373,29 @@ function showAlert(message) {
 }
 
 // Location
+function newEventId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+}
+
+// Tarmoq xatosida qayta yuboriladi; bir xil event_id server tomonda dublikatni oldini oladi
+async function sendLocation(coords, attempts = 3) {
+    const body = JSON.stringify({
+        latitude: coords.latitude,
+        longitude: coords.longitude,
+        event_id: newEventId()
+    });
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await api('/locations/record', { method: 'POST', body });
+        } catch (error) {
+            // fetch() tarmoq xatolari TypeError bo'ladi; HTTP xatolar qayta yuborilmaydi
+            if (!(error instanceof TypeError) || attempt >= attempts) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+    }
+}
+
 document.getElementById('send-location-btn').addEventListener('click', () => {
     if (!navigator.geolocation) {
         showAlert('Geolokatsiya qo\'llab-quvvatlanmaydi');
@@ -382,13 +405,7 @@ document.getElementById('send-location-btn').addEventListener('click', () => {
     navigator.geolocation.getCurrentPosition(
         async (position) => {
             try {
-                const result = await api('/locations/record', {
-                    method: 'POST',
-                    body: JSON.stringify({
-                        latitude: position.coords.latitude,
-                        longitude: position.coords.longitude
-                    })
-                });
+                const result = await sendLocation(position.coords);
 
                 if (result.recorded === false) {
                     showAlert(result.message);
@@ -431,7 +448,7 @@ document.getElementById('submit-report-btn').addEventListener('click', async ()
 
 async function loadReportHistory() {
     try {
-        const reports = await api('/reports/history');
+        const reports = await api('/reports/history?include_content=true');
         const container = document.getElementById('report-history');
 
         if (reports.length === 0) {
@@ -492,7 +509,7 @@ async function loadStatistics() {
 
         const chartData = await api('/statistics/chart/me', {
             method: 'POST',
-            body: JSON.stringify({ start_date: startDate, end_date: endDate })
+            body: JSON.stringify({ start_date: startDate, end_date: endDate, granularity: 'auto' })
         });
         renderChart(chartData);
     } catch (error) {
@@ -0,0 +1,385 @@
+"""Broadcast and reminder engine."""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import date as Date, datetime, time as Time, timedelta
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+from telegram.error import Forbidden, BadRequest, NetworkError, RetryAfter
+
+from config import config
+from database import db
+
+logger = logging.getLogger(__name__)
+
+USERS_FILE = "users.json"
+SESSIONS_FILE = "sessions.json"
+REPORTS_FILE = "reports.json"
+SETTINGS_FILE = "settings.json"
+BROADCASTS_FILE = "broadcasts.json"
+
+# Progress is flushed to disk every N deliveries (and once at the end)
+CHECKPOINT_EVERY = 20
+
+# The reminder loop re-reads settings at least this often
+REMINDER_MAX_SLEEP = 3600
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds` (Telegram flood wait)."""
+        self.paused_until = max(self.paused_until, self._clock() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self.paused_until:
+                    await self._sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await self._sleep((1 - self.tokens) / self.rate)
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+class Broadcaster:
+    """Send one text to many chats with bounded concurrency and rate limits.
+
+    `bot` only needs an async `send_message(chat_id=..., text=..., parse_mode=...)`,
+    so a local fake object can stand in for `telegram.Bot`.
+    """
+
+    def __init__(
+        self,
+        bot,
+        global_rate: float = None,
+        per_chat_rate: float = None,
+        concurrency: int = None,
+        max_retries: int = 3,
+        clock=time.monotonic,
+        sleep=asyncio.sleep
+    ):
+        self.bot = bot
+        self.global_bucket = TokenBucket(
+            global_rate or config.BROADCAST_GLOBAL_RATE,
+            capacity=global_rate or config.BROADCAST_GLOBAL_RATE,
+            clock=clock, sleep=sleep
+        )
+        self.per_chat_rate = per_chat_rate or config.BROADCAST_PER_CHAT_RATE
+        self.concurrency = concurrency or config.BROADCAST_CONCURRENCY
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, clock=self._clock, sleep=self._sleep)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _send(self, chat_id: int, text: str, parse_mode: Optional[str]) -> Optional[str]:
+        """Deliver one message. Returns None on success, error text otherwise."""
+        flood_waits = 0
+        network_errors = 0
+        while True:
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return None
+            except RetryAfter as e:
+                # Flood wait applies to the whole bot, not just this chat
+                flood_waits += 1
+                if flood_waits > self.max_retries:
+                    return str(e)
+                delay = _retry_after_seconds(e)
+                logger.warning(f"Flood wait {delay}s while sending to {chat_id}")
+                self.global_bucket.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                return str(e)
+            except NetworkError as e:
+                network_errors += 1
+                if network_errors > self.max_retries:
+                    return str(e)
+                await self._sleep(2 ** network_errors)
+
+    async def run(self, broadcast: Dict) -> Dict:
+        """Deliver `broadcast` to every recipient not yet sent/failed, checkpointing progress."""
+        sent = set(broadcast.get("sent", []))
+        failed = dict(broadcast.get("failed", {}))
+        pending = [
+            chat_id for chat_id in broadcast["recipients"]
+            if chat_id not in sent and str(chat_id) not in failed
+        ]
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in pending:
+            queue.put_nowait(chat_id)
+
+        done_since_checkpoint = 0
+        checkpoint_lock = asyncio.Lock()
+
+        async def checkpoint():
+            await db.update(BROADCASTS_FILE, "id", broadcast["id"], {
+                "sent": sorted(sent),
+                "failed": failed,
+                "updated_at": datetime.now().isoformat()
+            })
+
+        async def worker():
+            nonlocal done_since_checkpoint
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                error = await self._send(chat_id, broadcast["text"], broadcast.get("parse_mode"))
+                if error is None:
+                    sent.add(chat_id)
+                else:
+                    failed[str(chat_id)] = error
+                    logger.info(f"Broadcast {broadcast['id']} failed for {chat_id}: {error}")
+                self._chat_buckets.pop(chat_id, None)
+
+                async with checkpoint_lock:
+                    done_since_checkpoint += 1
+                    if done_since_checkpoint >= CHECKPOINT_EVERY:
+                        done_since_checkpoint = 0
+                        await checkpoint()
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(pending)) or 1)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await checkpoint()
+
+        updates = {"status": "done", "finished_at": datetime.now().isoformat()}
+        await db.update(BROADCASTS_FILE, "id", broadcast["id"], updates)
+        broadcast.update(sent=sorted(sent), failed=failed, **updates)
+        logger.info(f"Broadcast {broadcast['id']} done: {len(sent)} sent, {len(failed)} failed")
+        return broadcast
+
+
+async def create_broadcast(
+    broadcast_id: str,
+    kind: str,
+    text: str,
+    recipients: Iterable[int],
+    parse_mode: Optional[str] = None
+) -> Dict:
+    """Persist a new broadcast, or return the existing one with the same id."""
+    existing = await db.find_one(BROADCASTS_FILE, "id", broadcast_id)
+    if existing:
+        return existing
+
+    broadcast = {
+        "id": broadcast_id,
+        "kind": kind,
+        "text": text,
+        "parse_mode": parse_mode,
+        "recipients": list(dict.fromkeys(recipients)),
+        "sent": [],
+        "failed": {},
+        "status": "running",
+        "created_at": datetime.now().isoformat(),
+        "updated_at": datetime.now().isoformat(),
+        "finished_at": None
+    }
+    await db.append(BROADCASTS_FILE, broadcast)
+    return broadcast
+
+
+async def get_unfinished_broadcasts() -> List[Dict]:
+    return await db.find_many(BROADCASTS_FILE, {"status": "running"})
+
+
+async def resume_broadcasts(bot) -> List[Dict]:
+    """Finish broadcasts interrupted by a restart."""
+    results = []
+    for broadcast in await get_unfinished_broadcasts():
+        logger.info(f"Resuming broadcast {broadcast['id']}")
+        results.append(await Broadcaster(bot).run(broadcast))
+    return results
+
+
+# Recipient builders
+async def _active_telegram_users() -> List[Dict]:
+    users = await db.find_many(USERS_FILE, {"status": "active"})
+    return [u for u in users if isinstance(u.get("telegram_id"), int)]
+
+
+async def get_missing_report_recipients(date: str) -> List[int]:
+    """Active Telegram users who have not submitted a report for `date`."""
+    reports = await db.find_many(REPORTS_FILE, {"date": date})
+    submitted = {r.get("user_id") for r in reports}
+    return [u["telegram_id"] for u in await _active_telegram_users() if u["telegram_id"] not in submitted]
+
+
+async def get_open_session_recipients(date: str) -> List[int]:
+    """Telegram users whose session for `date` is still online."""
+    sessions = await db.find_many(SESSIONS_FILE, {"date": date, "status": "online"})
+    return [s["user_id"] for s in sessions if isinstance(s.get("user_id"), int)]
+
+
+async def get_settings() -> Dict:
+    settings = await db.read(SETTINGS_FILE)
+    return settings if isinstance(settings, dict) and settings else {"work_end": "18:00"}
+
+
+def _reminder_id(kind: str, date: str, auto: bool, group: str = "") -> str:
+    """The daily loop's reminder is sent once per date (and shift group), even across restarts;
+    manual ones always go out."""
+    if auto:
+        return f"auto-{kind}-{date}{group}"
+    return f"{kind}-{date}-{uuid.uuid4().hex[:8]}"
+
+
+async def send_report_reminders(bot, date: str = None, auto: bool = False,
+                                users: Optional[Collection[int]] = None, group: str = "") -> Dict:
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    recipients = await get_missing_report_recipients(date)
+    broadcast = await create_broadcast(
+        _reminder_id("report-reminder", date, auto, group),
+        "report_reminder",
+        "📝 Bugungi hisobotingiz hali topshirilmagan.\n"
+        "Iltimos, Mini App orqali hisobot yuboring.",
+        recipients if users is None else [chat_id for chat_id in recipients if chat_id in users]
+    )
+    if broadcast["status"] == "done":
+        return broadcast
+    return await Broadcaster(bot).run(broadcast)
+
+
+async def send_open_session_reminders(bot, date: str = None, auto: bool = False,
+                                      users: Optional[Collection[int]] = None, group: str = "") -> Dict:
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    recipients = await get_open_session_recipients(date)
+    broadcast = await create_broadcast(
+        _reminder_id("session-reminder", date, auto, group),
+        "session_reminder",
+        "⏰ Ish vaqti tugadi, lekin sessiyangiz hali ochiq.\n"
+        "Iltimos, Mini App orqali sessiyani tugating.",
+        recipients if users is None else [chat_id for chat_id in recipients if chat_id in users]
+    )
+    if broadcast["status"] == "done":
+        return broadcast
+    return await Broadcaster(bot).run(broadcast)
+
+
+def _parse_hhmm(value: str) -> Time:
+    return datetime.strptime(value, "%H:%M").time()
+
+
+def shift_end(settings: Dict, shift: Optional[Dict], day: Date) -> Optional[datetime]:
+    """End of the shift starting on `day`, merged the way the backend's work calendar does it
+    (settings, then the user's shift; per-weekday `days`, null = day off). None on days off
+    and holidays; an overnight shift ends the next day."""
+    if day.isoformat() in (settings.get("holidays") or []):
+        return None
+    weekday = WEEKDAYS[day.weekday()]
+    values: Dict[str, str] = {}
+    off = False
+    for layer in [settings] + ([shift] if shift else []):
+        values.update({key: layer[key] for key in ("work_start", "work_end") if key in layer})
+        days = layer.get("days") or {}
+        if weekday in days:
+            off = days[weekday] is None
+            if not off:
+                values.update({key: days[weekday][key] for key in ("work_start", "work_end") if key in days[weekday]})
+    if off or not values.get("work_start") or not values.get("work_end"):
+        return None
+    start, end = _parse_hhmm(values["work_start"]), _parse_hhmm(values["work_end"])
+    ends = datetime.combine(day, end)
+    return ends + timedelta(days=1) if end <= start else ends
+
+
+async def _reminder_groups(settings: Dict) -> List[Tuple[Optional[Dict], List[int], str]]:
+    """(shift, user ids, broadcast id suffix): everyone on the default hours, then each user with a shift."""
+    shifts = settings.get("shifts") or {}
+    users = [u["telegram_id"] for u in await _active_telegram_users()]
+    groups = [(None, [uid for uid in users if str(uid) not in shifts], "")]
+    groups += [(shifts[str(uid)], [uid], f"-{uid}") for uid in users if str(uid) in shifts]
+    return groups
+
+
+async def next_reminder_time(now: datetime) -> Optional[datetime]:
+    """The first shift end after `now` within a week, over every group; None if all days are off."""
+    settings = await get_settings()
+    ends = [
+        end
+        for shift, _, _ in await _reminder_groups(settings)
+        for offset in range(-1, 8)
+        for end in [shift_end(settings, shift, now.date() + timedelta(days=offset))]
+        if end and end > now
+    ]
+    return min(ends, default=None)
+
+
+async def send_due_reminders(bot, since: datetime, now: datetime) -> List[Tuple[str, str]]:
+    """Remind each group whose shift ended in (since, now], for the day the shift started.
+    Returns the (date, group) pairs reminded."""
+    settings = await get_settings()
+    reminded = []
+    for shift, user_ids, group in await _reminder_groups(settings):
+        if not user_ids:
+            continue
+        day = since.date() - timedelta(days=1)
+        while day <= now.date():
+            end = shift_end(settings, shift, day)
+            if end and since < end <= now:
+                date = day.isoformat()
+                await send_open_session_reminders(bot, date, auto=True, users=set(user_ids), group=group)
+                await send_report_reminders(bot, date, auto=True, users=set(user_ids), group=group)
+                reminded.append((date, group))
+            day += timedelta(days=1)
+    return reminded
+
+
+async def reminder_loop(bot):
+    """Send both reminders when each shift ends: per-weekday hours and per-user shifts,
+    nothing on days off and holidays."""
+    since = datetime.now()
+    while True:
+        try:
+            due = await next_reminder_time(since)
+        except Exception as e:
+            logger.error(f"Reminder schedule failed: {e}")
+            due = None
+        wait = REMINDER_MAX_SLEEP if due is None else (due - datetime.now()).total_seconds()
+        await asyncio.sleep(min(max(wait, 0), REMINDER_MAX_SLEEP))
+        now = datetime.now()
+        try:
+            await send_due_reminders(bot, since, now)
+        except Exception as e:
+            logger.error(f"Reminder broadcast failed: {e}")
+        since = now
@@ -18,6 +18,20 @@ class Config:
     API_URL: str = field(default_factory=lambda: os.getenv("API_URL", "http://localhost:8000"))
     WEBAPP_URL: str = field(default_factory=lambda: os.getenv("WEBAPP_URL", ""))
     DATA_DIR: str = field(default_factory=lambda: os.getenv("DATA_DIR", "data"))
+    # Telegram: ~30 msg/s per bot, ~1 msg/s per chat
+    BROADCAST_GLOBAL_RATE: float = field(default_factory=lambda: float(os.getenv("BROADCAST_GLOBAL_RATE", "25")))
+    BROADCAST_PER_CHAT_RATE: float = field(default_factory=lambda: float(os.getenv("BROADCAST_PER_CHAT_RATE", "1")))
+    BROADCAST_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("BROADCAST_CONCURRENCY", "8")))
+    STORAGE_FORMAT: str = field(default_factory=lambda: os.getenv("STORAGE_FORMAT", "json-compact"))
+    STORAGE_MSGPACK_FILES: List[str] = field(default_factory=list)
+    # Unix socket of the backend storage daemon; empty = read/write DATA_DIR directly
+    STORAGE_SOCKET: str = field(default_factory=lambda: os.getenv("STORAGE_SOCKET", ""))
+    STORAGE_POOL_SIZE: int = field(default_factory=lambda: int(os.getenv("STORAGE_POOL_SIZE", "4")))
+    # Updates handled at once; updates from one chat always run in order
+    UPDATE_WORKERS: int = field(default_factory=lambda: int(os.getenv("UPDATE_WORKERS", "8")))
+    USER_CACHE_SIZE: int = field(default_factory=lambda: int(os.getenv("USER_CACHE_SIZE", "1000")))
+    SLOW_LOCK_MS: float = field(default_factory=lambda: float(os.getenv("SLOW_LOCK_MS", "0")))
+    REMINDERS_ENABLED: bool = field(default_factory=lambda: os.getenv("REMINDERS_ENABLED", "true").lower() == "true")
     
     def __post_init__(self):
         admin_ids_str = os.getenv("ADMIN_IDS", "")
@@ -27,6 +41,9 @@ class Config:
             except ValueError as e:
                 logger.error(f"Invalid ADMIN_IDS format: {e}")
                 self.ADMIN_IDS = []
+        msgpack_files = os.getenv("STORAGE_MSGPACK_FILES", "")
+        if msgpack_files:
+            self.STORAGE_MSGPACK_FILES = [x.strip() for x in msgpack_files.split(",") if x.strip()]
     
     def is_admin(self, user_id: int) -> bool:
         return user_id in self.ADMIN_IDS
@@ -1,33 +1,76 @@
 """Simple JSON database for bot."""
 import asyncio
-import json
 import logging
+import os
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from config import config
+from lockstats import InstrumentedLock
+from storage_client import RemoteDB
+import lockstats
+import serialization
 
 logger = logging.getLogger(__name__)
 
 
+def apply_changes(data: List[Dict], changes: List[Dict]) -> List[Optional[Dict]]:
+    """Apply update_many changes in place (same format as the backend's JsonDB)."""
+    indexes: Dict[str, Dict[Any, Dict]] = {}
+    results: List[Optional[Dict]] = []
+    for change in changes:
+        key = change["key"]
+        index = indexes.get(key)
+        if index is None:
+            index = indexes[key] = {}
+            for item in data:
+                index.setdefault(item.get(key), item)
+        item = index.get(change["value"])
+        where = change.get("where")
+        if item is not None and where and any(item.get(k) != v for k, v in where.items()):
+            # Changed since the caller looked at it: leave it alone
+            item = None
+        if item is not None:
+            item.update(change.get("set") or {})
+            for field_name, value in (change.get("set_missing") or {}).items():
+                if not item.get(field_name):
+                    item[field_name] = value
+        results.append(item)
+    return results
+
+
 class JsonDB:
     """Async-safe JSON database."""
     
-    _locks: Dict[str, asyncio.Lock] = {}
+    _locks: Dict[str, InstrumentedLock] = lockstats.registry
     _sync_lock = asyncio.Lock()
     
     def __init__(self):
         self.data_dir = Path(config.DATA_DIR)
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.formats = serialization.FormatPolicy.from_config(config.STORAGE_FORMAT, config.STORAGE_MSGPACK_FILES)
     
-    async def _get_lock(self, filename: str) -> asyncio.Lock:
+    async def _get_lock(self, filename: str) -> InstrumentedLock:
         async with self._sync_lock:
             if filename not in self._locks:
-                self._locks[filename] = asyncio.Lock()
+                self._locks[filename] = InstrumentedLock(filename)
             return self._locks[filename]
     
     def _filepath(self, filename: str) -> Path:
         return self.data_dir / filename
     
+    def _load(self, filepath: Path):
+        with open(filepath, "rb") as f:
+            return serialization.decode(f.read())
+    
+    def _dump(self, filename: str, data):
+        """Atomic write: write to temp file first."""
+        filepath = self._filepath(filename)
+        temp_path = filepath.with_suffix('.tmp')
+        with open(temp_path, "wb") as f:
+            f.write(serialization.encode(data, self.formats.format_for(filename)))
+        temp_path.replace(filepath)
+    
     async def read(self, filename: str) -> List[Dict]:
         filepath = self._filepath(filename)
         lock = await self._get_lock(filename)
@@ -35,25 +78,19 @@ class JsonDB:
             if not filepath.exists():
                 return []
             try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON parse error in {filename}: {e}")
+                return self._load(filepath)
+            except serialization.DecodeError as e:
+                logger.error(f"Parse error in {filename}: {e}")
                 return []
             except IOError as e:
                 logger.error(f"IO error reading {filename}: {e}")
                 return []
     
     async def write(self, filename: str, data: List[Dict]) -> bool:
-        filepath = self._filepath(filename)
         lock = await self._get_lock(filename)
         async with lock:
             try:
-                # Atomic write: write to temp file first
-                temp_path = filepath.with_suffix('.tmp')
-                with open(temp_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                temp_path.replace(filepath)
+                self._dump(filename, data)
                 return True
             except IOError as e:
                 logger.error(f"IO error writing {filename}: {e}")
@@ -68,17 +105,12 @@ class JsonDB:
                 if not filepath.exists():
                     data = []
                 else:
-                    with open(filepath, "r", encoding="utf-8") as f:
-                        data = json.load(f)
+                    data = self._load(filepath)
                 
                 data.append(item)
-                
-                temp_path = filepath.with_suffix('.tmp')
-                with open(temp_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                temp_path.replace(filepath)
+                self._dump(filename, data)
                 return True
-            except (json.JSONDecodeError, IOError) as e:
+            except (serialization.DecodeError, IOError) as e:
                 logger.error(f"Error appending to {filename}: {e}")
                 return False
     
@@ -97,8 +129,7 @@ class JsonDB:
                 if not filepath.exists():
                     return False
                 
-                with open(filepath, "r", encoding="utf-8") as f:
-                    data = json.load(f)
+                data = self._load(filepath)
                 
                 found = False
                 for item in data:
@@ -110,15 +141,27 @@ class JsonDB:
                 if not found:
                     return False
                 
-                temp_path = filepath.with_suffix('.tmp')
-                with open(temp_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                temp_path.replace(filepath)
+                self._dump(filename, data)
                 return True
-            except (json.JSONDecodeError, IOError) as e:
+            except (serialization.DecodeError, IOError) as e:
                 logger.error(f"Error updating {filename}: {e}")
                 return False
     
+    async def update_many(self, filename: str, changes: List[Dict]) -> Optional[List[Optional[Dict]]]:
+        """Several updates in one read-modify-write; None if it failed."""
+        filepath = self._filepath(filename)
+        lock = await self._get_lock(filename)
+        async with lock:
+            try:
+                data = self._load(filepath) if filepath.exists() else []
+                results = apply_changes(data, changes)
+                if any(item is not None for item in results):
+                    self._dump(filename, data)
+                return results
+            except (serialization.DecodeError, IOError) as e:
+                logger.error(f"Error updating {filename}: {e}")
+                return None
+    
     async def find_many(self, filename: str, filters: Dict) -> List[Dict]:
         data = await self.read(filename)
         return [item for item in data if all(item.get(k) == v for k, v in filters.items())]
@@ -131,4 +174,104 @@ class JsonDB:
         return len([item for item in data if all(item.get(k) == v for k, v in filters.items())])
 
 
-db = JsonDB()
+db = RemoteDB(config.STORAGE_SOCKET, config.STORAGE_POOL_SIZE) if config.STORAGE_SOCKET else JsonDB()
+
+
+class UserCache:
+    """LRU of user records by telegram_id.
+    
+    Writes made through `create`/`update`/`update_many` update cached records
+    in place. Any other change to users.json (the backend API, another process)
+    changes the file's mtime/size and empties the cache on the next lookup.
+    Unknown ids are cached too, so repeated lookups from strangers are free.
+    """
+    
+    def __init__(self, db, filename: str = "users.json", max_entries: int = 1000):
+        self.db = db
+        self.filename = filename
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Optional[Dict]]" = OrderedDict()
+        self._stamp: Optional[Tuple[int, int]] = None
+        # Bumped on every invalidation, so a lookup racing a write never caches stale data
+        self._generation = 0
+        self._write_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.db.data_dir / self.filename)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+    
+    def _clear(self, stamp) -> None:
+        self._entries.clear()
+        self._stamp = stamp
+        self._generation += 1
+    
+    def _put(self, telegram_id: int, user: Optional[Dict]) -> None:
+        self._entries[telegram_id] = dict(user) if user is not None else None
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def get(self, telegram_id: int) -> Optional[Dict]:
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            self._clear(stamp)
+        if telegram_id in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(telegram_id)
+            user = self._entries[telegram_id]
+            return dict(user) if user is not None else None
+        self.misses += 1
+        generation = self._generation
+        user = await self.db.find_one(self.filename, "telegram_id", telegram_id)
+        if generation == self._generation and self._file_stamp() == self._stamp:
+            self._put(telegram_id, user)
+        return user
+    
+    async def _write(self, write, apply):
+        """Run `write`; if the cache was in step with the file, `apply` the change to it."""
+        async with self._write_lock:
+            before = self._file_stamp()
+            result = await write()
+            if not result:
+                return result
+            if before == self._stamp:
+                apply(result)
+                self._stamp = self._file_stamp()
+            else:
+                self._clear(None)
+            return result
+    
+    async def create(self, user: Dict) -> bool:
+        return await self._write(
+            lambda: self.db.append(self.filename, user),
+            lambda _: self._put(user["telegram_id"], user)
+        )
+    
+    async def update(self, telegram_id: int, updates: Dict) -> bool:
+        def apply(_):
+            cached = self._entries.get(telegram_id)
+            if cached is not None:
+                cached.update(updates)
+            else:
+                # Unknown or negatively cached: look it up again next time
+                self._entries.pop(telegram_id, None)
+        return await self._write(lambda: self.db.update(self.filename, "telegram_id", telegram_id, updates), apply)
+    
+    async def update_many(self, changes: List[Dict]) -> Optional[List[Optional[Dict]]]:
+        """db.update_many on users.json; changes must be keyed by telegram_id."""
+        def apply(results):
+            for user in results:
+                if user is not None and user.get("telegram_id") is not None:
+                    self._put(user["telegram_id"], user)
+        return await self._write(lambda: self.db.update_many(self.filename, changes), apply)
+    
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+users = UserCache(db, max_entries=config.USER_CACHE_SIZE)
@@ -1,26 +1,32 @@
 """Telegram Bot for Attendance System."""
 import logging
 import random
+import secrets
 import string
 from datetime import datetime
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 
 from config import config
-from database import db
+from database import db, users
+import broadcast
+import lockstats
+from updates import ChatOrderedUpdateProcessor
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 USERS_FILE = "users.json"
 USERS_PER_PAGE = 10
+# Pages shown for bulk approval, remembered per admin (context.user_data)
+APPROVE_PAGES_KEPT = 20
 
 # Global bot instance for sending messages
 bot_app = None
 
 
 async def get_user(telegram_id: int):
-    return await db.find_one(USERS_FILE, "telegram_id", telegram_id)
+    return await users.get(telegram_id)
 
 
 async def create_user(telegram_id: int, username: str, first_name: str, last_name: str):
@@ -41,7 +47,7 @@ async def create_user(telegram_id: int, username: str, first_name: str, last_nam
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
     }
-    success = await db.append(USERS_FILE, user)
+    success = await users.create(user)
     return user if success else None
 
 
@@ -50,10 +56,21 @@ def generate_password():
     return ''.join(random.choices(string.digits, k=5))
 
 
+def approval_text(username: str, password: str) -> str:
+    return (
+        "🎉 *Hisobingiz tasdiqlandi!*\n\n"
+        "Endi siz tizimdan foydalanishingiz mumkin.\n\n"
+        "🔐 *Browser orqali kirish uchun:*\n"
+        f"👤 Username: `{username}`\n"
+        f"🔑 Parol: `{password}`\n\n"
+        "⚠️ Bu parolni xavfsiz joyda saqlang!"
+    )
+
+
 async def update_user(telegram_id: int, updates: dict):
     """Update user data."""
     updates["updated_at"] = datetime.now().isoformat()
-    return await db.update(USERS_FILE, "telegram_id", telegram_id, updates)
+    return await users.update(telegram_id, updates)
 
 
 async def get_users_by_status(status: str):
@@ -138,7 +155,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "1. 📍 tugmasini bosing\n"
         "2. Jonli joylashuv tanlang\n"
         "3. 8 soat davomiylik tanlang\n\n"
-        "*Admin:* /admin",
+        "*Admin:* /admin, /remind\\_reports, /remind\\_sessions, /locks, /updates",
         parse_mode="Markdown"
     )
 
@@ -194,6 +211,82 @@ async def show_admin_panel(message, edit: bool = False):
         await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
 
 
+async def locks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /locks command - per-file lock statistics."""
+    if not config.is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔ Bu buyruq faqat adminlar uchun.")
+        return
+    
+    stats = lockstats.snapshot()
+    if not stats:
+        await update.message.reply_text("🔒 Lock statistikasi hali yo'q")
+        return
+    
+    lines = ["🔒 Lock statistikasi (ms)\n"]
+    for name, s in stats.items():
+        lines.append(
+            f"{name}: {s['acquisitions']} ta, kutish o'rt. {s['avg_wait_ms']} / max {s['max_wait_ms']}, "
+            f"ushlash o'rt. {s['avg_hold_ms']} / max {s['max_hold_ms']}, navbat max {s['max_queue_depth']}\n"
+            f"  eng uzoq: {s['longest_holder']}"
+        )
+    cache = users.stats()
+    lines.append(f"\n👤 Foydalanuvchi keshi: {cache['entries']} ta, hit {cache['hits']} / miss {cache['misses']}")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def updates_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /updates command - update queue depth and handler latency."""
+    if not config.is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔ Bu buyruq faqat adminlar uchun.")
+        return
+    
+    processor = context.application.update_processor
+    if not isinstance(processor, ChatOrderedUpdateProcessor):
+        await update.message.reply_text("⚙️ Yangilanishlar ketma-ket qayta ishlanmoqda")
+        return
+    
+    stats = processor.stats.as_dict()
+    lines = [
+        f"⚙️ Yangilanishlar ({processor.workers} worker)\n",
+        f"Navbatda: {stats['queued']} (max {stats['max_queued']})",
+        f"Ishlanmoqda: {stats['running']} (max {stats['max_running']})\n"
+    ]
+    for kind, s in stats["kinds"].items():
+        lines.append(
+            f"{kind}: {s['count']} ta, kutish o'rt. {s['avg_wait_ms']} / max {s['max_wait_ms']} ms, "
+            f"ishlash o'rt. {s['avg_handle_ms']} / p95 {s['p95_handle_ms']} / max {s['max_handle_ms']} ms"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+
+async def remind_reports_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /remind_reports command."""
+    await start_reminder(update, context, broadcast.send_report_reminders)
+
+
+async def remind_sessions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /remind_sessions command."""
+    await start_reminder(update, context, broadcast.send_open_session_reminders)
+
+
+async def start_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE, send):
+    """Run a reminder broadcast in the background and report the result to the admin."""
+    user_id = update.effective_user.id
+    if not config.is_admin(user_id):
+        await update.message.reply_text("⛔ Bu buyruq faqat adminlar uchun.")
+        return
+    
+    async def run():
+        result = await send(context.bot)
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=f"📣 Eslatma yuborildi: {len(result['sent'])} ta, xato: {len(result['failed'])} ta"
+        )
+    
+    context.application.create_task(run())
+    await update.message.reply_text("📣 Eslatmalar yuborilmoqda...")
+
+
 async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle location updates."""
     user_id = update.effective_user.id
@@ -242,7 +335,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Parse callback data
     if data.startswith("admin_pending_"):
         page = int(data.split("_")[2])
-        await show_pending_users(query, page)
+        await show_pending_users(query, context, page)
     
     elif data.startswith("admin_active_"):
         page = int(data.split("_")[2])
@@ -255,6 +348,9 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "admin_back":
         await show_admin_panel(query.message, edit=True)
     
+    elif data.startswith("approve_page_"):
+        await approve_pending_page(query, context, data[len("approve_page_"):])
+    
     elif data.startswith("approve_"):
         target_id = int(data.split("_")[1])
         target_user = await get_user(target_id)
@@ -267,14 +363,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             await context.bot.send_message(
                 chat_id=target_id,
-                text=(
-                    "🎉 *Hisobingiz tasdiqlandi!*\n\n"
-                    "Endi siz tizimdan foydalanishingiz mumkin.\n\n"
-                    "🔐 *Browser orqali kirish uchun:*\n"
-                    f"👤 Username: `{target_user.get('username', 'N/A')}`\n"
-                    f"🔑 Parol: `{password}`\n\n"
-                    "⚠️ Bu parolni xavfsiz joyda saqlang!"
-                ),
+                text=approval_text(target_user.get('username', 'N/A'), password),
                 parse_mode="Markdown"
             )
             await query.answer("✅ Tasdiqlandi va parol yuborildi", show_alert=True)
@@ -282,13 +371,13 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.error(f"Failed to send password to user {target_id}: {e}")
             await query.answer(f"✅ Tasdiqlandi. Parol: {password}", show_alert=True)
         
-        await show_pending_users(query, 0)
+        await show_pending_users(query, context, 0)
     
     elif data.startswith("block_"):
         target_id = int(data.split("_")[1])
         await update_user(target_id, {"status": "blocked"})
         await query.answer("⛔ Bloklandi", show_alert=True)
-        await show_pending_users(query, 0)
+        await show_pending_users(query, context, 0)
     
     elif data.startswith("unblock_"):
         target_id = int(data.split("_")[1])
@@ -323,7 +412,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_user_info(query, target_id)
 
 
-async def show_pending_users(query, page: int):
+async def show_pending_users(query, context: ContextTypes.DEFAULT_TYPE, page: int):
     """Show pending users with pagination."""
     users = await get_users_by_status("pending")
     
@@ -350,6 +439,16 @@ async def show_pending_users(query, page: int):
             InlineKeyboardButton("⛔", callback_data=f"block_{u['telegram_id']}")
         ])
     
+    # The button approves exactly the users shown here, whatever the list looks like when it's clicked
+    token = secrets.token_hex(4)
+    pages = context.user_data.setdefault("approve_pages", {})
+    pages[token] = {"page": page, "ids": [u["telegram_id"] for u in page_users]}
+    while len(pages) > APPROVE_PAGES_KEPT:
+        pages.pop(next(iter(pages)))
+    keyboard.append([
+        InlineKeyboardButton(f"✅ Sahifadagilarni tasdiqlash ({len(page_users)})", callback_data=f"approve_page_{token}")
+    ])
+    
     # Pagination buttons
     nav_buttons = []
     if page > 0:
@@ -370,6 +469,59 @@ async def show_pending_users(query, page: int):
     )
 
 
+async def approve_pending_page(query, context: ContextTypes.DEFAULT_TYPE, token: str):
+    """Approve the users shown on one page (`token` from show_pending_users) with a single users.json write.
+    
+    Only users still pending are approved; ones approved or blocked since are skipped.
+    """
+    shown = context.user_data.get("approve_pages", {}).pop(token, None)
+    if shown is None:
+        await query.message.reply_text("⌛ Ro'yxat eskirgan, qaytadan ko'rib tasdiqlang")
+        await show_pending_users(query, context, 0)
+        return
+    
+    now = datetime.now().isoformat()
+    changes = [
+        {
+            "key": "telegram_id",
+            "value": telegram_id,
+            "where": {"status": "pending"},
+            "set": {"status": "active", "password": generate_password(), "updated_at": now}
+        }
+        for telegram_id in shown["ids"]
+    ]
+    results = await users.update_many(changes)
+    if results is None:
+        await query.message.reply_text("❌ Saqlashda xatolik, qayta urinib ko'ring")
+        return
+    
+    lines = []
+    for approved in results:
+        if approved is None:
+            continue
+        username = approved.get('username') or 'N/A'
+        try:
+            await context.bot.send_message(
+                chat_id=approved["telegram_id"],
+                text=approval_text(username, approved["password"]),
+                parse_mode="Markdown"
+            )
+            sent = "📨"
+        except Exception as e:
+            logger.error(f"Failed to send password to user {approved['telegram_id']}: {e}")
+            sent = "⚠️"
+        lines.append(f"{sent} `{username}` — 🔑 `{approved['password']}`")
+    
+    skipped = len(changes) - len(lines)
+    await query.message.reply_text(
+        f"✅ *Tasdiqlandi: {len(lines)} ta*\n\n" + "\n".join(lines) +
+        (f"\n\n⏭ {skipped} ta o'tkazib yuborildi (allaqachon tasdiqlangan yoki bloklangan)" if skipped else "") +
+        "\n\n📨 - parol yuborildi, ⚠️ - yuborilmadi (o'zingiz yetkazing)",
+        parse_mode="Markdown"
+    )
+    await show_pending_users(query, context, shown["page"])
+
+
 async def show_users_list(query, status: str, page: int):
     """Show users list with pagination."""
     users = await get_users_by_status(status)
@@ -477,22 +629,39 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await help_command(update, context)
 
 
-def main():
-    """Run the bot."""
-    if not config.BOT_TOKEN:
-        logger.error("BOT_TOKEN is required! Set it in .env file")
-        return
-    
-    if not config.ADMIN_IDS:
-        logger.warning("No ADMIN_IDS configured. Admin features will be unavailable.")
+async def on_startup(app: Application):
+    """Resume interrupted broadcasts and start the daily reminder loop."""
+    app.create_task(broadcast.resume_broadcasts(app.bot))
+    if config.REMINDERS_ENABLED:
+        app.create_task(broadcast.reminder_loop(app.bot))
+
+
+def build_application(request=None) -> Application:
+    """Application with all handlers; run by main() or by the backend in webhook mode.
     
-    app = Application.builder().token(config.BOT_TOKEN).build()
+    `request` replaces the HTTP transport for Bot API calls (the backend's offline mode).
+    """
+    global bot_app
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(config.UPDATE_WORKERS))
+        .post_init(on_startup)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    app = builder.build()
+    bot_app = app
     
     # Command handlers
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("status", status_command))
     app.add_handler(CommandHandler("admin", admin_command))
+    app.add_handler(CommandHandler("locks", locks_command))
+    app.add_handler(CommandHandler("updates", updates_command))
+    app.add_handler(CommandHandler("remind_reports", remind_reports_command))
+    app.add_handler(CommandHandler("remind_sessions", remind_sessions_command))
     
     # Message handlers
     app.add_handler(MessageHandler(filters.LOCATION, handle_location))
@@ -500,7 +669,19 @@ def main():
     
     # Callback handler
     app.add_handler(CallbackQueryHandler(handle_callback))
+    return app
+
+
+def main():
+    """Run the bot."""
+    if not config.BOT_TOKEN:
+        logger.error("BOT_TOKEN is required! Set it in .env file")
+        return
+    
+    if not config.ADMIN_IDS:
+        logger.warning("No ADMIN_IDS configured. Admin features will be unavailable.")
     
+    app = build_application()
     logger.info("Bot ishga tushdi...")
     app.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
 
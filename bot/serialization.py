@@ -0,0 +1,171 @@
+"""Pluggable codecs for the data files.
+
+Formats:
+    json          - indented JSON (the original on-disk format)
+    json-compact  - JSON without whitespace
+    msgpack       - MessagePack, for large collections
+
+JSON is encoded/decoded with orjson or msgspec when installed, stdlib json
+otherwise. Reads auto-detect the format, so the bot and the backend can be
+upgraded independently. Enable msgpack only once both sides read it.
+
+Convert existing files (stop the bot and backend first):
+    python serialization.py convert --to json-compact
+    python serialization.py info
+"""
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON = "json"
+JSON_COMPACT = "json-compact"
+MSGPACK = "msgpack"
+FORMATS = (JSON, JSON_COMPACT, MSGPACK)
+
+# First byte of a MessagePack map (fixmap, map16, map32) or array (fixarray, array16, array32)
+_MSGPACK_FIRST_BYTES = frozenset(range(0x80, 0xA0)) | {0xDC, 0xDD, 0xDE, 0xDF}
+_UTF8_BOM = b"\xef\xbb\xbf"
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None or msgspec is not None
+
+
+def detect(raw: bytes) -> str:
+    """Guess the format of file contents."""
+    if raw and raw[0] in _MSGPACK_FIRST_BYTES:
+        return MSGPACK
+    head = raw.lstrip(_UTF8_BOM)[:64]
+    if b"\n " in head or b"\n\t" in head:
+        return JSON
+    return JSON_COMPACT
+
+
+def _encode_json(data: Any, indent: bool) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    if msgspec is not None and not indent:
+        return msgspec.json.encode(data)
+    if indent:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decode_json(raw: bytes) -> Any:
+    raw = raw.lstrip(_UTF8_BOM)
+    if orjson is not None:
+        return orjson.loads(raw)
+    if msgspec is not None:
+        return msgspec.json.decode(raw)
+    return json.loads(raw)
+
+
+def encode(data: Any, fmt: str = JSON_COMPACT) -> bytes:
+    if fmt == MSGPACK:
+        if msgpack is not None:
+            return msgpack.packb(data, use_bin_type=True)
+        if msgspec is not None:
+            return msgspec.msgpack.encode(data)
+        logger.warning("msgpack/msgspec not installed, writing compact JSON instead")
+        fmt = JSON_COMPACT
+    return _encode_json(data, indent=fmt == JSON)
+
+
+def decode(raw: bytes) -> Any:
+    """Decode file contents in any supported format."""
+    try:
+        if detect(raw) == MSGPACK:
+            if msgpack is not None:
+                return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+            if msgspec is not None:
+                return msgspec.msgpack.decode(raw)
+            raise DecodeError("File is MessagePack but msgpack/msgspec is not installed")
+        return _decode_json(raw)
+    except DecodeError:
+        raise
+    except Exception as e:
+        raise DecodeError(str(e)) from e
+
+
+class FormatPolicy:
+    """Which format to write for each file: a default plus per-file overrides."""
+
+    def __init__(self, default: str = JSON_COMPACT, overrides: Optional[Dict[str, str]] = None):
+        if default not in FORMATS:
+            raise ValueError(f"Unknown storage format: {default}")
+        self.default = default
+        self.overrides = overrides or {}
+
+    @classmethod
+    def from_config(cls, default: str, msgpack_files: Iterable[str]) -> "FormatPolicy":
+        return cls(default, {name: MSGPACK for name in msgpack_files})
+
+    def format_for(self, filename: str) -> str:
+        return self.overrides.get(filename, self.default)
+
+
+def convert_file(path: Path, fmt: str) -> Dict:
+    raw = path.read_bytes()
+    before = detect(raw)
+    data = decode(raw)
+    out = encode(data, fmt)
+    temp_path = path.with_suffix(".tmp")
+    temp_path.write_bytes(out)
+    os.replace(temp_path, path)
+    return {"file": path.name, "from": before, "to": fmt, "bytes_before": len(raw), "bytes_after": len(out)}
+
+
+def main():
+    from config import config
+
+    parser = argparse.ArgumentParser(description="Data file format tools")
+    parser.add_argument("--data-dir", default=config.DATA_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="Rewrite data files in another format")
+    convert.add_argument("--to", choices=FORMATS, required=True)
+    convert.add_argument("files", nargs="*", help="File names (default: every *.json in DATA_DIR)")
+    sub.add_parser("info", help="Show the detected format and size of each data file")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if args.command == "info":
+        for path in sorted(data_dir.glob("*.json")):
+            raw = path.read_bytes()
+            print(f"{path.name:<24} {detect(raw):<13} {len(raw):>12} bytes")
+        return
+
+    if args.to == MSGPACK and not msgpack_available():
+        parser.error("msgpack or msgspec must be installed to write MessagePack")
+    paths = [data_dir / name for name in args.files] if args.files else sorted(data_dir.glob("*.json"))
+    for path in paths:
+        r = convert_file(path, args.to)
+        print(f"{r['file']:<24} {r['from']:>13} -> {r['to']:<13} {r['bytes_before']:>12} -> {r['bytes_after']:>12} bytes")
+
+
+if __name__ == "__main__":
+    main()
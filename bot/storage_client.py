@@ -0,0 +1,106 @@
+"""Async client for the backend storage daemon (app/backend/storage_server.py).
+
+Same framing as the backend client: 4-byte big-endian length + payload in the
+data file codec.
+"""
+import asyncio
+import logging
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from config import config
+import serialization
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">I")
+MAX_FRAME = 256 * 1024 * 1024
+WIRE_FORMAT = serialization.MSGPACK if serialization.msgpack_available() else serialization.JSON_COMPACT
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class StorageError(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    """Unix socket connections reused across handlers."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle: List[Connection] = []
+
+    async def _connect(self) -> Connection:
+        return await asyncio.open_unix_connection(self.path)
+
+    def _put(self, conn: Connection) -> None:
+        if len(self._idle) < self.size:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def request(self, message: Dict) -> Any:
+        payload = serialization.encode(message, WIRE_FORMAT)
+        frame = HEADER.pack(len(payload)) + payload
+        reused = bool(self._idle)
+        reader, writer = self._idle.pop() if reused else await self._connect()
+        try:
+            try:
+                writer.write(frame)
+                await writer.drain()
+            except OSError:
+                if not reused:
+                    raise
+                # Idle connection went stale (daemon restarted); nothing was sent yet
+                writer.close()
+                reader, writer = await self._connect()
+                writer.write(frame)
+                await writer.drain()
+            (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+            if size > MAX_FRAME:
+                raise StorageError(f"Frame too large: {size}")
+            reply = serialization.decode(await reader.readexactly(size))
+        except BaseException:
+            writer.close()
+            raise
+        self._put((reader, writer))
+        if not reply.get("ok"):
+            raise StorageError(reply.get("error", "unknown error"))
+        return reply.get("result")
+
+
+class RemoteDB:
+    """Async JsonDB interface backed by the storage daemon."""
+
+    def __init__(self, socket_path: str, pool_size: int = 4):
+        self.data_dir = Path(config.DATA_DIR)
+        self.pool = ConnectionPool(socket_path, pool_size)
+
+    async def _call(self, op: str, filename: str, **args) -> Any:
+        return await self.pool.request({"op": op, "file": filename, **args})
+
+    async def read(self, filename: str) -> List[Dict]:
+        return await self._call("read", filename)
+
+    async def write(self, filename: str, data: List[Dict]) -> bool:
+        return await self._call("write", filename, data=data)
+
+    async def append(self, filename: str, item: Dict) -> bool:
+        return await self._call("append", filename, item=item)
+
+    async def find_one(self, filename: str, key: str, value: Any) -> Optional[Dict]:
+        return await self._call("find_one", filename, key=key, value=value)
+
+    async def update(self, filename: str, key: str, value: Any, updates: Dict) -> bool:
+        return await self._call("update", filename, key=key, value=value, updates=updates)
+
+    async def update_many(self, filename: str, changes: List[Dict]) -> Optional[List[Optional[Dict]]]:
+        return await self._call("update_many", filename, changes=changes)
+
+    async def find_many(self, filename: str, filters: Dict) -> List[Dict]:
+        return await self._call("find_many", filename, filters=filters)
+
+    async def count(self, filename: str, filters: Optional[Dict] = None) -> int:
+        return await self._call("count", filename, filters=filters)
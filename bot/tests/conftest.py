@@ -0,0 +1,14 @@
+"""Test settings, applied before any bot module is imported (config is read at import)."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BOT_DIR))
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="davomat-bot-test-")
+os.environ["BOT_TOKEN"] = "123456:TEST"
+os.environ["ADMIN_IDS"] = "42"
+os.environ["STORAGE_SOCKET"] = ""
+os.environ["REMINDERS_ENABLED"] = "false"
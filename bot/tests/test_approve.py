@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+import main
+from database import db, users
+
+USERS_FILE = "users.json"
+
+
+class FakeBot:
+    def __init__(self, fail_for=()):
+        self.sent = []
+        self.fail_for = set(fail_for)
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if chat_id in self.fail_for:
+            raise RuntimeError("Forbidden: bot was blocked by the user")
+        self.sent.append((chat_id, text))
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class FakeQuery:
+    def __init__(self):
+        self.message = FakeMessage()
+        self.edits = []
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append((text, kwargs.get("reply_markup")))
+
+
+def _seed(count: int) -> None:
+    asyncio.run(db.write(USERS_FILE, [
+        {"telegram_id": 2000 + n, "username": f"user{n}", "first_name": f"User{n}", "last_name": "",
+         "status": "pending", "created_at": "2026-10-19T09:00:00"}
+        for n in range(count)
+    ]))
+
+
+def _show(context, page: int = 0):
+    """Show the pending list; returns the query and the token of its approve-page button."""
+    query = FakeQuery()
+    asyncio.run(main.show_pending_users(query, context, page))
+    buttons = [button for row in query.edits[-1][1].inline_keyboard for button in row]
+    data = next(b.callback_data for b in buttons if b.callback_data.startswith("approve_page_"))
+    return query, data[len("approve_page_"):]
+
+
+def _approve(context, token: str, query: FakeQuery = None) -> FakeQuery:
+    query = query or FakeQuery()
+    asyncio.run(main.approve_pending_page(query, context, token))
+    return query
+
+
+def _context(bot: FakeBot) -> SimpleNamespace:
+    return SimpleNamespace(bot=bot, user_data={})
+
+
+def test_approves_one_page_and_sends_passwords():
+    _seed(12)
+    bot = FakeBot(fail_for={2003})
+    context = _context(bot)
+    query, token = _show(context)
+    _approve(context, token, query)
+
+    stored = {u["telegram_id"]: u for u in asyncio.run(db.read(USERS_FILE))}
+    approved = [uid for uid, u in stored.items() if u["status"] == "active"]
+    assert sorted(approved) == list(range(2000, 2010))
+    assert all(len(stored[uid]["password"]) == 5 for uid in approved)
+    assert stored[2010]["status"] == stored[2011]["status"] == "pending"
+
+    # Every approved user gets their own password, except the one who blocked the bot
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [uid for uid in range(2000, 2010) if uid != 2003]
+    for chat_id, text in bot.sent:
+        assert stored[chat_id]["password"] in text
+    summary = query.message.replies[-1]
+    assert "Tasdiqlandi: 10 ta" in summary
+    assert "⚠️ `user3`" in summary
+    # The list is shown again with the two still pending
+    assert "(2 ta)" in query.edits[-1][0]
+    # The cache saw the write too
+    assert asyncio.run(users.get(2000))["status"] == "active"
+
+
+def test_approves_only_the_users_shown_and_still_pending():
+    _seed(3)
+    bot = FakeBot()
+    context = _context(bot)
+    _, token = _show(context)
+    # Meanwhile: a new registration lands on the page, one shown user is blocked, one approved
+    data = asyncio.run(db.read(USERS_FILE))
+    data[0]["status"] = "blocked"
+    data[1].update(status="active", password="11111")
+    data.insert(0, {"telegram_id": 2999, "username": "late", "first_name": "Late", "last_name": "",
+                    "status": "pending"})
+    asyncio.run(db.write(USERS_FILE, data))
+
+    query = _approve(context, token)
+    stored = {u["telegram_id"]: u for u in asyncio.run(db.read(USERS_FILE))}
+    assert stored[2000]["status"] == "blocked"
+    assert stored[2001]["password"] == "11111"
+    assert stored[2002]["status"] == "active"
+    assert stored[2999]["status"] == "pending"
+    assert [chat_id for chat_id, _ in bot.sent] == [2002]
+    assert "2 ta o'tkazib yuborildi" in query.message.replies[-1]
+
+
+def test_token_used_once():
+    _seed(2)
+    bot = FakeBot()
+    context = _context(bot)
+    _, token = _show(context)
+    _approve(context, token)
+    query = _approve(context, token)
+    assert len(bot.sent) == 2
+    assert "eskirgan" in query.message.replies[-1]
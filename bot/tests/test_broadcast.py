@@ -0,0 +1,126 @@
+import asyncio
+from datetime import date, datetime, timedelta
+import pytest
+from telegram.error import Forbidden, RetryAfter
+import broadcast
+from broadcast import Broadcaster, BROADCASTS_FILE, REPORTS_FILE, SESSIONS_FILE, SETTINGS_FILE, USERS_FILE
+from database import db
+
+
+class FakeBot:
+    """Records send_message calls; `errors` maps chat ids to exceptions raised once each."""
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = {chat_id: list(excs) for chat_id, excs in (errors or {}).items()}
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        pending = self.errors.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+        self.sent.append(chat_id)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture(autouse=True)
+def data():
+    asyncio.run(db.write(USERS_FILE, [
+        {"telegram_id": chat_id, "status": "active"} for chat_id in (101, 102, 103)
+    ] + [{"telegram_id": 104, "status": "pending"}]))
+    asyncio.run(db.write(REPORTS_FILE, [{"user_id": 103, "date": "2026-10-19"}]))
+    asyncio.run(db.write(BROADCASTS_FILE, []))
+    asyncio.run(db.write(SESSIONS_FILE, []))
+    asyncio.run(db.write(SETTINGS_FILE, {}))
+
+
+def test_broadcaster_retries_flood_wait_and_records_failures():
+    clock = FakeClock()
+    bot = FakeBot({1: [RetryAfter(timedelta(seconds=3))], 2: [Forbidden("blocked")]})
+    item = asyncio.run(broadcast.create_broadcast("test", "manual", "Salom", [1, 2, 3, 1]))
+    result = asyncio.run(Broadcaster(bot, global_rate=10, per_chat_rate=10, clock=clock, sleep=clock.sleep).run(item))
+    assert sorted(bot.sent) == [1, 3]
+    assert result["sent"] == [1, 3]
+    assert list(result["failed"]) == ["2"]
+    assert result["status"] == "done"
+    # The flood wait paused the whole bot
+    assert clock.now >= 3
+
+
+def test_daily_reminder_is_sent_once_per_date():
+    bot = FakeBot()
+    first = asyncio.run(broadcast.send_report_reminders(bot, "2026-10-19", auto=True))
+    second = asyncio.run(broadcast.send_report_reminders(bot, "2026-10-19", auto=True))
+    assert first["id"] == second["id"] == "auto-report-reminder-2026-10-19"
+    assert sorted(bot.sent) == [101, 102]
+
+
+def test_manual_reminders_always_go_out():
+    bot = FakeBot()
+    asyncio.run(broadcast.send_report_reminders(bot, "2026-10-19", auto=True))
+    first = asyncio.run(broadcast.send_report_reminders(bot, "2026-10-19"))
+    second = asyncio.run(broadcast.send_report_reminders(bot, "2026-10-19"))
+    assert len({first["id"], second["id"], "auto-report-reminder-2026-10-19"}) == 3
+    assert sorted(bot.sent) == [101, 101, 101, 102, 102, 102]
+    assert len(asyncio.run(db.read(BROADCASTS_FILE))) == 3
+
+
+CALENDAR = {
+    "work_start": "09:00",
+    "work_end": "18:00",
+    "days": {"sat": {"work_end": "14:00"}, "sun": None},
+    "holidays": ["2026-10-20"],
+    "shifts": {"102": {"work_start": "22:00", "work_end": "06:00"}}
+}
+
+
+def test_shift_end_follows_the_work_calendar():
+    night = CALENDAR["shifts"]["102"]
+    assert broadcast.shift_end(CALENDAR, None, date(2026, 10, 19)) == datetime(2026, 10, 19, 18, 0)
+    assert broadcast.shift_end(CALENDAR, None, date(2026, 10, 24)) == datetime(2026, 10, 24, 14, 0)
+    assert broadcast.shift_end(CALENDAR, None, date(2026, 10, 25)) is None
+    assert broadcast.shift_end(CALENDAR, None, date(2026, 10, 20)) is None
+    assert broadcast.shift_end(CALENDAR, night, date(2026, 10, 19)) == datetime(2026, 10, 20, 6, 0)
+
+
+def _due(since, now):
+    bot = FakeBot()
+    reminded = asyncio.run(broadcast.send_due_reminders(bot, since, now))
+    return reminded, sorted(bot.sent)
+
+
+def test_reminders_go_out_at_each_shift_end():
+    asyncio.run(db.write(SETTINGS_FILE, CALENDAR))
+    asyncio.run(db.write(SESSIONS_FILE, [
+        {"user_id": 102, "date": "2026-10-19", "status": "online"},
+        {"user_id": 101, "date": "2026-10-19", "status": "online"}
+    ]))
+    # Default hours end: 101 gets both reminders, the night shift of 102 is still running
+    reminded, sent = _due(datetime(2026, 10, 19, 17, 59), datetime(2026, 10, 19, 18, 0))
+    assert reminded == [("2026-10-19", "")]
+    assert sent == [101, 101]
+    # The night shift that started on Monday ends on Tuesday morning, a holiday for everyone else
+    reminded, sent = _due(datetime(2026, 10, 20, 5, 59), datetime(2026, 10, 20, 6, 0))
+    assert reminded == [("2026-10-19", "-102")]
+    assert sent == [102, 102]
+    assert _due(datetime(2026, 10, 20, 17, 59), datetime(2026, 10, 20, 18, 0)) == ([], [])
+    # Saturday ends early, Sunday is off
+    assert _due(datetime(2026, 10, 24, 13, 59), datetime(2026, 10, 24, 14, 0))[0] == [("2026-10-24", "")]
+    assert _due(datetime(2026, 10, 25, 17, 59), datetime(2026, 10, 25, 18, 0))[0] == []
+
+
+def test_next_reminder_time_skips_days_off():
+    asyncio.run(db.write(SETTINGS_FILE, CALENDAR))
+    # After Saturday's end the night shift is next; nothing ends on Sunday evening
+    assert asyncio.run(broadcast.next_reminder_time(datetime(2026, 10, 24, 15, 0))) == datetime(2026, 10, 25, 6, 0)
+    assert asyncio.run(broadcast.next_reminder_time(datetime(2026, 10, 25, 6, 0))) == datetime(2026, 10, 26, 18, 0)
+    assert asyncio.run(broadcast.next_reminder_time(datetime(2026, 10, 19, 18, 0))) == datetime(2026, 10, 20, 6, 0)
@@ -0,0 +1,180 @@
+"""Concurrent update processing with per-chat ordering.
+
+Up to UPDATE_WORKERS updates are handled at once, so a slow handler (e.g. an
+approve callback waiting on send_message) no longer stalls other users.
+Updates from the same chat still run one at a time, in arrival order, so a
+user's live-location edits and commands apply in sequence. Waiting for the
+chat does not take a worker slot.
+
+Queue depth and per-update-type wait/handle times are kept in `stats`
+(admin command /updates).
+"""
+import asyncio
+import inspect
+import time
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Latency samples kept per update type for percentiles
+SAMPLES = 1000
+
+
+def _percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class KindStats:
+    __slots__ = ("count", "total_wait", "max_wait", "total_handle", "max_handle", "handle_samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_handle = 0.0
+        self.max_handle = 0.0
+        self.handle_samples: Deque[float] = deque(maxlen=SAMPLES)
+
+    def as_dict(self) -> Dict:
+        n = self.count or 1
+        return {
+            "count": self.count,
+            "avg_wait_ms": round(self.total_wait / n * 1000, 2),
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_handle_ms": round(self.total_handle / n * 1000, 2),
+            "p95_handle_ms": round(_percentile(self.handle_samples, 0.95) * 1000, 2),
+            "max_handle_ms": round(self.max_handle * 1000, 2)
+        }
+
+
+class UpdateStats:
+    def __init__(self):
+        self.queued = 0
+        self.max_queued = 0
+        self.running = 0
+        self.max_running = 0
+        self.kinds: Dict[str, KindStats] = {}
+
+    def enqueue(self) -> None:
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+
+    def start(self, kind: str, wait: float) -> None:
+        self.queued -= 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        stats = self.kinds.get(kind)
+        if stats is None:
+            stats = self.kinds[kind] = KindStats()
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+
+    def finish(self, kind: str, handle: float) -> None:
+        self.running -= 1
+        stats = self.kinds[kind]
+        stats.count += 1
+        stats.total_handle += handle
+        stats.max_handle = max(stats.max_handle, handle)
+        stats.handle_samples.append(handle)
+
+    def as_dict(self) -> Dict:
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "max_running": self.max_running,
+            "kinds": {kind: s.as_dict() for kind, s in sorted(self.kinds.items())}
+        }
+
+
+def update_kind(update: object) -> str:
+    if isinstance(update, Update):
+        for kind in ("callback_query", "edited_message", "message", "inline_query", "my_chat_member"):
+            if getattr(update, kind, None) is not None:
+                return kind
+        return "other"
+    return type(update).__name__
+
+
+def chat_key(update: object) -> Optional[Hashable]:
+    """Updates with the same key are processed in order; None = no ordering."""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """`workers` updates at a time, one at a time per chat.
+
+    PTB's own semaphore (`max_pending`) bounds how many updates may be waiting
+    or running; `workers` bounds how many handlers actually run.
+    """
+
+    def __init__(self, workers: int, max_pending: int = 1000):
+        super().__init__(max_concurrent_updates=max(workers, max_pending))
+        if workers < 1:
+            raise ValueError("workers must be a positive integer")
+        self.workers = workers
+        self.stats = UpdateStats()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._chats: Dict[Hashable, asyncio.Lock] = {}
+        self._chat_waiters: Dict[Hashable, int] = {}
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self.workers)
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+        self._chat_waiters.clear()
+
+    def _chat_lock(self, key: Hashable) -> asyncio.Lock:
+        lock = self._chats.get(key)
+        if lock is None:
+            lock = self._chats[key] = asyncio.Lock()
+        self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+        return lock
+
+    def _release_chat(self, key: Hashable) -> None:
+        remaining = self._chat_waiters[key] - 1
+        if remaining:
+            self._chat_waiters[key] = remaining
+        else:
+            # Nobody else queued for this chat: drop the lock so the dict stays small
+            del self._chat_waiters[key]
+            del self._chats[key]
+
+    async def _run(self, kind: str, queued_at: float, coroutine: Awaitable[Any]) -> None:
+        async with self._slots:
+            started_at = time.perf_counter()
+            self.stats.start(kind, started_at - queued_at)
+            try:
+                await coroutine
+            finally:
+                self.stats.finish(kind, time.perf_counter() - started_at)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        kind = update_kind(update)
+        key = chat_key(update)
+        queued_at = time.perf_counter()
+        self.stats.enqueue()
+        lock = self._chat_lock(key) if key is not None else None
+        try:
+            if lock is None:
+                await self._run(kind, queued_at, coroutine)
+            else:
+                async with lock:
+                    await self._run(kind, queued_at, coroutine)
+        finally:
+            if lock is not None:
+                self._release_chat(key)
+            if asyncio.iscoroutine(coroutine) and inspect.getcoroutinestate(coroutine) == inspect.CORO_CREATED:
+                # Cancelled while still queued (shutdown): never started, never counted as running
+                self.stats.queued -= 1
+                coroutine.close()